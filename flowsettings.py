@@ -46,6 +46,21 @@ KH_MARKDOWN_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 # chunks output directory
 KH_CHUNKS_OUTPUT_DIR = KH_APP_DATA_DIR / "chunks_cache_dir"
 KH_CHUNKS_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+# format of the exported chunks: "jsonl" or "parquet" (one file per source file),
+# or "markdown" (one file per chunk)
+KH_CHUNKS_OUTPUT_FORMAT = config("KH_CHUNKS_OUTPUT_FORMAT", default="markdown")
+
+# documents parsed from the files, reused when a file is indexed again with the
+# same loader settings, and the maximum size of the cache in bytes.
+# Purge with `kotaemon purge-parse-cache`
+KH_PARSE_CACHE_DIR = str(KH_APP_DATA_DIR / "parse_cache")
+KH_PARSE_CACHE_SIZE = config(
+    "KH_PARSE_CACHE_SIZE", default=2 * 1024 * 1024 * 1024, cast=int
+)
+
+# captions of the figures by content hash, so that figures repeated across the
+# documents (e.g. logos) are captioned once
+KH_VLM_CAPTION_CACHE_DIR = str(KH_APP_DATA_DIR / "caption_cache")
 
 # zip output directory
 KH_ZIP_OUTPUT_DIR = KH_APP_DATA_DIR / "zip_cache_dir"
@@ -83,6 +98,14 @@ KH_FEATURE_USER_MANAGEMENT_PASSWORD = str(
 KH_ENABLE_ALEMBIC = False
 KH_DATABASE = f"sqlite:///{KH_USER_DATA_DIR / 'sql.db'}"
 KH_FILESTORAGE_PATH = str(KH_USER_DATA_DIR / "files")
+# page thumbnails of the PDF files, stored by content hash
+KH_PDF_THUMBNAIL_DIR = str(KH_USER_DATA_DIR / "files" / "thumbnails")
+# thumbnails rendered on first retrieval when PDF_THUMBNAIL_MODE=lazy, and the
+# maximum size of their cache in bytes
+KH_PDF_THUMBNAIL_CACHE_DIR = str(KH_APP_DATA_DIR / "thumbnail_cache")
+KH_PDF_THUMBNAIL_CACHE_SIZE = config(
+    "KH_PDF_THUMBNAIL_CACHE_SIZE", default=512 * 1024 * 1024, cast=int
+)
 KH_WEB_SEARCH_BACKEND = (
     "kotaemon.indices.retrievers.tavily_web_search.WebSearch"
     # "kotaemon.indices.retrievers.jina_web_search.WebSearch"
@@ -105,6 +128,17 @@ KH_LLMS = {}
 KH_EMBEDDINGS = {}
 KH_RERANKINGS = {}
 
+# coalesce concurrent single-query embedding calls into one batched provider request
+KH_EMBEDDINGS_MICRO_BATCH = config(
+    "KH_EMBEDDINGS_MICRO_BATCH", default=False, cast=bool
+)
+KH_EMBEDDINGS_MICRO_BATCH_SIZE = config(
+    "KH_EMBEDDINGS_MICRO_BATCH_SIZE", default=32, cast=int
+)
+KH_EMBEDDINGS_MICRO_BATCH_WAIT_MS = config(
+    "KH_EMBEDDINGS_MICRO_BATCH_WAIT_MS", default=5, cast=float
+)
+
 # populate options from config
 if config("AZURE_OPENAI_API_KEY", default="") and config(
     "AZURE_OPENAI_ENDPOINT", default=""
@@ -366,6 +400,24 @@ if USE_NANO_GRAPHRAG:
 if USE_LIGHTRAG:
     GRAPHRAG_INDEX_TYPES.append("ktem.index.file.graph.LightRAGIndex")
 
+# index several files at once: number of threads indexing files, and number of
+# processes parsing them (0 parses the files in the indexing threads)
+KH_INDEX_FILE_WORKERS = config("KH_INDEX_FILE_WORKERS", default=1, cast=int)
+KH_INDEX_PARSE_WORKERS = config("KH_INDEX_PARSE_WORKERS", default=0, cast=int)
+KH_INDEX_INCREMENTAL_REINDEX = config(
+    "KH_INDEX_INCREMENTAL_REINDEX", default=True, cast=bool
+)
+# how to store uploaded files: "reflink", "hardlink" or "copy"
+KH_FILE_STORAGE_MODE = config("KH_FILE_STORAGE_MODE", default="reflink")
+# background embedding jobs of quick-index mode
+KH_INDEXING_JOB_WORKERS = config("KH_INDEXING_JOB_WORKERS", default=1, cast=int)
+KH_INDEXING_JOB_MAX_ATTEMPTS = config(
+    "KH_INDEXING_JOB_MAX_ATTEMPTS", default=3, cast=int
+)
+KH_INDEXING_JOB_BACKOFF = config("KH_INDEXING_JOB_BACKOFF", default=10.0, cast=float)
+# number of threads to stat and hash the files when syncing a directory
+KH_DIR_SYNC_WORKERS = config("KH_DIR_SYNC_WORKERS", default=8, cast=int)
+
 KH_INDEX_TYPES = [
     "ktem.index.file.FileIndex",
     *GRAPHRAG_INDEX_TYPES,
@@ -1,11 +1,8 @@
 import logging
 import re
 from concurrent.futures import ThreadPoolExecutor
-from functools import partial
 from typing import Any
 
-import tiktoken
-
 from kotaemon.agents.base import BaseAgent
 from kotaemon.agents.io import AgentOutput, AgentType, BaseScratchPad
 from kotaemon.agents.tools import BaseTool
@@ -14,6 +11,7 @@ from kotaemon.base import Document, Node, Param
 from kotaemon.indices.qa.citation import CitationPipeline
 from kotaemon.indices.splitters import TokenSplitter
 from kotaemon.llms import BaseLLM, PromptTemplate
+from kotaemon.tokenizers import get_token_func
 
 from .planner import Planner
 from .solver import Solver
@@ -250,11 +248,7 @@ class RewooAgent(BaseAgent):
                 chunk_size=self.max_context_length,
                 chunk_overlap=0,
                 separator=" ",
-                tokenizer=partial(
-                    tiktoken.encoding_for_model("gpt-3.5-turbo").encode,
-                    allowed_special=set(),
-                    disallowed_special="all",
-                ),
+                tokenizer=get_token_func(),
             )
         )
         if evidence:
@@ -1,7 +1,9 @@
 from __future__ import annotations
 
+from dataclasses import dataclass
 from typing import TYPE_CHECKING, Any, Literal, Optional, TypeVar
 
+import numpy as np
 from langchain.schema.messages import AIMessage as LCAIMessage
 from langchain.schema.messages import HumanMessage as LCHumanMessage
 from langchain.schema.messages import SystemMessage as LCSystemMessage
@@ -95,6 +97,60 @@ class DocumentWithEmbedding(Document):
         super().__init__(*args, **kwargs)
 
 
+@dataclass
+class EmbeddingMatrix:
+    """Embeddings of several documents stored as one contiguous float32 matrix
+
+    Use this instead of a list of `DocumentWithEmbedding` when the embeddings only
+    need to travel from the embedding model to the vector store, to avoid
+    converting every vector to Python lists and copying the documents around.
+
+    Attributes:
+        vectors: matrix of shape (n_documents, n_dimensions), row i is the
+            embedding of the document `ids[i]`
+        ids: ids of the embedded documents
+        texts: texts of the embedded documents, for the vector stores that keep
+            them next to the vectors. None if they are not known
+    """
+
+    vectors: np.ndarray | list[list[float]]
+    ids: list[str]
+    texts: Optional[list[str]] = None
+
+    def __post_init__(self):
+        self.vectors = np.ascontiguousarray(self.vectors, dtype=np.float32)
+        if self.vectors.ndim == 1:
+            # a single vector, or no vector at all
+            n_rows = 1 if self.vectors.size else 0
+            self.vectors = self.vectors.reshape(n_rows, self.vectors.size)
+        if len(self.ids) != len(self.vectors):
+            raise ValueError(
+                f"Got {len(self.vectors)} embeddings but {len(self.ids)} ids"
+            )
+        if self.texts is not None and len(self.texts) != len(self.ids):
+            raise ValueError(f"Got {len(self.ids)} ids but {len(self.texts)} texts")
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def to_lists(self) -> list[list[float]]:
+        """Convert to Python lists, for APIs that do not accept arrays"""
+        return self.vectors.tolist()
+
+    def truncate(self, dimensions: int) -> "EmbeddingMatrix":
+        """Keep the leading dimensions of each vector, renormalized to unit length
+
+        This is meant for Matryoshka embeddings (e.g. OpenAI text-embedding-3),
+        whose prefixes are embeddings of lower dimension.
+        """
+        vectors = self.vectors[:, :dimensions]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return EmbeddingMatrix(
+            vectors=vectors / norms, ids=list(self.ids), texts=self.texts
+        )
+
+
 class BaseMessage(Document):
     def __add__(self, other: Any):
         raise NotImplementedError
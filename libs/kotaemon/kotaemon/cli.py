@@ -162,6 +162,35 @@ def makedoc(module, output, separation_level):
     print(f"Documentation exported to {output}")
 
 
+@main.command()
+@click.option(
+    "--cache-dir",
+    required=False,
+    help="The parse cache directory, KH_PARSE_CACHE_DIR of flowsettings by default",
+)
+def purge_parse_cache(cache_dir):
+    """Remove the documents cached by the file indexing pipelines
+
+    Example:
+
+        \b
+        $ kotaemon purge-parse-cache --cache-dir ktem_app_data/parse_cache
+    """
+    from theflow.settings import settings as flowsettings
+
+    from kotaemon.loaders import ParseCache
+
+    cache_dir = cache_dir or getattr(flowsettings, "KH_PARSE_CACHE_DIR", None)
+    if not cache_dir:
+        raise click.UsageError("No parse cache directory given")
+    if not os.path.isdir(cache_dir):
+        print(f"No parse cache at {cache_dir}")
+        return
+
+    n_entries = ParseCache(cache_dir).purge()
+    print(f"Removed {n_entries} parsed files from {cache_dir}")
+
+
 @main.command()
 @click.option(
     "--template",
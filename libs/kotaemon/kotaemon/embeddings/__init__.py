@@ -1,4 +1,5 @@
 from .base import BaseEmbeddings
+from .batching import MicroBatchEmbeddings
 from .endpoint_based import EndpointEmbeddings
 from .fastembed import FastEmbedEmbeddings
 from .langchain_based import (
@@ -15,6 +16,7 @@ from .voyageai import VoyageAIEmbeddings
 
 __all__ = [
     "BaseEmbeddings",
+    "MicroBatchEmbeddings",
     "EndpointEmbeddings",
     "TeiEndpointEmbeddings",
     "LCOpenAIEmbeddings",
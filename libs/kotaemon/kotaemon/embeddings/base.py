@@ -1,6 +1,11 @@
 from __future__ import annotations
 
-from kotaemon.base import BaseComponent, Document, DocumentWithEmbedding
+from kotaemon.base import (
+    BaseComponent,
+    Document,
+    DocumentWithEmbedding,
+    EmbeddingMatrix,
+)
 
 
 class BaseEmbeddings(BaseComponent):
@@ -19,6 +24,23 @@ class BaseEmbeddings(BaseComponent):
     ) -> list[DocumentWithEmbedding]:
         raise NotImplementedError
 
+    def embed_array(
+        self, text: str | list[str] | Document | list[Document], *args, **kwargs
+    ) -> EmbeddingMatrix:
+        """Embed the input and return the embeddings as one float32 matrix
+
+        The default implementation stacks the output of `run`. Models that receive
+        the embeddings in array or binary form should override this method to skip
+        the intermediate Python lists.
+        """
+        input_ = self.prepare_input(text)
+        output = self.run(input_, *args, **kwargs)
+        return EmbeddingMatrix(
+            vectors=[doc.embedding for doc in output],
+            ids=[doc.doc_id for doc in input_],
+            texts=[doc.text for doc in input_],
+        )
+
     def prepare_input(
         self, text: str | list[str] | Document | list[Document]
     ) -> list[Document]:
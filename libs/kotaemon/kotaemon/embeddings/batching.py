@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+from queue import Empty, Queue
+from typing import Callable
+
+from kotaemon.base import Document, DocumentWithEmbedding, EmbeddingMatrix, Param
+
+from .base import BaseEmbeddings
+
+
+class MicroBatcher:
+    """Collect single items submitted from many threads and process them in batches
+
+    A daemon worker thread waits for the first pending item, then keeps collecting
+    items until either `max_batch_size` items are pending or `max_wait_ms` has
+    elapsed since the first one arrived. The whole batch is then handed to
+    `process_fn` in one call and each result is delivered to its caller's future.
+
+    Args:
+        process_fn: function that takes a list of items and returns a list of
+            results of the same length and order
+        max_batch_size: maximum number of items to send in one call
+        max_wait_ms: maximum time (in milliseconds) to wait for more items after
+            the first item of a batch arrived
+    """
+
+    def __init__(
+        self,
+        process_fn: Callable[[list], list],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+    ):
+        self.process_fn = process_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max_wait_ms
+
+        self._queue: Queue[tuple[object, Future]] = Queue()
+        self._lock = threading.Lock()
+        self._worker: threading.Thread | None = None
+
+    def submit(self, item) -> Future:
+        """Submit an item to be processed in the next batch
+
+        Returns:
+            a future that resolves to the result of this item
+        """
+        future: Future = Future()
+        self._queue.put((item, future))
+        self._ensure_worker()
+        return future
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._loop, daemon=True)
+                self._worker.start()
+
+    def _collect(self) -> list[tuple[object, Future]]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except Empty:
+                break
+
+        # drop the items whose caller is gone (e.g. a cancelled `ainvoke`), the
+        # others can no longer be cancelled
+        return [
+            (item, future)
+            for item, future in batch
+            if future.set_running_or_notify_cancel()
+        ]
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            if not batch:
+                continue
+            items = [item for item, _ in batch]
+            try:
+                results = self.process_fn(items)
+                if len(results) != len(items):
+                    raise ValueError(
+                        f"Expected {len(items)} results from the batched call, "
+                        f"got {len(results)}"
+                    )
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+
+class MicroBatchEmbeddings(BaseEmbeddings):
+    """Coalesce concurrent single-text embedding calls into batched requests
+
+    Many users querying at the same time each send a single-text embedding
+    request. This wrapper collects those requests over a short time window (or
+    until `max_batch_size` is reached), sends one batched request to the wrapped
+    embedding model, and fans the results back out to the waiting callers.
+
+    Multi-text calls and calls with extra keyword arguments are forwarded to the
+    wrapped model directly, since they are already batched.
+
+    Example:
+        ```python
+        from kotaemon.embeddings import MicroBatchEmbeddings, OpenAIEmbeddings
+
+        embedding = MicroBatchEmbeddings(
+            embedding=OpenAIEmbeddings(model="text-embedding-3-small", api_key="..."),
+            max_batch_size=32,
+            max_wait_ms=5,
+        )
+        ```
+    """
+
+    embedding: BaseEmbeddings
+    max_batch_size: int = Param(
+        32, help="Maximum number of queries to send in one batched request"
+    )
+    max_wait_ms: float = Param(
+        5.0,
+        help=(
+            "Maximum time (in milliseconds) to wait for other queries after the "
+            "first query of a batch arrived"
+        ),
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._batcher_lock = threading.Lock()
+        self._batcher: MicroBatcher | None = None
+
+    @property
+    def batcher(self) -> MicroBatcher:
+        with self._batcher_lock:
+            if (
+                self._batcher is None
+                or self._batcher.max_batch_size != self.max_batch_size
+                or self._batcher.max_wait_ms != self.max_wait_ms
+            ):
+                self._batcher = MicroBatcher(
+                    self._embed_batch,
+                    max_batch_size=self.max_batch_size,
+                    max_wait_ms=self.max_wait_ms,
+                )
+            return self._batcher
+
+    def _embed_batch(self, docs: list[Document]) -> list[DocumentWithEmbedding]:
+        return self.get_from_path("embedding").run(docs)
+
+    def invoke(
+        self, text: str | list[str] | Document | list[Document], *args, **kwargs
+    ) -> list[DocumentWithEmbedding]:
+        input_ = self.prepare_input(text)
+        if len(input_) != 1 or args or kwargs:
+            return self.get_from_path("embedding").run(input_, *args, **kwargs)
+
+        return [self.batcher.submit(input_[0]).result()]
+
+    async def ainvoke(
+        self, text: str | list[str] | Document | list[Document], *args, **kwargs
+    ) -> list[DocumentWithEmbedding]:
+        input_ = self.prepare_input(text)
+        if len(input_) != 1 or args or kwargs:
+            return await self.get_from_path("embedding").ainvoke(
+                input_, *args, **kwargs
+            )
+
+        return [await asyncio.wrap_future(self.batcher.submit(input_[0]))]
+
+    def embed_array(
+        self, text: str | list[str] | Document | list[Document], *args, **kwargs
+    ) -> EmbeddingMatrix:
+        input_ = self.prepare_input(text)
+        if len(input_) != 1 or args or kwargs:
+            return self.get_from_path("embedding").embed_array(input_, *args, **kwargs)
+
+        return super().embed_array(input_)
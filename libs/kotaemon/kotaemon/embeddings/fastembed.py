@@ -1,6 +1,8 @@
 from typing import TYPE_CHECKING, Optional
 
-from kotaemon.base import Document, DocumentWithEmbedding, Param
+import numpy as np
+
+from kotaemon.base import Document, DocumentWithEmbedding, EmbeddingMatrix, Param
 
 from .base import BaseEmbeddings
 
@@ -48,23 +50,37 @@ class FastEmbedEmbeddings(BaseEmbeddings):
 
         return TextEmbedding(model_name=self.model_name)
 
-    def invoke(
-        self, text: str | list[str] | Document | list[Document], *args, **kwargs
-    ) -> list[DocumentWithEmbedding]:
-        input_ = self.prepare_input(text)
+    def _embed_vectors(self, input_: list[Document]) -> np.ndarray:
         embeddings = self.client_.embed(
             [_.content for _ in input_],
             batch_size=self.batch_size,
             parallel=self.parallel,
         )
+        return np.stack(list(embeddings))
+
+    def invoke(
+        self, text: str | list[str] | Document | list[Document], *args, **kwargs
+    ) -> list[DocumentWithEmbedding]:
+        input_ = self.prepare_input(text)
+        vectors = self._embed_vectors(input_)
         return [
             DocumentWithEmbedding(
                 content=doc,
-                embedding=list(embedding),
+                embedding=embedding,
             )
-            for doc, embedding in zip(input_, embeddings)
+            for doc, embedding in zip(input_, vectors.tolist())
         ]
 
+    def embed_array(
+        self, text: str | list[str] | Document | list[Document], *args, **kwargs
+    ) -> EmbeddingMatrix:
+        input_ = self.prepare_input(text)
+        return EmbeddingMatrix(
+            vectors=self._embed_vectors(input_),
+            ids=[doc.doc_id for doc in input_],
+            texts=[doc.text for doc in input_],
+        )
+
     async def ainvoke(
         self, text: str | list[str] | Document | list[Document], *args, **kwargs
     ) -> list[DocumentWithEmbedding]:
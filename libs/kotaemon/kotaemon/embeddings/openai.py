@@ -1,9 +1,9 @@
+import base64
 from itertools import islice
 from typing import Optional
 
 import numpy as np
 import openai
-import tiktoken
 from tenacity import (
     retry,
     retry_if_not_exception_type,
@@ -12,11 +12,27 @@ from tenacity import (
 )
 from theflow.utils.modules import import_dotted_string
 
-from kotaemon.base import Param
+from kotaemon.base import EmbeddingMatrix, Param
+from kotaemon.tokenizers import get_encoding
 
 from .base import BaseEmbeddings, Document, DocumentWithEmbedding
 
 
+def decode_embedding(embedding: str | list[float]) -> np.ndarray:
+    """Decode an embedding returned by the API into a float32 array
+
+    Args:
+        embedding: the embedding, either as a list of floats or as the base64
+            string returned when `encoding_format="base64"`
+
+    Returns:
+        1-D float32 array
+    """
+    if isinstance(embedding, str):
+        return np.frombuffer(base64.b64decode(embedding), dtype=np.float32)
+    return np.asarray(embedding, dtype=np.float32)
+
+
 def split_text_by_chunk_size(text: str, chunk_size: int) -> list[list[int]]:
     """Split the text into chunks of a given size
 
@@ -27,7 +43,7 @@ def split_text_by_chunk_size(text: str, chunk_size: int) -> list[list[int]]:
     Returns:
         list of chunks (as tokens)
     """
-    encoding = tiktoken.get_encoding("cl100k_base")
+    encoding = get_encoding("cl100k_base")
     tokens = iter(encoding.encode(text))
     result = []
     while chunk := list(islice(tokens, chunk_size)):
@@ -84,10 +100,11 @@ class BaseOpenAIEmbeddings(BaseEmbeddings):
         """Get the openai response"""
         raise NotImplementedError
 
-    def invoke(
-        self, text: str | list[str] | Document | list[Document], *args, **kwargs
-    ) -> list[DocumentWithEmbedding]:
-        input_doc = self.prepare_input(text)
+    def _embed_vectors(self, input_doc: list[Document], **kwargs) -> np.ndarray:
+        """Embed the documents into a float32 matrix, one row per document"""
+        if not input_doc:
+            return np.empty((0, 0), dtype=np.float32)
+
         client = self.prepare_client(async_version=False)
 
         input_: list[str | list[int]] = []
@@ -101,29 +118,49 @@ class BaseOpenAIEmbeddings(BaseEmbeddings):
                 splitted_indices[idx] = (len(input_), len(input_) + 1)
                 input_.append(text.text)
 
-        resp = self.openai_response(client, input=input_, **kwargs).dict()
-        output_ = list(sorted(resp["data"], key=lambda x: x["index"]))
-
-        output = []
-        for idx, doc in enumerate(input_doc):
-            embs = output_[splitted_indices[idx][0] : splitted_indices[idx][1]]
-            if len(embs) == 1:
-                output.append(
-                    DocumentWithEmbedding(embedding=embs[0]["embedding"], content=doc)
-                )
+        # ask for the raw base64 payload and decode it straight into an array,
+        # rather than letting the client build a list of Python floats
+        kwargs.setdefault("encoding_format", "base64")
+        resp = self.openai_response(client, input=input_, **kwargs)
+        output_ = sorted(resp.data, key=lambda x: x.index)
+        vectors = np.stack([decode_embedding(_.embedding) for _ in output_])
+
+        if len(vectors) == len(input_doc):
+            return vectors
+
+        output = np.empty((len(input_doc), vectors.shape[1]), dtype=np.float32)
+        for idx in range(len(input_doc)):
+            start, end = splitted_indices[idx]
+            if end - start == 1:
+                output[idx] = vectors[start]
                 continue
 
-            chunk_lens = [
-                len(_)
-                for _ in input_[splitted_indices[idx][0] : splitted_indices[idx][1]]
-            ]
-            vs: list[list[float]] = [_["embedding"] for _ in embs]
-            emb = np.average(vs, axis=0, weights=chunk_lens)
-            emb = emb / np.linalg.norm(emb)
-            output.append(DocumentWithEmbedding(embedding=emb.tolist(), content=doc))
+            chunk_lens = [len(_) for _ in input_[start:end]]
+            emb = np.average(vectors[start:end], axis=0, weights=chunk_lens)
+            output[idx] = emb / np.linalg.norm(emb)
 
         return output
 
+    def invoke(
+        self, text: str | list[str] | Document | list[Document], *args, **kwargs
+    ) -> list[DocumentWithEmbedding]:
+        input_doc = self.prepare_input(text)
+        vectors = self._embed_vectors(input_doc, **kwargs)
+        return [
+            DocumentWithEmbedding(embedding=emb, content=doc)
+            for emb, doc in zip(vectors.tolist(), input_doc)
+        ]
+
+    def embed_array(
+        self, text: str | list[str] | Document | list[Document], *args, **kwargs
+    ) -> EmbeddingMatrix:
+        input_doc = self.prepare_input(text)
+        return EmbeddingMatrix(
+            vectors=self._embed_vectors(input_doc, **kwargs),
+            ids=[doc.doc_id for doc in input_doc],
+            texts=[doc.text for doc in input_doc],
+        )
+
     async def ainvoke(
         self, text: str | list[str] | Document | list[Document], *args, **kwargs
     ) -> list[DocumentWithEmbedding]:
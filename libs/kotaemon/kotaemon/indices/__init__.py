@@ -1,3 +1,12 @@
+from .dedup import ChunkDeduplicator, ChunkMatcher, DedupResult
+from .export import ChunkExportWriter
 from .vectorindex import VectorIndexing, VectorRetrieval
 
-__all__ = ["VectorIndexing", "VectorRetrieval"]
+__all__ = [
+    "ChunkDeduplicator",
+    "ChunkExportWriter",
+    "ChunkMatcher",
+    "DedupResult",
+    "VectorIndexing",
+    "VectorRetrieval",
+]
@@ -0,0 +1,273 @@
+from __future__ import annotations
+
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from hashlib import blake2b, sha256
+from typing import Callable, Optional
+
+import numpy as np
+
+from kotaemon.base import BaseComponent, Document, Param
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_WORD_RE = re.compile(r"\w+")
+
+
+def content_hash(text: str) -> str:
+    """Hash the text of a chunk, ignoring differences in whitespace"""
+    return sha256(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+
+class MinHasher:
+    """Compute MinHash signatures of texts to estimate their Jaccard similarity
+
+    Args:
+        num_perm: number of permutations (length of the signature)
+        shingle_size: number of consecutive words in each shingle
+        seed: seed of the random permutations
+    """
+
+    def __init__(self, num_perm: int = 64, shingle_size: int = 5, seed: int = 1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, _MAX_HASH, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, _MAX_HASH, size=num_perm, dtype=np.uint64)
+
+    def shingles(self, text: str) -> set[str]:
+        words = _WORD_RE.findall(text.lower())
+        if len(words) <= self.shingle_size:
+            return {" ".join(words)}
+        return {
+            " ".join(words[idx : idx + self.shingle_size])
+            for idx in range(len(words) - self.shingle_size + 1)
+        }
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = np.array(
+            [
+                int.from_bytes(
+                    blake2b(shingle.encode("utf-8"), digest_size=4).digest(), "little"
+                )
+                for shingle in self.shingles(text)
+            ],
+            dtype=np.uint64,
+        )
+        # (a * x + b) mod p stays below 2^64 since a, x < 2^32 and b < 2^32
+        permuted = (np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME
+        return permuted.min(axis=0)
+
+    @staticmethod
+    def similarity(sig1: np.ndarray, sig2: np.ndarray) -> float:
+        """Estimate the Jaccard similarity of two texts from their signatures"""
+        return float(np.mean(sig1 == sig2))
+
+
+@dataclass
+class DedupResult:
+    """The output of `ChunkDeduplicator`
+
+    Attributes:
+        unique: the chunks to embed and store, in their original order
+        duplicates: map from the id of each duplicate chunk to the id of the chunk
+            holding its vector (either in `unique` or already stored)
+        hashes: map from each content hash not seen before to the id of the chunk
+            holding its vector
+    """
+
+    unique: list[Document] = field(default_factory=list)
+    duplicates: dict[str, str] = field(default_factory=dict)
+    hashes: dict[str, str] = field(default_factory=dict)
+
+
+class ChunkDeduplicator(BaseComponent):
+    """Detect duplicate chunks so that each distinct text is embedded only once
+
+    Exact duplicates are detected by content hash, both within the given chunks
+    and against the hashes of chunks that were stored before (through `lookup`).
+    Near-duplicates (e.g. the same disclaimer with a different date) can be
+    detected within the given chunks with MinHash and locality-sensitive hashing.
+
+    Example:
+        ```python
+        dedup = ChunkDeduplicator(near_duplicate=True, threshold=0.9)
+        result = dedup(chunks, lookup=lambda hashes: {})
+        vector_indexing.add_to_vectorstore(result.unique)
+        ```
+    """
+
+    near_duplicate: bool = Param(
+        False, help="Also detect near-duplicate chunks with MinHash"
+    )
+    threshold: float = Param(
+        0.9, help="Minimum estimated Jaccard similarity of near-duplicates"
+    )
+    num_perm: int = Param(64, help="Number of MinHash permutations")
+    bands: int = Param(16, help="Number of LSH bands, must divide num_perm")
+    shingle_size: int = Param(5, help="Number of words in each MinHash shingle")
+
+    @Param.auto(depends_on=["num_perm", "shingle_size"])
+    def minhasher(self) -> MinHasher:
+        return MinHasher(num_perm=self.num_perm, shingle_size=self.shingle_size)
+
+    def run(
+        self,
+        docs: list[Document],
+        lookup: Optional[Callable[[list[str]], dict[str, str]]] = None,
+    ) -> DedupResult:
+        """Split the chunks into unique chunks and duplicates
+
+        Args:
+            docs: the chunks to deduplicate
+            lookup: function that takes a list of content hashes and returns the
+                id of the already stored chunk for each known hash
+
+        Returns:
+            the unique chunks and the mapping of the duplicates
+        """
+        result = DedupResult()
+        doc_hashes = [content_hash(doc.text) for doc in docs]
+        known = dict(lookup(list(set(doc_hashes)))) if lookup else {}
+
+        candidates: list[Document] = []
+        for doc, hash_ in zip(docs, doc_hashes):
+            if not doc.text.strip():
+                continue
+            elif hash_ in known:
+                result.duplicates[doc.doc_id] = known[hash_]
+            else:
+                known[hash_] = doc.doc_id
+                result.hashes[hash_] = doc.doc_id
+                candidates.append(doc)
+
+        near: dict[str, str] = {}
+        if self.near_duplicate and len(candidates) > 1:
+            near = self._find_near_duplicates(candidates)
+            result.duplicates.update(near)
+            for hash_, doc_id in result.hashes.items():
+                if doc_id in near:
+                    result.hashes[hash_] = near[doc_id]
+
+        unique_ids = {doc.doc_id for doc in candidates if doc.doc_id not in near}
+        result.unique = [
+            doc for doc in docs if doc.doc_id in unique_ids or not doc.text.strip()
+        ]
+        return result
+
+    def _find_near_duplicates(self, docs: list[Document]) -> dict[str, str]:
+        """Map each near-duplicate to the first similar chunk that is kept"""
+        if self.num_perm % self.bands:
+            raise ValueError(
+                f"num_perm ({self.num_perm}) must be divisible by bands ({self.bands})"
+            )
+        rows = self.num_perm // self.bands
+
+        buckets: dict[tuple, list[int]] = defaultdict(list)
+        signatures: list[np.ndarray] = []
+        duplicates: dict[str, str] = {}
+        for idx, doc in enumerate(docs):
+            signature = self.minhasher.signature(doc.text)
+            signatures.append(signature)
+            keys = [
+                (band, signature[band * rows : (band + 1) * rows].tobytes())
+                for band in range(self.bands)
+            ]
+
+            canonical = None
+            for key in keys:
+                for other in buckets.get(key, []):
+                    if (
+                        self.minhasher.similarity(signature, signatures[other])
+                        >= self.threshold
+                    ):
+                        canonical = other
+                        break
+                if canonical is not None:
+                    break
+
+            if canonical is not None:
+                duplicates[doc.doc_id] = docs[canonical].doc_id
+                continue
+
+            for key in keys:
+                buckets[key].append(idx)
+
+        return duplicates
+
+
+def chunk_fingerprint(doc: Document) -> str:
+    """Hash the content of a chunk, including the image of non-text chunks"""
+    return content_hash(
+        "\x00".join(
+            [
+                doc.metadata.get("type", "text"),
+                doc.text,
+                str(
+                    doc.metadata.get("image_origin")
+                    or doc.metadata.get("image_path")
+                    or doc.metadata.get("thumbnail_page", "")
+                ),
+                doc.metadata.get("file_hash", ""),
+            ]
+        )
+    )
+
+
+class ChunkMatcher:
+    """Match the chunks of a new version of a file to the chunks of the old one
+
+    A new chunk matches an old chunk with the same content. When the same content
+    appears several times, the old chunk closest in position is used, so that
+    each old chunk is matched at most once.
+
+    Example:
+        ```python
+        matcher = ChunkMatcher(old_chunks)
+        for position, chunk in enumerate(new_chunks):
+            old_chunk = matcher.match(chunk, position)
+            if old_chunk is not None:
+                chunk.id_ = old_chunk.doc_id  # keep the stored chunk
+        matcher.unmatched  # the old chunks to delete
+        ```
+
+    Args:
+        chunks: the chunks of the old version, in their original order
+    """
+
+    def __init__(self, chunks: list[Document]):
+        self._candidates: dict[str, list[tuple[int, Document]]] = defaultdict(list)
+        for position, chunk in enumerate(chunks):
+            self._candidates[chunk_fingerprint(chunk)].append((position, chunk))
+        self.reused = 0
+
+    def match(self, chunk: Document, position: int) -> Optional[Document]:
+        """Return the old chunk with the same content as `chunk`, if any
+
+        Args:
+            chunk: a chunk of the new version
+            position: the position of the chunk in the new version
+        """
+        candidates = self._candidates.get(chunk_fingerprint(chunk))
+        if not candidates:
+            return None
+
+        idx = min(
+            range(len(candidates)),
+            key=lambda i: abs(candidates[i][0] - position),
+        )
+        _, old_chunk = candidates.pop(idx)
+        self.reused += 1
+        return old_chunk
+
+    @property
+    def unmatched(self) -> list[Document]:
+        """The old chunks that have no counterpart in the new version"""
+        return [
+            chunk
+            for _, chunk in sorted(
+                (item for items in self._candidates.values() for item in items),
+                key=lambda item: item[0],
+            )
+        ]
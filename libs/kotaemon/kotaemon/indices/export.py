@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+import glob
+import json
+import logging
+import threading
+from collections import defaultdict
+from functools import lru_cache
+from pathlib import Path
+from queue import Empty, Queue
+from typing import Any
+
+from kotaemon.base import Document
+
+logger = logging.getLogger(__name__)
+
+CHUNK_EXPORT_FORMATS = ("jsonl", "parquet", "markdown")
+
+
+def chunk_to_markdown(doc: Document) -> str:
+    """Render a chunk as the markdown of the per-chunk export"""
+    markdown_content = ""
+    if "page_label" in doc.metadata:
+        page_label = str(doc.metadata["page_label"])
+        markdown_content += f"Page label: {page_label}"
+    if "file_name" in doc.metadata:
+        filename = doc.metadata["file_name"]
+        markdown_content += f"\nFile name: {filename}"
+    if "section" in doc.metadata:
+        section = doc.metadata["section"]
+        markdown_content += f"\nSection: {section}"
+    if "type" in doc.metadata:
+        if doc.metadata["type"] == "image":
+            image_origin = doc.metadata["image_origin"]
+            image_origin = f'<p><img src="{image_origin}"></p>'
+            markdown_content += f"\nImage origin: {image_origin}"
+    if doc.text:
+        markdown_content += f"\ntext:\n{doc.text}"
+    return markdown_content
+
+
+def chunk_to_record(doc: Document) -> dict[str, Any]:
+    """Convert a chunk to the record of the JSONL and Parquet exports"""
+    return {
+        "id": doc.doc_id,
+        "text": doc.text,
+        "metadata": json.dumps(doc.metadata, ensure_ascii=False, default=str),
+    }
+
+
+class ChunkExportWriter:
+    """Write the chunks of the indexed files to disk from a background thread
+
+    Chunks are grouped by the file they come from, and written as:
+        - "jsonl": one `{file name}.jsonl` file per source file, one line per chunk
+        - "parquet": one `{file name}.parquet` file per source file. Rows are
+            buffered and appended as a row group once the writer is idle for
+            `idle_seconds`. The file stays open until `close_file` or `flush`,
+            and can only be read after that
+        - "markdown": one `{file name}_{index}.md` file per chunk
+
+    The full file name is used, so that e.g. "report.pdf" and "report.docx" are
+    exported to different files.
+
+    `write` only puts the chunks in a queue, so that indexing does not wait for
+    the (possibly slow) filesystem.
+
+    Args:
+        output_dir: the directory of the exported files
+        format: one of "jsonl", "parquet" or "markdown"
+        max_pending: maximum number of batches waiting to be written
+        idle_seconds: idle time before the buffered Parquet rows are written
+    """
+
+    def __init__(
+        self,
+        output_dir: str | Path,
+        format: str = "markdown",
+        max_pending: int = 64,
+        idle_seconds: float = 2.0,
+    ):
+        if format not in CHUNK_EXPORT_FORMATS:
+            raise ValueError(
+                f"Unknown chunk export format {format}, "
+                f"should be one of {CHUNK_EXPORT_FORMATS}"
+            )
+        self.output_dir = Path(output_dir)
+        self.format = format
+        self.idle_seconds = idle_seconds
+
+        self._queue: Queue = Queue(maxsize=max_pending)
+        self._markdown_counts: dict[str, int] = defaultdict(int)
+        self._parquet_rows: dict[str, list[dict]] = defaultdict(list)
+        self._parquet_writers: dict[str, Any] = {}
+        self._thread = threading.Thread(
+            target=self._work, name="chunk-export-writer", daemon=True
+        )
+        self._thread.start()
+
+    def write(self, docs: list[Document]):
+        """Queue the chunks to be written"""
+        docs = [doc for doc in docs if doc.metadata.get("file_name")]
+        if docs:
+            self._queue.put(("write", docs))
+
+    def clear(self, file_name: str):
+        """Remove the exported chunks of a file, e.g. before it is indexed again"""
+        self._queue.put(("clear", file_name))
+
+    def close_file(self, file_name: str):
+        """Finish the export of a file, once all its chunks are written"""
+        self._queue.put(("close", file_name))
+
+    def flush(self):
+        """Wait until all the queued chunks are written, and finish the exports"""
+        self._queue.put(("flush", None))
+        self._queue.join()
+
+    def _work(self):
+        while True:
+            try:
+                op, arg = self._queue.get(timeout=self.idle_seconds)
+            except Empty:
+                self._write_parquet()
+                continue
+
+            try:
+                if op == "write":
+                    self._write(arg)
+                elif op == "clear":
+                    self._clear(arg)
+                elif op == "close":
+                    self._write_parquet(close=[Path(arg).name])
+                elif op == "flush":
+                    self._write_parquet(
+                        close=[*self._parquet_writers, *self._parquet_rows]
+                    )
+            except Exception:
+                logger.exception("Failed to export the chunks")
+            finally:
+                self._queue.task_done()
+
+    def _write(self, docs: list[Document]):
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        by_file: dict[str, list[Document]] = defaultdict(list)
+        for doc in docs:
+            by_file[Path(doc.metadata["file_name"]).name].append(doc)
+
+        for name, file_docs in by_file.items():
+            if self.format == "jsonl":
+                with open(
+                    self.output_dir / f"{name}.jsonl", "a", encoding="utf-8"
+                ) as f:
+                    f.writelines(
+                        json.dumps(chunk_to_record(doc), ensure_ascii=False) + "\n"
+                        for doc in file_docs
+                    )
+            elif self.format == "parquet":
+                self._parquet_rows[name].extend(
+                    chunk_to_record(doc) for doc in file_docs
+                )
+            else:
+                for doc in file_docs:
+                    idx = self._markdown_counts[name]
+                    self._markdown_counts[name] += 1
+                    with open(
+                        self.output_dir / f"{name}_{idx}.md", "w", encoding="utf-8"
+                    ) as f:
+                        f.write(chunk_to_markdown(doc))
+
+    def _clear(self, file_name: str):
+        name = Path(file_name).name
+        self._parquet_rows.pop(name, None)
+        parquet_writer = self._parquet_writers.pop(name, None)
+        if parquet_writer is not None:
+            parquet_writer.close()
+        self._markdown_counts.pop(name, None)
+        if self.format == "markdown":
+            paths = [
+                path
+                for path in self.output_dir.glob(f"{glob.escape(name)}_*.md")
+                if path.stem[len(name) + 1 :].isdigit()
+            ]
+        else:
+            paths = [self.output_dir / f"{name}.{self.format}"]
+        for path in paths:
+            path.unlink(missing_ok=True)
+
+    def _write_parquet(self, close: list[str] | None = None):
+        """Append the buffered rows to the Parquet files, and close the files of
+        `close`"""
+        if not self._parquet_rows and not self._parquet_writers:
+            return
+
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            self._parquet_rows.clear()
+            logger.error("Please install pyarrow to export chunks to Parquet")
+            return
+
+        schema = pa.schema(
+            [("id", pa.string()), ("text", pa.string()), ("metadata", pa.string())]
+        )
+        for name, rows in list(self._parquet_rows.items()):
+            writer = self._parquet_writers.get(name)
+            if writer is None:
+                path = self.output_dir / f"{name}.parquet"
+                # more rows of a file whose export was finished: the file is
+                # written again, once
+                previous = pq.read_table(path, schema=schema) if path.exists() else None
+                writer = self._parquet_writers[name] = pq.ParquetWriter(path, schema)
+                if previous is not None:
+                    writer.write_table(previous)
+            writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+            del self._parquet_rows[name]
+
+        for name in close or []:
+            writer = self._parquet_writers.pop(name, None)
+            if writer is not None:
+                writer.close()
+
+
+@lru_cache
+def get_chunk_writer(output_dir: str, format: str = "markdown") -> ChunkExportWriter:
+    """Get the writer shared by the pipelines exporting to `output_dir`"""
+    return ChunkExportWriter(output_dir, format=format)
@@ -1,3 +1,4 @@
 from .files import DocumentIngestor
+from .staged import StagedPipeline, StageMetrics
 
-__all__ = ["DocumentIngestor"]
+__all__ = ["DocumentIngestor", "StagedPipeline", "StageMetrics"]
@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass
+from queue import Empty, Full, Queue
+from typing import Any, Callable, Iterable, Iterator, Sequence
+
+_DONE = object()
+
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+class _Cancelled(Exception):
+    pass
+
+
+@dataclass
+class StageMetrics:
+    """Throughput of one stage of a `StagedPipeline`
+
+    Attributes:
+        name: name of the stage
+        items_in: number of items received from the previous stage
+        items_out: number of items sent to the next stage
+        count: number of units (e.g. chunks) processed, as reported by the stage
+        busy_seconds: time spent working, excluding the time waiting for input
+            or for room in the next queue
+    """
+
+    name: str
+    items_in: int = 0
+    items_out: int = 0
+    count: int = 0
+    busy_seconds: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Number of units (or output items if no unit is reported) per second"""
+        if not self.busy_seconds:
+            return 0.0
+        return (self.count or self.items_out) / self.busy_seconds
+
+    def __str__(self) -> str:
+        units = f"{self.count} units" if self.count else f"{self.items_out} items"
+        return (
+            f"{self.name}: {units} in {self.busy_seconds:.2f}s "
+            f"({self.throughput:.1f}/s)"
+        )
+
+
+class StagedPipeline:
+    """Run the stages of a pipeline concurrently, connected by bounded queues
+
+    Each stage runs in its own thread and is a function that takes the iterator
+    of items of the previous stage, and yields the items of the next stage. So a
+    stage can transform, filter, or re-batch items. Because the queues between
+    stages are bounded, a fast stage waits for the slower ones, and the number of
+    items in flight (hence the memory) stays bounded.
+
+    Any stage can send an item directly to the output with `report`, e.g. a
+    progress message. If a stage raises, the other stages are stopped and the
+    error is raised to the consumer of `run`.
+
+    Example:
+        ```python
+        def square(numbers):
+            for number in numbers:
+                yield number * number
+
+        pipeline = StagedPipeline([("square", square)], maxsize=2)
+        assert list(pipeline.run(range(4))) == [0, 1, 4, 9]
+        print(pipeline.metrics)
+        ```
+
+    Args:
+        stages: the (name, function) of each stage, in order
+        maxsize: maximum number of items waiting between two stages
+        source_name: name of the stage that iterates over the source items
+    """
+
+    def __init__(
+        self,
+        stages: Sequence[tuple[str, Callable[[Iterator], Iterable]]],
+        maxsize: int = 2,
+        source_name: str = "source",
+    ):
+        self.stages = list(stages)
+        self.maxsize = maxsize
+        self.source_name = source_name
+        self.metrics: list[StageMetrics] = []
+
+        self._output: Queue = Queue()
+        self._stop = threading.Event()
+        self._metrics_by_name: dict[str, StageMetrics] = {}
+
+    def report(self, item: Any):
+        """Send an item directly to the output of the pipeline"""
+        self._output.put(item)
+
+    def add_count(self, name: str, count: int):
+        """Record that the stage `name` processed `count` more units"""
+        self._metrics_by_name[name].count += count
+
+    def _put(self, queue: Queue, item: Any):
+        while True:
+            if self._stop.is_set():
+                raise _Cancelled()
+            try:
+                queue.put(item, timeout=0.1)
+                return
+            except Full:
+                continue
+
+    def _get(self, queue: Queue) -> Any:
+        while True:
+            if self._stop.is_set():
+                raise _Cancelled()
+            try:
+                return queue.get(timeout=0.1)
+            except Empty:
+                continue
+
+    def _run_stage(
+        self,
+        metrics: StageMetrics,
+        items: Iterable | None,
+        fn: Callable[[Iterator], Iterable] | None,
+        queue_in: Queue | None,
+        queue_out: Queue,
+    ):
+        waited = 0.0
+        start = time.perf_counter()
+
+        def inputs() -> Iterator:
+            nonlocal waited
+            assert queue_in is not None
+            while True:
+                wait_start = time.perf_counter()
+                item = self._get(queue_in)
+                waited += time.perf_counter() - wait_start
+                if item is _DONE:
+                    return
+                metrics.items_in += 1
+                yield item
+
+        try:
+            outputs = items if fn is None else fn(inputs())
+            for item in outputs:  # type: ignore[union-attr]
+                wait_start = time.perf_counter()
+                self._put(queue_out, item)
+                waited += time.perf_counter() - wait_start
+                metrics.items_out += 1
+            self._put(queue_out, _DONE)
+        except _Cancelled:
+            pass
+        except BaseException as e:
+            self._stop.set()
+            self._output.put(_Failure(e))
+        finally:
+            metrics.busy_seconds = time.perf_counter() - start - waited
+
+    def run(self, items: Iterable) -> Iterator:
+        """Feed the items to the first stage, and yield the output of the last stage
+
+        The output also contains the items sent with `report`, in the order they
+        were sent.
+        """
+        self._stop.clear()
+        self._output = Queue()
+        self.metrics = [StageMetrics(self.source_name)] + [
+            StageMetrics(name) for name, _ in self.stages
+        ]
+        self._metrics_by_name = {metrics.name: metrics for metrics in self.metrics}
+
+        queues: list[Queue] = [Queue(maxsize=self.maxsize) for _ in self.stages]
+        queues.append(self._output)
+
+        threads = [
+            threading.Thread(
+                target=self._run_stage,
+                args=(self.metrics[0], items, None, None, queues[0]),
+                daemon=True,
+            )
+        ]
+        for idx, (_, fn) in enumerate(self.stages):
+            threads.append(
+                threading.Thread(
+                    target=self._run_stage,
+                    args=(
+                        self.metrics[idx + 1],
+                        None,
+                        fn,
+                        queues[idx],
+                        queues[idx + 1],
+                    ),
+                    daemon=True,
+                )
+            )
+
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                item = self._output.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, _Failure):
+                    raise item.error
+                yield item
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
@@ -1,10 +1,8 @@
 import html
-from functools import partial
-
-import tiktoken
 
 from kotaemon.base import BaseComponent, Document, RetrievedDocument
 from kotaemon.indices.splitters import TokenSplitter
+from kotaemon.tokenizers import count_tokens, get_token_func
 
 EVIDENCE_MODE_TEXT = 0
 EVIDENCE_MODE_TABLE = 1
@@ -25,27 +23,31 @@ class PrepareEvidencePipeline(BaseComponent):
     max_context_length: int = 32000
     trim_func: TokenSplitter | None = None
 
+    def get_trim_func(self, evidence: str) -> TokenSplitter | None:
+        """Get the function to trim the evidence, or None if it already fits
+
+        The default splitter is only built when the evidence is longer than
+        `max_context_length` tokens.
+        """
+        if self.trim_func:
+            return self.trim_func
+
+        if count_tokens(evidence) <= self.max_context_length:
+            return None
+
+        return TokenSplitter(
+            chunk_size=self.max_context_length,
+            chunk_overlap=0,
+            separator=" ",
+            tokenizer=get_token_func(),
+        )
+
     def run(self, docs: list[RetrievedDocument]) -> Document:
         evidence = ""
         images = []
         table_found = 0
         evidence_modes = []
 
-        evidence_trim_func = (
-            self.trim_func
-            if self.trim_func
-            else TokenSplitter(
-                chunk_size=self.max_context_length,
-                chunk_overlap=0,
-                separator=" ",
-                tokenizer=partial(
-                    tiktoken.encoding_for_model("gpt-3.5-turbo").encode,
-                    allowed_special=set(),
-                    disallowed_special="all",
-                ),
-            )
-        )
-
         for _, retrieved_item in enumerate(docs):
             retrieved_content = ""
             page = retrieved_item.metadata.get("page_label", None)
@@ -107,8 +109,10 @@ class PrepareEvidencePipeline(BaseComponent):
         # trim context by trim_len
         print("len (original)", len(evidence))
         if evidence:
-            texts = evidence_trim_func([Document(text=evidence)])
-            evidence = texts[0].text
-            print("len (trimmed)", len(evidence))
+            evidence_trim_func = self.get_trim_func(evidence)
+            if evidence_trim_func is not None:
+                texts = evidence_trim_func([Document(text=evidence)])
+                evidence = texts[0].text
+                print("len (trimmed)", len(evidence))
 
         return Document(content=(evidence_mode, evidence, images))
@@ -2,13 +2,11 @@ from __future__ import annotations
 
 import re
 from concurrent.futures import ThreadPoolExecutor
-from functools import partial
-
-import tiktoken
 
 from kotaemon.base import Document, HumanMessage, SystemMessage
 from kotaemon.indices.splitters import TokenSplitter
 from kotaemon.llms import BaseLLM, PromptTemplate
+from kotaemon.tokenizers import count_document_tokens, get_token_func
 
 from .llm import LLMReranking
 
@@ -103,13 +101,36 @@ class LLMTrulensScoring(LLMReranking):
         chunk_size=MAX_CONTEXT_LEN,
         chunk_overlap=0,
         separator=" ",
-        tokenizer=partial(
-            tiktoken.encoding_for_model("gpt-3.5-turbo").encode,
-            allowed_special=set(),
-            disallowed_special="all",
-        ),
+        tokenizer=get_token_func(),
     )
 
+    def _trimmed_contents(self, documents: list[Document]) -> list[str]:
+        """Get the content of each document, trimmed to the trim_func chunk size
+
+        Token counts are memoized by document id, so only the documents that are
+        actually too long go through the splitter.
+        """
+        max_tokens = getattr(self.get_from_path("trim_func"), "chunk_size", None)
+        if not isinstance(max_tokens, int):
+            token_counts = [None] * len(documents)
+        else:
+            token_counts = count_document_tokens(documents)
+
+        contents = []
+        for doc, n_tokens in zip(documents, token_counts):
+            if n_tokens is not None and n_tokens <= max_tokens:
+                contents.append(doc.get_content())
+            else:
+                contents.append(
+                    self.trim_func(
+                        [
+                            Document(content=doc.get_content())
+                            # skip metadata which cause troubles
+                        ]
+                    )[0].text
+                )
+        return contents
+
     def run(
         self,
         documents: list[Document],
@@ -122,14 +143,7 @@ class LLMTrulensScoring(LLMReranking):
         if self.concurrent:
             with ThreadPoolExecutor() as executor:
                 futures = []
-                for doc in documents:
-                    chunked_doc_content = self.trim_func(
-                        [
-                            Document(content=doc.get_content())
-                            # skip metadata which cause troubles
-                        ]
-                    )[0].text
-
+                for chunked_doc_content in self._trimmed_contents(documents):
                     messages = []
                     messages.append(
                         SystemMessage(self.system_prompt_template.populate())
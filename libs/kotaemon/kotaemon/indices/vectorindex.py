@@ -7,11 +7,12 @@ from typing import Optional, Sequence, cast
 
 from theflow.settings import settings as flowsettings
 
-from kotaemon.base import BaseComponent, Document, RetrievedDocument
+from kotaemon.base import BaseComponent, Document, EmbeddingMatrix, RetrievedDocument
 from kotaemon.embeddings import BaseEmbeddings
 from kotaemon.storages import BaseDocumentStore, BaseVectorStore
 
 from .base import BaseIndexing, BaseRetrieval
+from .export import ChunkExportWriter, get_chunk_writer
 from .rankings import BaseReranking, LLMReranking
 
 VECTOR_STORE_FNAME = "vectorstore"
@@ -28,10 +29,10 @@ class VectorIndexing(BaseIndexing):
     """
 
     cache_dir: Optional[str] = getattr(flowsettings, "KH_CHUNKS_OUTPUT_DIR", None)
+    cache_format: str = getattr(flowsettings, "KH_CHUNKS_OUTPUT_FORMAT", "markdown")
     vector_store: BaseVectorStore
     doc_store: Optional[BaseDocumentStore] = None
     embedding: BaseEmbeddings
-    count_: int = 0
 
     def to_retrieval_pipeline(self, *args, **kwargs):
         """Convert the indexing pipeline to a retrieval pipeline"""
@@ -42,56 +43,64 @@ class VectorIndexing(BaseIndexing):
             **kwargs,
         )
 
-    def write_chunk_to_file(self, docs: list[Document]):
-        # save the chunks content into markdown format
-        if self.cache_dir:
-            file_name = docs[0].metadata.get("file_name")
-            if not file_name:
-                return
+    def get_chunk_writer(self) -> Optional[ChunkExportWriter]:
+        """Get the background writer of the exported chunks, if any"""
+        if not self.cache_dir:
+            return None
+        return get_chunk_writer(str(self.cache_dir), self.cache_format)
 
-            file_name = Path(file_name)
-            for i in range(len(docs)):
-                markdown_content = ""
-                if "page_label" in docs[i].metadata:
-                    page_label = str(docs[i].metadata["page_label"])
-                    markdown_content += f"Page label: {page_label}"
-                if "file_name" in docs[i].metadata:
-                    filename = docs[i].metadata["file_name"]
-                    markdown_content += f"\nFile name: {filename}"
-                if "section" in docs[i].metadata:
-                    section = docs[i].metadata["section"]
-                    markdown_content += f"\nSection: {section}"
-                if "type" in docs[i].metadata:
-                    if docs[i].metadata["type"] == "image":
-                        image_origin = docs[i].metadata["image_origin"]
-                        image_origin = f'<p><img src="{image_origin}"></p>'
-                        markdown_content += f"\nImage origin: {image_origin}"
-                if docs[i].text:
-                    markdown_content += f"\ntext:\n{docs[i].text}"
-
-                with open(
-                    Path(self.cache_dir) / f"{file_name.stem}_{self.count_+i}.md",
-                    "w",
-                    encoding="utf-8",
-                ) as f:
-                    f.write(markdown_content)
+    def write_chunk_to_file(self, docs: list[Document]):
+        # export the chunks content from a background writer, so that the
+        # indexing does not wait for the filesystem
+        writer = self.get_chunk_writer()
+        if writer:
+            writer.write(docs)
+
+    def clear_chunk_files(self, file_name: str):
+        """Remove the exported chunks of a file"""
+        writer = self.get_chunk_writer()
+        if writer:
+            writer.clear(file_name)
+
+    def close_chunk_file(self, file_name: str):
+        """Finish the export of a file, once all its chunks are exported"""
+        writer = self.get_chunk_writer()
+        if writer:
+            writer.close_file(file_name)
+
+    def flush_chunk_files(self):
+        """Wait until the exported chunks are written to disk"""
+        writer = self.get_chunk_writer()
+        if writer:
+            writer.flush()
 
     def add_to_docstore(self, docs: list[Document]):
         if self.doc_store:
             print("Adding documents to doc store")
             self.doc_store.add(docs)
 
-    def add_to_vectorstore(self, docs: list[Document]):
-        # in case we want to skip embedding
+    def embed(self, docs: list[Document]) -> EmbeddingMatrix:
+        """Embed the documents, without storing them"""
+        print(f"Getting embeddings for {len(docs)} nodes")
+        return self.get_from_path("embedding").embed_array(docs)
+
+    def add_embeddings_to_vectorstore(
+        self, docs: list[Document], embeddings: EmbeddingMatrix
+    ):
+        """Store the embeddings of the documents in the vector store"""
         if self.vector_store:
-            print(f"Getting embeddings for {len(docs)} nodes")
-            embeddings = self.embedding(docs)
             print("Adding embeddings to vector store")
             self.vector_store.add(
                 embeddings=embeddings,
+                metadatas=[t.metadata for t in docs],
                 ids=[t.doc_id for t in docs],
             )
 
+    def add_to_vectorstore(self, docs: list[Document]):
+        # in case we want to skip embedding
+        if self.vector_store:
+            self.add_embeddings_to_vectorstore(docs, self.embed(docs))
+
     def run(self, text: str | list[str] | Document | list[Document]):
         input_: list[Document] = []
         if not isinstance(text, list):
@@ -110,7 +119,6 @@ class VectorIndexing(BaseIndexing):
         self.add_to_vectorstore(input_)
         self.add_to_docstore(input_)
         self.write_chunk_to_file(input_)
-        self.count_ += len(input_)
 
 
 class VectorRetrieval(BaseRetrieval):
@@ -123,6 +131,63 @@ class VectorRetrieval(BaseRetrieval):
     top_k: int = 5
     first_round_top_k_mult: int = 10
     retrieval_mode: str = "hybrid"  # vector, text, hybrid
+    # where the indexed files are stored by hash, to render the lazy thumbnails
+    file_storage_path: Optional[str] = None
+    thumbnail_cache_dir: Optional[str] = getattr(
+        flowsettings, "KH_PDF_THUMBNAIL_CACHE_DIR", None
+    )
+    thumbnail_cache_size: int = getattr(
+        flowsettings, "KH_PDF_THUMBNAIL_CACHE_SIZE", 512 * 1024 * 1024
+    )
+
+    def _load_thumbnail(self, doc: Document):
+        """Inline the thumbnail of a page, to display or send it to the LLM
+
+        The thumbnail can be stored as a file, or not be rendered yet (lazy
+        thumbnails), in which case it is rendered in the thumbnail cache.
+        """
+        if "image_origin" in doc.metadata:
+            return
+
+        from kotaemon.loaders.pdf_loader import (
+            convert_image_file_to_base64,
+            get_thumbnail_cache,
+            render_page_thumbnails,
+        )
+
+        image = ""
+        try:
+            if doc.metadata.get("image_path"):
+                image = convert_image_file_to_base64(doc.metadata["image_path"])
+            elif "thumbnail_page" in doc.metadata:
+                pdf_path = self._thumbnail_source(doc)
+                page = doc.metadata["thumbnail_page"]
+                if pdf_path is None:
+                    print(f"Source of the thumbnail of page {page} not found")
+                elif self.thumbnail_cache_dir:
+                    cache = get_thumbnail_cache(
+                        str(self.thumbnail_cache_dir), self.thumbnail_cache_size
+                    )
+                    image = convert_image_file_to_base64(
+                        cache.get(pdf_path, doc.metadata["file_hash"], page)
+                    )
+                else:
+                    image = render_page_thumbnails(pdf_path, [page])[0]
+            else:
+                return
+        except Exception as e:
+            print(f"Failed to load the thumbnail: {e}")
+        doc.metadata["image_origin"] = image
+
+    def _thumbnail_source(self, doc: Document) -> Optional[Path]:
+        """Find the PDF file of a lazy thumbnail"""
+        if self.file_storage_path and doc.metadata.get("file_hash"):
+            stored_path = Path(self.file_storage_path) / doc.metadata["file_hash"]
+            if stored_path.exists():
+                return stored_path
+        if doc.metadata.get("file_path") and Path(doc.metadata["file_path"]).exists():
+            return Path(doc.metadata["file_path"])
+        return None
 
     def _filter_docs(
         self, documents: list[RetrievedDocument], top_k: int | None = None
@@ -259,6 +324,7 @@ class VectorRetrieval(BaseRetrieval):
             if doc.metadata.get("type") == "thumbnail":
                 # change type to image to display on UI
                 doc.metadata["type"] = "image"
+                self._load_thumbnail(doc)
                 raw_thumbnail_docs.append(doc)
                 continue
             if (
@@ -283,6 +349,7 @@ class VectorRetrieval(BaseRetrieval):
         additional_docs = []
 
         for thumbnail_doc in linked_thumbnail_docs:
+            self._load_thumbnail(thumbnail_doc)
             text_doc = text_thumbnail_docs[thumbnail_doc.doc_id]
             doc_dict = thumbnail_doc.to_dict()
             doc_dict["_id"] = text_doc.doc_id
@@ -1,6 +1,7 @@
 from .adobe_loader import AdobeReader
 from .azureai_document_intelligence_loader import AzureAIDocumentIntelligenceLoader
 from .base import AutoReader, BaseReader
+from .cache import ParseCache
 from .composite_loader import DirectoryReader
 from .docling_loader import DoclingReader
 from .docx_loader import DocxReader
@@ -32,4 +33,5 @@ __all__ = [
     "PDFThumbnailReader",
     "WebReader",
     "DoclingReader",
+    "ParseCache",
 ]
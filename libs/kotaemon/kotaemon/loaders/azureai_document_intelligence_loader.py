@@ -9,7 +9,7 @@ from PIL import Image
 from kotaemon.base import Document, Param
 
 from .base import BaseReader
-from .utils.adobe import generate_single_figure_caption
+from .utils.adobe import generate_figure_captions
 
 
 def crop_image(file_path: Path, bbox: list[float], page_number: int = 0) -> Image.Image:
@@ -144,7 +144,7 @@ class AzureAIDocumentIntelligenceLoader(BaseReader):
         removed_spans: list[dict] = []
 
         # extract the figures
-        figures = []
+        figure_metadatas = []
         for figure_desc in result.get("figures", []):
             if not self.vlm_endpoint:
                 continue
@@ -172,12 +172,7 @@ class AzureAIDocumentIntelligenceLoader(BaseReader):
             img_base64 = base64.b64encode(img_bytes.getvalue()).decode("utf-8")
             img_base64 = f"data:image/png;base64,{img_base64}"
 
-            # caption the image
-            caption = generate_single_figure_caption(
-                figure=img_base64, vlm_endpoint=self.vlm_endpoint
-            )
-
-            # store the image into document
+            # store the image into document, captioned below
             figure_metadata = {
                 "image_origin": img_base64,
                 "type": "image",
@@ -185,14 +180,23 @@ class AzureAIDocumentIntelligenceLoader(BaseReader):
             }
             figure_metadata.update(metadata)
 
-            figures.append(
-                Document(
-                    text=caption,
-                    metadata=figure_metadata,
-                )
-            )
+            figure_metadatas.append(figure_metadata)
             removed_spans += figure_desc["spans"]
 
+        # caption the images concurrently
+        captions = generate_figure_captions(
+            self.vlm_endpoint,
+            [figure_metadata["image_origin"] for figure_metadata in figure_metadatas],
+            len(figure_metadatas),
+        )
+        figures = [
+            Document(
+                text=caption,
+                metadata=figure_metadata,
+            )
+            for figure_metadata, caption in zip(figure_metadatas, captions)
+        ]
+
         # extract the tables
         tables = []
         for table_desc in result.get("tables", []):
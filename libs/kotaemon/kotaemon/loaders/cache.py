@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import inspect
+import json
+import logging
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from hashlib import sha256
+from pathlib import Path
+from typing import Any, Optional
+
+from kotaemon.base import BaseComponent, Document
+
+logger = logging.getLogger(__name__)
+
+# fields of a Document that identify it rather than describe its content
+VOLATILE_DOCUMENT_FIELDS = ("id_", "embedding", "relationships")
+
+
+def loader_config(loader: Any) -> dict:
+    """Get the configuration of a loader, which determines its output
+
+    The configuration is made of the arguments of the loader constructor (stored
+    as attributes with the same name, or with a leading underscore) and, for the
+    kotaemon components, of their params.
+    """
+    attrs = vars(loader)
+    config = {}
+    for name in inspect.signature(type(loader).__init__).parameters:
+        for attr in (name, f"_{name}"):
+            if attr in attrs:
+                config[name] = attrs[attr]
+                break
+    if isinstance(loader, BaseComponent):
+        config.update(loader.dump()["params"])
+    return config
+
+
+def loader_cache_key(file_hash: str, loader: Any) -> str:
+    """Key of the output of `loader` on the file with sha256 `file_hash`"""
+    loader_cls = type(loader)
+    description = json.dumps(
+        {
+            "file": file_hash,
+            "loader": f"{loader_cls.__module__}.{loader_cls.__qualname__}",
+            "config": loader_config(loader),
+        },
+        sort_keys=True,
+        default=lambda value: type(value).__qualname__,
+    )
+    return sha256(description.encode()).hexdigest()
+
+
+class ParseCache:
+    """Keep the documents parsed from the files in a size-bounded
+    least-recently-used cache on disk
+
+    The documents are stored without their ids, and without the metadata given by
+    the caller (e.g. the file id), which are applied again when they are loaded
+    from the cache. So the same parsed file can be used under another file id,
+    e.g. after it is reindexed.
+
+    Example:
+        ```python
+        cache = ParseCache("/app/parse_cache")
+        key = loader_cache_key(file_hash, loader)
+        docs = cache.get(key, extra_info)
+        if docs is None:
+            docs = loader.load_data(file_path, extra_info=extra_info)
+            cache.put(key, docs, extra_info)
+        ```
+
+    Args:
+        cache_dir: the directory of the cached documents
+        max_bytes: maximum total size of the cached documents
+    """
+
+    def __init__(self, cache_dir: str | Path, max_bytes: int = 2 * 1024**3):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[Path, int] = OrderedDict()
+        self._size = 0
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        cached = [(path.stat().st_mtime, path) for path in self.cache_dir.glob("*.pkl")]
+        for _, path in sorted(cached):
+            self._entries[path] = path.stat().st_size
+            self._size += self._entries[path]
+
+    @property
+    def size(self) -> int:
+        """Total size of the cached documents, in bytes"""
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.pkl"
+
+    def get(self, key: str, extra_info: Optional[dict] = None) -> list[Document] | None:
+        """Get the cached documents, None if they are not in the cache"""
+        path = self._path(key)
+        with self._lock:
+            if path not in self._entries:
+                return None
+            self._entries.move_to_end(path)
+
+        try:
+            with open(path, "rb") as f:
+                records = pickle.load(f)
+            os.utime(path)
+        except Exception:
+            logger.exception(f"Failed to read the parse cache entry {path}")
+            self._remove(path)
+            return None
+
+        docs = []
+        for record in records:
+            extra_keys = record.pop("extra_keys")
+            doc = Document.from_dict(record)
+            doc.metadata.update(
+                {k: extra_info[k] for k in extra_keys if k in (extra_info or {})}
+            )
+            docs.append(doc)
+        return docs
+
+    def put(self, key: str, docs: list[Document], extra_info: Optional[dict] = None):
+        """Cache the documents parsed with the metadata `extra_info`"""
+        extra_info = extra_info or {}
+        records = []
+        for doc in docs:
+            record = doc.to_dict()
+            for field in VOLATILE_DOCUMENT_FIELDS:
+                record.pop(field, None)
+            record["extra_keys"] = [
+                k
+                for k, v in record["metadata"].items()
+                if k in extra_info and extra_info[k] == v
+            ]
+            record["metadata"] = {
+                k: v
+                for k, v in record["metadata"].items()
+                if k not in record["extra_keys"]
+            }
+            records.append(record)
+
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump(records, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except Exception:
+            # e.g. a loader putting objects that cannot be pickled in the documents
+            logger.exception(f"Failed to write the parse cache entry {path}")
+            tmp_path.unlink(missing_ok=True)
+            return
+
+        with self._lock:
+            size = path.stat().st_size
+            self._size += size - self._entries.pop(path, 0)
+            self._entries[path] = size
+            # evict the least recently used entries, except the new one
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                old_path, old_size = self._entries.popitem(last=False)
+                old_path.unlink(missing_ok=True)
+                self._size -= old_size
+
+    def _remove(self, path: Path):
+        with self._lock:
+            self._size -= self._entries.pop(path, 0)
+        path.unlink(missing_ok=True)
+
+    def purge(self) -> int:
+        """Remove all the cached documents
+
+        Returns:
+            the number of removed entries
+        """
+        with self._lock:
+            # including the entries written by other processes
+            paths = set(self._entries) | set(self.cache_dir.glob("*.pkl"))
+            self._entries.clear()
+            self._size = 0
+        for path in paths:
+            path.unlink(missing_ok=True)
+        return len(paths)
+
+
+@lru_cache
+def get_parse_cache(cache_dir: str, max_bytes: int) -> ParseCache:
+    """Get the parse cache shared by the pipelines using `cache_dir`"""
+    return ParseCache(cache_dir, max_bytes=max_bytes)
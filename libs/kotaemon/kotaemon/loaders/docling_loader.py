@@ -1,14 +1,52 @@
 import base64
+import importlib.util
 from collections import defaultdict
+from functools import lru_cache
 from io import BytesIO
 from pathlib import Path
 from typing import List, Optional
 
+from decouple import config
+
 from kotaemon.base import Document, Param
 
 from .azureai_document_intelligence_loader import crop_image
 from .base import BaseReader
-from .utils.adobe import generate_single_figure_caption, make_markdown_table
+from .utils.adobe import generate_figure_captions, make_markdown_table
+from .utils.worker_pool import WarmProcessPool
+
+# number of worker processes converting the files, 0 to convert in the current
+# process
+DOCLING_WORKERS = config("DOCLING_WORKERS", default=0, cast=int)
+# maximum conversion time of a file in seconds, 0 for no limit
+DOCLING_TIMEOUT = config("DOCLING_TIMEOUT", default=900, cast=int)
+# maximum memory of a worker process in bytes, 0 for no limit
+DOCLING_MEMORY_LIMIT = config(
+    "DOCLING_MEMORY_LIMIT", default=8 * 1024 * 1024 * 1024, cast=int
+)
+
+
+def _load_docling_converter():
+    from docling.document_converter import DocumentConverter
+
+    return DocumentConverter()
+
+
+def _convert_with_docling(converter, file_path: str) -> dict:
+    return converter.convert(file_path).document.export_to_dict()
+
+
+@lru_cache
+def get_docling_pool(workers: int, timeout: int, memory_limit: int) -> WarmProcessPool:
+    """Get the pool of worker processes with a loaded Docling converter"""
+    return WarmProcessPool(
+        _load_docling_converter,
+        _convert_with_docling,
+        workers=workers,
+        timeout=timeout or None,
+        memory_limit=memory_limit or None,
+        name="docling",
+    )
 
 
 class DoclingReader(BaseReader):
@@ -41,6 +79,25 @@ class DoclingReader(BaseReader):
         ),
     )
 
+    workers: int = Param(
+        DOCLING_WORKERS,
+        help=(
+            "Number of worker processes converting the files. The workers load the "
+            "Docling models once, and a file that exceeds the timeout or the memory "
+            "limit only kills its worker. 0 to convert in the current process."
+        ),
+    )
+
+    timeout: int = Param(
+        DOCLING_TIMEOUT,
+        help="Maximum conversion time of a file in the workers, 0 for no limit",
+    )
+
+    memory_limit: int = Param(
+        DOCLING_MEMORY_LIMIT,
+        help="Maximum memory of a worker process in bytes, 0 for no limit",
+    )
+
     @Param.auto(cache=True)
     def converter_(self):
         try:
@@ -62,15 +119,21 @@ class DoclingReader(BaseReader):
 
         metadata = extra_info or {}
 
-        result = self.converter_.convert(file_path)
-        result_dict = result.document.export_to_dict()
+        if self.workers > 0:
+            if importlib.util.find_spec("docling") is None:
+                raise ImportError("Please install docling: 'pip install docling'")
+            pool = get_docling_pool(self.workers, self.timeout, self.memory_limit)
+            result_dict = pool.run(str(file_path))
+        else:
+            result = self.converter_.convert(file_path)
+            result_dict = result.document.export_to_dict()
 
         file_path = Path(file_path)
         file_name = file_path.name
 
         # extract the figures
-        figures = []
-        gen_caption_count = 0
+        figure_metadatas = []
+        extractive_figure_captions = []
         for figure_obj in result_dict.get("pictures", []):
             if not self.vlm_endpoint:
                 continue
@@ -118,19 +181,7 @@ class DoclingReader(BaseReader):
             img_base64 = base64.b64encode(img_bytes.getvalue()).decode("utf-8")
             img_base64 = f"data:image/png;base64,{img_base64}"
 
-            # generate the generative caption
-            if gen_caption_count >= self.max_figure_to_caption:
-                gen_caption = ""
-            else:
-                gen_caption_count += 1
-                gen_caption = generate_single_figure_caption(
-                    figure=img_base64, vlm_endpoint=self.vlm_endpoint
-                )
-
-            # join the extractive and generative captions
-            caption = "\n".join(extractive_captions + [gen_caption])
-
-            # store the image into document
+            # store the image into document, captioned below
             figure_metadata = {
                 "image_origin": img_base64,
                 "type": "image",
@@ -140,6 +191,22 @@ class DoclingReader(BaseReader):
             }
             figure_metadata.update(metadata)
 
+            figure_metadatas.append(figure_metadata)
+            extractive_figure_captions.append(extractive_captions)
+
+        # generate the generative captions concurrently
+        gen_captions = generate_figure_captions(
+            self.vlm_endpoint,
+            [figure_metadata["image_origin"] for figure_metadata in figure_metadatas],
+            self.max_figure_to_caption,
+        )
+
+        figures = []
+        for figure_metadata, extractive_captions, gen_caption in zip(
+            figure_metadatas, extractive_figure_captions, gen_captions
+        ):
+            # join the extractive and generative captions
+            caption = "\n".join(extractive_captions + [gen_caption])
             figures.append(
                 Document(
                     text=caption,
@@ -4,12 +4,20 @@ Pandas parser for .xlsx files.
 
 """
 from pathlib import Path
-from typing import Any, List, Optional, Union
+from typing import Any, Iterator, List, Optional, Union
 
+from decouple import config
 from llama_index.core.readers.base import BaseReader
 
 from kotaemon.base import Document
 
+# read the workbooks row by row, and split the sheets in blocks of rows
+EXCEL_READER_STREAMING = config("EXCEL_READER_STREAMING", default=False, cast=bool)
+# maximum number of tokens of a block of rows, including the header
+EXCEL_READER_BLOCK_TOKENS = config("EXCEL_READER_BLOCK_TOKENS", default=512, cast=int)
+# number of rows whose tokens are counted at once
+_TOKEN_COUNT_BATCH = 1024
+
 
 class PandasExcelReader(BaseReader):
     r"""Pandas-based CSV parser.
@@ -23,6 +31,11 @@ class PandasExcelReader(BaseReader):
             Refer to https://pandas.pydata.org/docs/reference/api/pandas.read_excel.html
             for more information. Set to empty dict by default,
             this means defaults will be used.
+        streaming (bool): Read .xlsx files row by row with openpyxl, and output
+            one Document per block of rows of at most `block_tokens` tokens,
+            instead of one Document for the whole workbook. Each block repeats the
+            header row of its sheet.
+        block_tokens (int): Maximum number of tokens of a block of rows.
 
     """
 
@@ -32,6 +45,8 @@ class PandasExcelReader(BaseReader):
         pandas_config: Optional[dict] = None,
         row_joiner: str = "\n",
         col_joiner: str = " ",
+        streaming: bool = EXCEL_READER_STREAMING,
+        block_tokens: int = EXCEL_READER_BLOCK_TOKENS,
         **kwargs: Any,
     ) -> None:
         """Init params."""
@@ -39,6 +54,115 @@ class PandasExcelReader(BaseReader):
         self._pandas_config = pandas_config or {}
         self._row_joiner = row_joiner if row_joiner else "\n"
         self._col_joiner = col_joiner if col_joiner else " "
+        self._streaming = streaming
+        self._block_tokens = block_tokens
+
+    def _format_row(self, row: tuple) -> Optional[str]:
+        """Join the cells of a row, None if the row is empty"""
+        cells = ["" if value is None else str(value) for value in row]
+        if not any(cell.strip() for cell in cells):
+            return None
+        return self._col_joiner.join(cells)
+
+    def iter_row_blocks(
+        self,
+        file: Path,
+        include_sheetname: bool = False,
+        sheet_name: Optional[Union[str, int, list]] = None,
+        extra_info: Optional[dict] = None,
+    ) -> Iterator[Document]:
+        """Read the workbook row by row, and yield blocks of rows
+
+        Only one block of rows is in memory at a time. Each block starts with the
+        header (first non-empty row) of its sheet, and is at most `block_tokens`
+        tokens long, unless a single row is longer.
+
+        Yields:
+            a Document per block, with the sheet name and the (1-based, inclusive)
+            range of rows of the block in its metadata
+        """
+        try:
+            import openpyxl
+        except ImportError:
+            raise ImportError(
+                "install openpyxl using `pip3 install openpyxl` to use this loader"
+            )
+
+        from kotaemon.tokenizers import count_tokens, count_tokens_batch
+
+        file = Path(file)
+        if sheet_name is not None and not isinstance(sheet_name, list):
+            sheet_name = [sheet_name]
+
+        workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+        try:
+            for sheet_idx, worksheet in enumerate(workbook.worksheets):
+                if sheet_name is not None and not (
+                    worksheet.title in sheet_name or sheet_idx in sheet_name
+                ):
+                    continue
+
+                prefix = f"{worksheet.title}\n" if include_sheetname else ""
+                header: Optional[str] = None
+                header_tokens = 0
+                block: list[str] = []
+                block_tokens = 0
+                row_start = row_end = 0
+
+                def make_block() -> Document:
+                    return Document(
+                        text=prefix + self._row_joiner.join([header] + block),
+                        metadata={
+                            "page_label": sheet_idx + 1,
+                            "sheet_name": worksheet.title,
+                            "row_start": row_start,
+                            "row_end": row_end,
+                            **(extra_info or {}),
+                        },
+                    )
+
+                rows: list[tuple[int, str]] = []
+                row_iter = enumerate(worksheet.iter_rows(values_only=True), start=1)
+                while True:
+                    # count the tokens of a batch of rows at once
+                    rows.clear()
+                    for row_number, row in row_iter:
+                        text = self._format_row(row)
+                        if text is None:
+                            continue
+                        if header is None:
+                            header = text
+                            row_start = row_end = row_number
+                            header_tokens = count_tokens(prefix + header)
+                            continue
+                        rows.append((row_number, text))
+                        if len(rows) >= _TOKEN_COUNT_BATCH:
+                            break
+                    if not rows:
+                        break
+
+                    counts = count_tokens_batch([text for _, text in rows])
+                    for (row_number, text), n_tokens in zip(rows, counts):
+                        if (
+                            block
+                            and header_tokens + block_tokens + n_tokens
+                            > self._block_tokens
+                        ):
+                            yield make_block()
+                            block, block_tokens = [], 0
+                        if not block:
+                            row_start = row_number
+                        block.append(text)
+                        block_tokens += n_tokens
+                        row_end = row_number
+
+                if block:
+                    yield make_block()
+                elif header is not None:
+                    # a sheet with only a header row
+                    yield make_block()
+        finally:
+            workbook.close()
 
     def load_data(
         self,
@@ -62,6 +186,11 @@ class PandasExcelReader(BaseReader):
         """
         import itertools
 
+        if self._streaming and Path(file).suffix.lower() in (".xlsx", ".xlsm"):
+            return list(
+                self.iter_row_blocks(file, include_sheetname, sheet_name, extra_info)
+            )
+
         try:
             import pandas as pd
         except ImportError:
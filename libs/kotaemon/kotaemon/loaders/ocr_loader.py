@@ -1,11 +1,15 @@
 import logging
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Optional
+from typing import Iterator, List, Optional
 from uuid import uuid4
 
 import requests
+from decouple import config
 from llama_index.core.readers.base import BaseReader
+from requests.adapters import HTTPAdapter
 from tenacity import after_log, retry, stop_after_attempt, wait_exponential
 
 from kotaemon.base import Document
@@ -17,6 +21,17 @@ logger = logging.getLogger(__name__)
 
 DEFAULT_OCR_ENDPOINT = "http://127.0.0.1:8000/v2/ai/infer/"
 
+# send the pages to the OCR endpoint one by one, instead of the whole file
+OCR_READER_PAGE_SPLIT = config("OCR_READER_PAGE_SPLIT", default=False, cast=bool)
+# number of pages processed by the OCR endpoint at the same time
+OCR_READER_WORKERS = config("OCR_READER_WORKERS", default=4, cast=int)
+# number of attempts for each page
+OCR_READER_PAGE_RETRIES = config("OCR_READER_PAGE_RETRIES", default=3, cast=int)
+# timeout of the OCR request of a page, in seconds
+OCR_READER_PAGE_TIMEOUT = config("OCR_READER_PAGE_TIMEOUT", default=300, cast=int)
+# resolution of the pages rendered for OCR
+OCR_READER_DPI = config("OCR_READER_DPI", default=200, cast=int)
+
 
 @retry(
     stop=stop_after_attempt(6),
@@ -32,6 +47,117 @@ def tenacious_api_post(url, file_path, table_only, **kwargs):
     return resp
 
 
+def render_ocr_pages(file_path: Path, dpi: int) -> Iterator[tuple[str, bytes]]:
+    """Render the pages of a PDF or multi-page image to PNG, one at a time
+
+    A single image is not rendered, its content is used as is.
+
+    Yields:
+        the file name and the content of each page
+    """
+    if file_path.suffix.lower() != ".pdf":
+        try:
+            from PIL import Image
+        except ImportError:
+            raise ImportError("Please install Pillow: `pip install Pillow`")
+        with Image.open(file_path) as image:
+            n_frames = getattr(image, "n_frames", 1)
+        if n_frames <= 1:
+            yield file_path.name, file_path.read_bytes()
+            return
+
+    try:
+        import fitz
+    except ImportError:
+        raise ImportError("Please install PyMuPDF: `pip install PyMuPDF`")
+
+    with fitz.open(file_path) as doc:
+        for page_idx, page in enumerate(doc):
+            yield f"page_{page_idx}.png", page.get_pixmap(dpi=dpi).tobytes("png")
+
+
+def ocr_pages(
+    url: str,
+    file_path: Path,
+    table_only: bool,
+    workers: int = OCR_READER_WORKERS,
+    retries: int = OCR_READER_PAGE_RETRIES,
+    timeout: float = OCR_READER_PAGE_TIMEOUT,
+    dpi: int = OCR_READER_DPI,
+) -> list[dict]:
+    """OCR a file page by page, with up to `workers` pages sent at the same time
+
+    The pages are rendered while the previous ones are processed, and at most
+    `2 * workers` rendered pages wait in memory. Each page is retried on its own,
+    and once a page has failed no more pages are rendered or sent.
+
+    Returns:
+        the OCR result of each page, in the format of the FullOCR endpoint
+
+    Raises:
+        RuntimeError: a page still failed after `retries` attempts
+    """
+    workers = max(1, workers)
+    pending = threading.Semaphore(2 * workers)
+    failed = threading.Event()
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_maxsize=workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    @retry(
+        stop=stop_after_attempt(retries),
+        wait=wait_exponential(multiplier=1, min=1, max=30),
+        after=after_log(logger, logging.WARNING),
+        reraise=True,
+    )
+    def post_page(file_name: str, content: bytes) -> dict:
+        resp = session.post(
+            url=url,
+            files={"input": (file_name, content)},
+            data={"job_id": uuid4(), "table_only": table_only},
+            timeout=timeout,
+        )
+        resp.raise_for_status()
+        return resp.json()["result"][0]
+
+    def ocr_page(file_name: str, content: bytes) -> Optional[dict]:
+        try:
+            if failed.is_set():
+                # the file fails as a whole: skip the pages already submitted
+                return None
+            return post_page(file_name, content)
+        except Exception as e:
+            failed.set()
+            raise RuntimeError(
+                f"OCR failed for {file_name} of {file_path} after {retries} attempts"
+            ) from e
+        finally:
+            pending.release()
+
+    with session, ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        pages = render_ocr_pages(file_path, dpi)
+        try:
+            for page in pages:
+                pending.acquire()
+                if failed.is_set():
+                    pending.release()
+                    break
+                futures.append(pool.submit(ocr_page, *page))
+        finally:
+            pages.close()
+
+        try:
+            results = [future.result() for future in futures]
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
+
+    return results
+
+
 class OCRReader(BaseReader):
     """Read PDF using OCR, with high focus on table extraction
 
@@ -49,15 +175,32 @@ class OCRReader(BaseReader):
             (http://127.0.0.1:8000/v2/ai/infer/)
         use_ocr: whether to use OCR to read text (e.g: from images, tables) in the PDF
             If False, only the table and text within table cells will be extracted.
+        page_split: render the pages locally and send them to the OCR endpoint
+            concurrently, instead of sending the whole PDF in one request
+        workers: number of pages sent to the OCR endpoint at the same time
+        page_retries: number of attempts for each page
+        page_timeout: timeout of the OCR request of a page, in seconds
     """
 
-    def __init__(self, endpoint: Optional[str] = None, use_ocr=True):
+    def __init__(
+        self,
+        endpoint: Optional[str] = None,
+        use_ocr=True,
+        page_split: bool = OCR_READER_PAGE_SPLIT,
+        workers: int = OCR_READER_WORKERS,
+        page_retries: int = OCR_READER_PAGE_RETRIES,
+        page_timeout: float = OCR_READER_PAGE_TIMEOUT,
+    ):
         """Init the OCR reader with OCR endpoint (FullOCR pipeline)"""
         super().__init__()
         self.ocr_endpoint = endpoint or os.getenv(
             "OCR_READER_ENDPOINT", DEFAULT_OCR_ENDPOINT
         )
         self.use_ocr = use_ocr
+        self.page_split = page_split
+        self.workers = workers
+        self.page_retries = page_retries
+        self.page_timeout = page_timeout
 
     def load_data(
         self, file_path: Path, extra_info: Optional[dict] = None, **kwargs
@@ -78,6 +221,15 @@ class OCRReader(BaseReader):
         if "response_content" in kwargs:
             # overriding response content if specified
             ocr_results = kwargs["response_content"]
+        elif self.page_split:
+            ocr_results = ocr_pages(
+                self.ocr_endpoint,
+                file_path,
+                table_only=not self.use_ocr,
+                workers=self.workers,
+                retries=self.page_retries,
+                timeout=self.page_timeout,
+            )
         else:
             # call original API
             resp = tenacious_api_post(
@@ -145,14 +297,30 @@ class ImageReader(BaseReader):
             (http://127.0.0.1:8000/v2/ai/infer/)
         use_ocr: whether to use OCR to read text (e.g: from images, tables) in the PDF
             If False, only the table and text within table cells will be extracted.
+        page_split: send the pages of multi-page files (PDF, TIFF) to the OCR
+            endpoint concurrently, instead of the whole file in one request
+        workers: number of pages sent to the OCR endpoint at the same time
+        page_retries: number of attempts for each page
+        page_timeout: timeout of the OCR request of a page, in seconds
     """
 
-    def __init__(self, endpoint: Optional[str] = None):
+    def __init__(
+        self,
+        endpoint: Optional[str] = None,
+        page_split: bool = OCR_READER_PAGE_SPLIT,
+        workers: int = OCR_READER_WORKERS,
+        page_retries: int = OCR_READER_PAGE_RETRIES,
+        page_timeout: float = OCR_READER_PAGE_TIMEOUT,
+    ):
         """Init the OCR reader with OCR endpoint (FullOCR pipeline)"""
         super().__init__()
         self.ocr_endpoint = endpoint or os.getenv(
             "OCR_READER_ENDPOINT", DEFAULT_OCR_ENDPOINT
         )
+        self.page_split = page_split
+        self.workers = workers
+        self.page_retries = page_retries
+        self.page_timeout = page_timeout
 
     def load_data(
         self, file_path: Path, extra_info: Optional[dict] = None, **kwargs
@@ -173,6 +341,15 @@ class ImageReader(BaseReader):
         if "response_content" in kwargs:
             # overriding response content if specified
             ocr_results = kwargs["response_content"]
+        elif self.page_split:
+            ocr_results = ocr_pages(
+                self.ocr_endpoint,
+                file_path,
+                table_only=False,
+                workers=self.workers,
+                retries=self.page_retries,
+                timeout=self.page_timeout,
+            )
         else:
             # call original API
             resp = tenacious_api_post(
@@ -1,69 +1,515 @@
 import base64
+import hashlib
+import math
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from functools import lru_cache
 from io import BytesIO
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional
 
 from decouple import config
 from fsspec import AbstractFileSystem
 from llama_index.readers.file import PDFReader
 from PIL import Image
+from theflow.settings import settings as flowsettings
 
 from kotaemon.base import Document
 
 PDF_LOADER_DPI = config("PDF_LOADER_DPI", default=40, cast=int)
+# encoding of the page thumbnails: "png", "jpeg" or "webp"
+PDF_THUMBNAIL_FORMAT = config("PDF_THUMBNAIL_FORMAT", default="jpeg")
+PDF_THUMBNAIL_QUALITY = config("PDF_THUMBNAIL_QUALITY", default=75, cast=int)
+# number of processes rendering the thumbnails of a file
+PDF_THUMBNAIL_WORKERS = config("PDF_THUMBNAIL_WORKERS", default=4, cast=int)
+# minimum number of pages rendered by each process
+PDF_THUMBNAIL_PAGES_PER_WORKER = 16
+# number of processes extracting the text of a file, 0 to extract it with pypdf in
+# the current process
+PDF_TEXT_WORKERS = config("PDF_TEXT_WORKERS", default=0, cast=int)
+# minimum number of pages extracted by each process
+PDF_TEXT_PAGES_PER_WORKER = 8
+# "eager" renders the thumbnails when the file is loaded, "lazy" only records the
+# pages, which are rendered when they are first retrieved
+PDF_THUMBNAIL_MODE = config("PDF_THUMBNAIL_MODE", default="eager")
+
+IMAGE_MIME_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+
+# default thumbnail directory of `PDFThumbnailReader`: the KH_PDF_THUMBNAIL_DIR
+# setting
+THUMBNAIL_DIR_FROM_SETTINGS: Any = object()
+
+
+def encode_image(
+    img: Image.Image, image_format: str = "png", quality: int = PDF_THUMBNAIL_QUALITY
+) -> bytes:
+    """Encode the image as PNG, JPEG or WebP"""
+    image_format = image_format.lower()
+    if image_format not in IMAGE_MIME_TYPES:
+        raise ValueError(
+            f"Unsupported image format {image_format}, "
+            f"should be one of {list(IMAGE_MIME_TYPES)}"
+        )
+
+    img_bytes = BytesIO()
+    if image_format == "png":
+        img.save(img_bytes, format="PNG")
+    else:
+        img.save(img_bytes, format=image_format.upper(), quality=quality)
+    return img_bytes.getvalue()
+
+
+def convert_image_to_base64(
+    img: Image.Image, image_format: str = "png", quality: int = PDF_THUMBNAIL_QUALITY
+) -> str:
+    # convert the image into base64
+    img_base64 = base64.b64encode(encode_image(img, image_format, quality)).decode(
+        "utf-8"
+    )
+    return f"data:{IMAGE_MIME_TYPES[image_format.lower()]};base64,{img_base64}"
+
+
+def convert_image_file_to_base64(image_path: str | Path) -> str:
+    """Read an image file written by `render_page_thumbnails` as a data URL"""
+    image_path = Path(image_path)
+    mime_type = IMAGE_MIME_TYPES.get(image_path.suffix.lstrip(".").lower(), "image/png")
+    img_base64 = base64.b64encode(image_path.read_bytes()).decode("utf-8")
+    return f"data:{mime_type};base64,{img_base64}"
+
+
+def render_page_thumbnails(
+    file_path: Path,
+    pages: list[int],
+    dpi: int = PDF_LOADER_DPI,
+    image_format: str = "png",
+    quality: int = PDF_THUMBNAIL_QUALITY,
+    output_dir: Optional[str | Path] = None,
+) -> List[str]:
+    """Render the thumbnails of the pages in the current process
+
+    Args:
+        file_path: path to the PDF file
+        pages: the (0-based) page numbers to render
+        dpi: resolution of the thumbnails
+        image_format: "png", "jpeg" or "webp"
+        quality: JPEG or WebP quality, from 0 to 100
+        output_dir: if given, write the thumbnails to this directory. Thumbnails
+            already in the directory are not rendered again
+
+    Returns:
+        the data URL of each thumbnail, or its path if `output_dir` is given
+    """
+    try:
+        import fitz
+    except ImportError:
+        raise ImportError("Please install PyMuPDF: 'pip install PyMuPDF'")
+
+    doc = fitz.open(file_path)
+    outputs = []
+    try:
+        for page_number in pages:
+            if output_dir is not None:
+                thumbnail_path = (
+                    Path(output_dir) / f"{page_number}_{dpi}.{image_format.lower()}"
+                )
+                if thumbnail_path.exists():
+                    outputs.append(str(thumbnail_path))
+                    continue
+
+            page = doc.load_page(page_number)
+            pm = page.get_pixmap(dpi=dpi)
+            img = Image.frombytes("RGB", [pm.width, pm.height], pm.samples)
+
+            if output_dir is None:
+                outputs.append(convert_image_to_base64(img, image_format, quality))
+                continue
+
+            # write then rename, so that a partial file is never picked up
+            tmp_path = thumbnail_path.with_name(
+                f".{thumbnail_path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+            )
+            tmp_path.write_bytes(encode_image(img, image_format, quality))
+            os.replace(tmp_path, thumbnail_path)
+            outputs.append(str(thumbnail_path))
+    finally:
+        doc.close()
+
+    return outputs
+
+
+def split_page_ranges(
+    pages: list[int], workers: int, min_pages: Optional[int] = None
+) -> list[list[int]]:
+    """Split the pages into contiguous ranges, one per worker, of at least
+    `min_pages` pages (`PDF_THUMBNAIL_PAGES_PER_WORKER` by default)"""
+    min_pages = min_pages or PDF_THUMBNAIL_PAGES_PER_WORKER
+    n_ranges = min(workers, math.ceil(len(pages) / min_pages))
+    if n_ranges <= 1:
+        return [pages] if pages else []
+    size = math.ceil(len(pages) / n_ranges)
+    return [pages[idx : idx + size] for idx in range(0, len(pages), size)]
+
+
+@lru_cache
+def get_pdf_pool(kind: str, workers: int) -> ProcessPoolExecutor:
+    """Get the pool of `workers` processes shared by the PDF readers for `kind`
+    of work, e.g. "thumbnails"
+
+    The processes are started with "spawn", so they do not inherit the threads and
+    locks of the serving process, and are kept to serve the next files.
+    """
+    return ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    )
+
+
+@contextmanager
+def pdf_pool(kind: str, workers: int) -> Iterator[ProcessPoolExecutor]:
+    """Use the shared pool, which is replaced if one of its processes died"""
+    pool = get_pdf_pool(kind, workers)
+    try:
+        yield pool
+    except BrokenProcessPool:
+        get_pdf_pool.cache_clear()
+        raise
 
 
 def get_page_thumbnails(
-    file_path: Path, pages: list[int], dpi: int = PDF_LOADER_DPI
-) -> List[Image.Image]:
+    file_path: Path,
+    pages: list[int],
+    dpi: int = PDF_LOADER_DPI,
+    image_format: str = "png",
+    quality: int = PDF_THUMBNAIL_QUALITY,
+    output_dir: Optional[str | Path] = None,
+    workers: int = 1,
+) -> List[str]:
     """Get image thumbnails of the pages in the PDF file.
 
     Args:
         file_path (Path): path to the image file
         page_number (list[int]): list of page numbers to extract
+        workers (int): number of processes to render the pages, each rendering a
+            range of pages
 
     Returns:
-        list[Image.Image]: list of page thumbnails
+        list[str]: the data URL of each page thumbnail, or its path if
+            `output_dir` is given
     """
-
-    img: Image.Image
     suffix = file_path.suffix.lower()
     assert suffix == ".pdf", "This function only supports PDF files."
+
+    page_ranges = split_page_ranges(pages, workers)
+    if len(page_ranges) <= 1:
+        return render_page_thumbnails(
+            file_path, pages, dpi, image_format, quality, output_dir
+        )
+
+    with pdf_pool("thumbnails", workers) as pool:
+        futures = [
+            pool.submit(
+                render_page_thumbnails,
+                file_path,
+                page_range,
+                dpi,
+                image_format,
+                quality,
+                output_dir,
+            )
+            for page_range in page_ranges
+        ]
+        return [thumbnail for future in futures for thumbnail in future.result()]
+
+
+def _extract_page_texts_pypdf(
+    file_path: Path, pages: list[int]
+) -> list[tuple[str, str]]:
+    try:
+        import pypdf
+    except ImportError:
+        raise ImportError("pypdf is required to read PDF files: `pip install pypdf`")
+
+    pdf = pypdf.PdfReader(file_path)
+    return [(pdf.page_labels[page], pdf.pages[page].extract_text()) for page in pages]
+
+
+def extract_page_texts(file_path: Path, pages: list[int]) -> list[tuple[str, str]]:
+    """Extract the text of the pages in the current process
+
+    PyMuPDF is used if it is installed, and pypdf otherwise or if PyMuPDF fails.
+
+    Returns:
+        the (page label, text) of each page
+    """
+    try:
+        import fitz
+    except ImportError:
+        return _extract_page_texts_pypdf(file_path, pages)
+
+    try:
+        with fitz.open(file_path) as doc:
+            outputs = []
+            for page_number in pages:
+                page = doc.load_page(page_number)
+                outputs.append(
+                    (page.get_label() or str(page_number + 1), page.get_text())
+                )
+            return outputs
+    except Exception:
+        return _extract_page_texts_pypdf(file_path, pages)
+
+
+def count_pdf_pages(file_path: Path) -> int:
     try:
         import fitz
     except ImportError:
         raise ImportError("Please install PyMuPDF: 'pip install PyMuPDF'")
 
-    doc = fitz.open(file_path)
+    with fitz.open(file_path) as doc:
+        return doc.page_count
 
-    output_imgs = []
-    for page_number in pages:
-        page = doc.load_page(page_number)
-        pm = page.get_pixmap(dpi=dpi)
-        img = Image.frombytes("RGB", [pm.width, pm.height], pm.samples)
-        output_imgs.append(convert_image_to_base64(img))
 
-    return output_imgs
+def hash_pdf_file(file_path: Path) -> str:
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
 
 
-def convert_image_to_base64(img: Image.Image) -> str:
-    # convert the image into base64
-    img_bytes = BytesIO()
-    img.save(img_bytes, format="PNG")
-    img_base64 = base64.b64encode(img_bytes.getvalue()).decode("utf-8")
-    img_base64 = f"data:image/png;base64,{img_base64}"
+class PageThumbnailCache:
+    """Render page thumbnails on first use, and keep them in a size-bounded
+    least-recently-used cache on disk
+
+    The thumbnails are stored as `{cache_dir}/{file hash}/{page}_{dpi}.{ext}`. The
+    modification time of a thumbnail is updated when it is used, so that the
+    least recently used thumbnails are still evicted first after a restart.
+
+    Args:
+        cache_dir: the directory of the cached thumbnails
+        max_bytes: maximum total size of the cached thumbnails
+        dpi: resolution of the thumbnails
+        image_format: "png", "jpeg" or "webp"
+        quality: JPEG or WebP quality, from 0 to 100
+    """
+
+    def __init__(
+        self,
+        cache_dir: str | Path,
+        max_bytes: int = 512 * 1024 * 1024,
+        dpi: int = PDF_LOADER_DPI,
+        image_format: str = PDF_THUMBNAIL_FORMAT,
+        quality: int = PDF_THUMBNAIL_QUALITY,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.dpi = dpi
+        self.image_format = image_format.lower()
+        self.quality = quality
+
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[Path, int] = OrderedDict()
+        self._size = 0
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        cached = [
+            (path.stat().st_mtime, path)
+            for path in self.cache_dir.glob(f"*/*.{self.image_format}")
+        ]
+        for _, path in sorted(cached):
+            self._entries[path] = path.stat().st_size
+            self._size += self._entries[path]
+
+    @property
+    def size(self) -> int:
+        """Total size of the cached thumbnails, in bytes"""
+        return self._size
+
+    def get(self, pdf_path: str | Path, file_hash: str, page: int) -> Path:
+        """Get the path of the thumbnail of the page, rendering it if needed
+
+        Args:
+            pdf_path: path to the PDF file
+            file_hash: sha256 of the PDF file
+            page: the (0-based) page number
+        """
+        path = self.cache_dir / file_hash / f"{page}_{self.dpi}.{self.image_format}"
+        with self._lock:
+            if path in self._entries and path.exists():
+                self._entries.move_to_end(path)
+                os.utime(path)
+                return path
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        render_page_thumbnails(
+            Path(pdf_path),
+            [page],
+            self.dpi,
+            self.image_format,
+            self.quality,
+            output_dir=path.parent,
+        )
+
+        with self._lock:
+            size = path.stat().st_size
+            self._size += size - self._entries.pop(path, 0)
+            self._entries[path] = size
+            # evict the least recently used thumbnails, except the new one
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                old_path, old_size = self._entries.popitem(last=False)
+                old_path.unlink(missing_ok=True)
+                self._size -= old_size
+
+        return path
+
 
-    return img_base64
+@lru_cache
+def get_thumbnail_cache(cache_dir: str, max_bytes: int) -> PageThumbnailCache:
+    """Get the thumbnail cache shared by the retrievers using `cache_dir`"""
+    return PageThumbnailCache(cache_dir, max_bytes=max_bytes)
 
 
 class PDFThumbnailReader(PDFReader):
-    """PDF parser with thumbnail for each page."""
+    """PDF parser with thumbnail for each page.
 
-    def __init__(self) -> None:
+    The thumbnails are rendered by a pool of processes, each rendering a range of
+    pages, while the text is extracted. In "lazy" mode, the thumbnails are not
+    rendered: the thumbnail documents only record the hash of the file and the
+    page, which is rendered when the thumbnail is first retrieved (see
+    `PageThumbnailCache`).
+
+    Args:
+        thumbnail_dir: if set, the thumbnails are written to files in this
+            directory, and the thumbnail documents only keep their path in the
+            "image_path" metadata. If None, they are inlined as base64 data URLs
+            in the "image_origin" metadata. Defaults to the KH_PDF_THUMBNAIL_DIR
+            setting
+        thumbnail_format: "png", "jpeg" or "webp"
+        thumbnail_quality: JPEG or WebP quality, from 0 to 100
+        thumbnail_workers: number of processes rendering the thumbnails
+        dpi: resolution of the thumbnails
+        thumbnail_mode: "eager" or "lazy"
+        text_workers: if positive, the text is extracted with PyMuPDF (pypdf as
+            fallback) by this number of processes, each extracting a range of
+            pages. Otherwise it is extracted with pypdf in the current process
+    """
+
+    def __init__(
+        self,
+        thumbnail_dir: Optional[str] = THUMBNAIL_DIR_FROM_SETTINGS,
+        thumbnail_format: str = PDF_THUMBNAIL_FORMAT,
+        thumbnail_quality: int = PDF_THUMBNAIL_QUALITY,
+        thumbnail_workers: int = PDF_THUMBNAIL_WORKERS,
+        dpi: int = PDF_LOADER_DPI,
+        thumbnail_mode: str = PDF_THUMBNAIL_MODE,
+        text_workers: int = PDF_TEXT_WORKERS,
+    ) -> None:
         """
         Initialize PDFReader.
         """
         super().__init__(return_full_document=False)
+        if thumbnail_dir is THUMBNAIL_DIR_FROM_SETTINGS:
+            thumbnail_dir = getattr(flowsettings, "KH_PDF_THUMBNAIL_DIR", None)
+        self.thumbnail_dir = thumbnail_dir
+        self.thumbnail_format = thumbnail_format.lower()
+        self.thumbnail_quality = thumbnail_quality
+        self.thumbnail_workers = thumbnail_workers
+        self.dpi = dpi
+        self.thumbnail_mode = thumbnail_mode
+        self.text_workers = text_workers
+
+    def _thumbnail_dir(self, file: Path) -> Optional[Path]:
+        if not self.thumbnail_dir:
+            return None
+        # the thumbnails of the same content are shared, e.g. on reindexing
+        output_dir = Path(self.thumbnail_dir) / hash_pdf_file(file)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        return output_dir
+
+    def _load_text(
+        self,
+        file: Path,
+        extra_info: Optional[Dict] = None,
+        fs: Optional[AbstractFileSystem] = None,
+    ) -> List[Document]:
+        """Extract the text of each page, in a pool of processes if enabled"""
+        if self.text_workers <= 0 or fs is not None:
+            return super().load_data(file, extra_info, fs)
+
+        page_ranges = split_page_ranges(
+            list(range(count_pdf_pages(file))),
+            self.text_workers,
+            min_pages=PDF_TEXT_PAGES_PER_WORKER,
+        )
+        if len(page_ranges) <= 1:
+            page_texts = extract_page_texts(file, page_ranges[0] if page_ranges else [])
+        else:
+            with pdf_pool("text", self.text_workers) as pool:
+                # the pages are assembled in order, whatever the order of completion
+                page_texts = [
+                    page_text
+                    for page_range_texts in pool.map(
+                        extract_page_texts, [file] * len(page_ranges), page_ranges
+                    )
+                    for page_text in page_range_texts
+                ]
+
+        return [
+            Document(
+                text=page_text,
+                metadata={
+                    "page_label": page_label,
+                    "file_name": file.name,
+                    **(extra_info if extra_info is not None else {}),
+                },
+            )
+            for page_label, page_text in page_texts
+        ]
+
+    def _load_with_thumbnails(
+        self,
+        file: Path,
+        extra_info: Optional[Dict] = None,
+        fs: Optional[AbstractFileSystem] = None,
+    ) -> tuple[List[Document], list[dict]]:
+        """Extract the text, and render the thumbnails at the same time
+
+        Returns:
+            the documents, and the thumbnail metadata of each page
+        """
+        page_ranges = split_page_ranges(
+            list(range(count_pdf_pages(file))), self.thumbnail_workers
+        )
+        args = (
+            self.dpi,
+            self.thumbnail_format,
+            self.thumbnail_quality,
+            self._thumbnail_dir(file),
+        )
+
+        if len(page_ranges) <= 1:
+            documents = self._load_text(file, extra_info, fs)
+            thumbnails = render_page_thumbnails(
+                file, page_ranges[0] if page_ranges else [], *args
+            )
+        else:
+            with pdf_pool("thumbnails", self.thumbnail_workers) as pool:
+                # render the pages while the text is extracted
+                futures = [
+                    pool.submit(render_page_thumbnails, file, page_range, *args)
+                    for page_range in page_ranges
+                ]
+                documents = self._load_text(file, extra_info, fs)
+                thumbnails = [
+                    thumbnail for future in futures for thumbnail in future.result()
+                ]
+
+        image_key = "image_path" if self.thumbnail_dir else "image_origin"
+        return documents, [{image_key: thumbnail} for thumbnail in thumbnails]
 
     def load_data(
         self,
@@ -72,7 +518,18 @@ class PDFThumbnailReader(PDFReader):
         fs: Optional[AbstractFileSystem] = None,
     ) -> List[Document]:
         """Parse file."""
-        documents = super().load_data(file, extra_info, fs)
+        file = Path(file)
+        if self.thumbnail_mode == "lazy":
+            documents = self._load_text(file, extra_info, fs)
+            file_hash = hash_pdf_file(file)
+            page_thumbnails = [
+                {"file_hash": file_hash, "thumbnail_page": page}
+                for page in range(len(documents))
+            ]
+        else:
+            documents, page_thumbnails = self._load_with_thumbnails(
+                file, extra_info, fs
+            )
 
         page_numbers_str = []
         filtered_docs = []
@@ -91,17 +548,14 @@ class PDFThumbnailReader(PDFReader):
                     continue
 
         documents = filtered_docs
-        page_numbers = list(range(len(page_numbers_str)))
-
-        print("Page numbers:", len(page_numbers))
-        page_thumbnails = get_page_thumbnails(file, page_numbers)
+        print("Page numbers:", len(page_numbers_str))
 
         documents.extend(
             [
                 Document(
                     text="Page thumbnail",
                     metadata={
-                        "image_origin": page_thumbnail,
+                        **page_thumbnail,
                         "type": "thumbnail",
                         "page_label": page_number,
                         **(extra_info if extra_info is not None else {}),
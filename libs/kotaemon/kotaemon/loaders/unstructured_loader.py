@@ -9,16 +9,91 @@ sudo apt-get install -y libmagic-dev poppler-utils libreoffice
 pip install xlrd
 
 """
+import importlib.util
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Optional
 
+from decouple import config
 from llama_index.core.readers.base import BaseReader
 
 from kotaemon.base import Document
 
+from .utils.worker_pool import WarmProcessPool
+
+# number of worker processes partitioning the files, 0 to partition in the current
+# process
+UNSTRUCTURED_WORKERS = config("UNSTRUCTURED_WORKERS", default=0, cast=int)
+# maximum partitioning time of a file in seconds, 0 for no limit
+UNSTRUCTURED_TIMEOUT = config("UNSTRUCTURED_TIMEOUT", default=600, cast=int)
+# number of elements sent back together by a worker, and joined in a document by
+# `lazy_load_data`
+_ELEMENT_BATCH_SIZE = 64
+
+# element metadata that are not kept:
+# - coordinates: it does not serialize and dont want to bother with it
+# - parent_id: it might cause interference
+_SKIPPED_METADATA_FIELDS = {"_known_field_names", "coordinates", "parent_id"}
+
+
+def element_to_dict(element: Any) -> dict:
+    """Get the text and the metadata of an Unstructured element"""
+    metadata = {}
+    if hasattr(element, "metadata"):
+        metadata = {
+            field: val
+            for field, val in vars(element.metadata).items()
+            if field not in _SKIPPED_METADATA_FIELDS
+        }
+    return {"text": element.text, "str": str(element), "metadata": metadata}
+
+
+def _load_partition():
+    from unstructured.partition.auto import partition
+
+    return partition
+
+
+def _batch_elements(elements: Iterable) -> Iterator[list[dict]]:
+    batch = []
+    for element in elements:
+        batch.append(element_to_dict(element))
+        if len(batch) >= _ELEMENT_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _partition_in_batches(partition, file_path: str) -> Iterator[list[dict]]:
+    return _batch_elements(partition(filename=file_path))
+
+
+@lru_cache
+def get_unstructured_pool(workers: int, timeout: int) -> WarmProcessPool:
+    """Get the pool of worker processes partitioning files with Unstructured"""
+    return WarmProcessPool(
+        _load_partition,
+        _partition_in_batches,
+        workers=workers,
+        timeout=timeout or None,
+        name="unstructured",
+    )
+
 
 class UnstructuredReader(BaseReader):
-    """General unstructured text reader for a variety of files."""
+    """General unstructured text reader for a variety of files.
+
+    With `workers` > 0, the files are partitioned locally in a pool of worker
+    processes, so that several files are partitioned in parallel, and a file that
+    takes more than `timeout` seconds only kills its worker. The elements are sent
+    back in batches as they are extracted, and `lazy_load_data` yields their
+    documents as they arrive.
+    """
+
+    # `lazy_load_data` yields the documents while the file is partitioned, so the
+    # indexing pipeline can index them as they come
+    lazy_loading = True
 
     def __init__(self, *args: Any, **kwargs: Any) -> None:
         """Init params."""
@@ -38,6 +113,9 @@ class UnstructuredReader(BaseReader):
         if "api_key" in kwargs:
             self.api_key = kwargs["api_key"]
 
+        self.workers = kwargs.get("workers", UNSTRUCTURED_WORKERS)
+        self.timeout = kwargs.get("timeout", UNSTRUCTURED_TIMEOUT)
+
     """ Loads data using Unstructured.io
 
         Depending on the construction if url is set or api = True
@@ -48,64 +126,88 @@ class UnstructuredReader(BaseReader):
         Returns list of documents
     """
 
-    def load_data(
-        self,
-        file: Path,
-        extra_info: Optional[Dict] = None,
-        split_documents: Optional[bool] = False,
-        **kwargs,
-    ) -> List[Document]:
-        """If api is set, parse through api"""
-        file_path_str = str(file)
+    def iter_element_batches(self, file_path: str) -> Iterator[list[dict]]:
+        """Partition the file, and yield its elements as `element_to_dict`, in
+        batches of `_ELEMENT_BATCH_SIZE` elements"""
         if self.api:
             from unstructured.partition.api import partition_via_api
 
-            elements = partition_via_api(
-                filename=file_path_str,
+            elements: Iterable = partition_via_api(
+                filename=file_path,
                 api_key=self.api_key,
                 api_url=self.server_url + "/general/v0/general",
             )
+            yield from _batch_elements(elements)
+        elif self.workers > 0:
+            if importlib.util.find_spec("unstructured") is None:
+                raise ImportError(
+                    "Please install unstructured: `pip install unstructured`"
+                )
+            pool = get_unstructured_pool(self.workers, self.timeout)
+            yield from pool.stream(file_path)
         else:
             """Parse file locally"""
             from unstructured.partition.auto import partition
 
-            elements = partition(filename=file_path_str)
+            yield from _batch_elements(partition(filename=file_path))
 
-        """ Process elements """
-        docs = []
+    def lazy_load_data(
+        self,
+        file: Path,
+        extra_info: Optional[Dict] = None,
+        split_documents: Optional[bool] = False,
+        **kwargs,
+    ) -> Iterator[Document]:
+        """Yield the documents of the file, as soon as they are extracted
+
+        With `split_documents`, a document is yielded per element. Otherwise, a
+        document joining the texts of the elements is yielded for each batch of
+        elements, which `load_data` joins into a single document.
+        """
         file_name = Path(file).name
         file_path = str(Path(file).resolve())
+        batches = self.iter_element_batches(str(file))
+
         if split_documents:
-            for node in elements:
-                metadata = {"file_name": file_name, "file_path": file_path}
-                if hasattr(node, "metadata"):
-                    """Load metadata fields"""
-                    for field, val in vars(node.metadata).items():
-                        if field == "_known_field_names":
-                            continue
-                        # removing coordinates because it does not serialize
-                        # and dont want to bother with it
-                        if field == "coordinates":
-                            continue
-                        # removing bc it might cause interference
-                        if field == "parent_id":
-                            continue
-                        metadata[field] = val
-
-                if extra_info is not None:
-                    metadata.update(extra_info)
-
-                metadata["file_name"] = file_name
-                docs.append(Document(text=node.text, metadata=metadata))
+            for batch in batches:
+                for element in batch:
+                    metadata = {"file_name": file_name, "file_path": file_path}
+                    metadata.update(element["metadata"])
+                    if extra_info is not None:
+                        metadata.update(extra_info)
+
+                    metadata["file_name"] = file_name
+                    yield Document(text=element["text"], metadata=metadata)
 
         else:
-            text_chunks = [" ".join(str(el).split()) for el in elements]
             metadata = {"file_name": file_name, "file_path": file_path}
 
             if extra_info is not None:
                 metadata.update(extra_info)
 
-            # Create a single document by joining all the texts
-            docs.append(Document(text="\n\n".join(text_chunks), metadata=metadata))
+            empty = True
+            for batch in batches:
+                text_chunks = [" ".join(element["str"].split()) for element in batch]
+                empty = False
+                yield Document(text="\n\n".join(text_chunks), metadata=dict(metadata))
+            if empty:
+                yield Document(text="", metadata=metadata)
 
-        return docs
+    def load_data(
+        self,
+        file: Path,
+        extra_info: Optional[Dict] = None,
+        split_documents: Optional[bool] = False,
+        **kwargs,
+    ) -> List[Document]:
+        """If api is set, parse through api"""
+        docs = list(self.lazy_load_data(file, extra_info, split_documents, **kwargs))
+        if split_documents or len(docs) <= 1:
+            return docs
+
+        # Create a single document by joining all the texts
+        return [
+            Document(
+                text="\n\n".join(doc.text for doc in docs), metadata=docs[0].metadata
+            )
+        ]
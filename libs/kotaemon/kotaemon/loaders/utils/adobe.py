@@ -5,15 +5,30 @@ import json
 import logging
 import os
 import tempfile
+import threading
 import zipfile
+from collections import OrderedDict
 from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from hashlib import sha256
 from pathlib import Path
-from typing import List, Union
+from typing import List, Optional, Union
 
 import pandas as pd
 from decouple import config
+from theflow.settings import settings as flowsettings
 
-from kotaemon.loaders.utils.gpt4v import generate_gpt4v
+from kotaemon.loaders.utils.gpt4v import downscale_image, generate_gpt4v
+
+logger = logging.getLogger(__name__)
+
+FIGURE_CAPTION_PROMPT = "Provide a short 2 sentence summary of this image?"
+# number of figures captioned at the same time
+VLM_CAPTION_WORKERS = config("VLM_CAPTION_WORKERS", default=8, cast=int)
+# figures are downscaled to this size (longest side, in pixels) before captioning
+VLM_CAPTION_MAX_IMAGE_SIZE = config(
+    "VLM_CAPTION_MAX_IMAGE_SIZE", default=1024, cast=int
+)
 
 
 def request_adobe_service(file_path: str, output_path: str = "") -> str:
@@ -202,21 +217,95 @@ def parse_figure_paths(file_paths: List[Path]) -> Union[bytes, str]:
     return content
 
 
+class FigureCaptionCache:
+    """Captions of the figures by content hash, kept in memory and optionally in
+    a directory, so that the same figure (e.g. a logo) is captioned only once
+
+    Args:
+        cache_dir: if set, the captions are also stored as `{hash}.txt` files in
+            this directory, and shared across processes and restarts
+        max_entries: maximum number of captions kept in memory
+    """
+
+    def __init__(self, cache_dir: Optional[str | Path] = None, max_entries=10000):
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._captions: OrderedDict[str, str] = OrderedDict()
+        if self.cache_dir is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(vlm_endpoint: str, prompt: str, figure: str) -> str:
+        return sha256(f"{vlm_endpoint}\n{prompt}\n{figure}".encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            if key in self._captions:
+                self._captions.move_to_end(key)
+                return self._captions[key]
+
+        if self.cache_dir is None:
+            return None
+        try:
+            caption = (self.cache_dir / f"{key}.txt").read_text(encoding="utf-8")
+        except OSError:
+            return None
+        self._remember(key, caption)
+        return caption
+
+    def put(self, key: str, caption: str):
+        self._remember(key, caption)
+        if self.cache_dir is not None:
+            path = self.cache_dir / f"{key}.txt"
+            tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp_path.write_text(caption, encoding="utf-8")
+            os.replace(tmp_path, path)
+
+    def _remember(self, key: str, caption: str):
+        with self._lock:
+            self._captions[key] = caption
+            self._captions.move_to_end(key)
+            while len(self._captions) > self.max_entries:
+                self._captions.popitem(last=False)
+
+
+@lru_cache
+def get_caption_cache() -> FigureCaptionCache:
+    """Get the figure caption cache, in `KH_VLM_CAPTION_CACHE_DIR` if set"""
+    return FigureCaptionCache(getattr(flowsettings, "KH_VLM_CAPTION_CACHE_DIR", None))
+
+
 def generate_single_figure_caption(vlm_endpoint: str, figure: str) -> str:
+    """Summarize a single figure using GPT-4V
+
+    The figure is downscaled before it is sent, and its caption is cached by
+    content hash.
+    """
     output = ""
+    if not figure:
+        return output
 
-    """Summarize a single figure using GPT-4V"""
-    if figure:
-        try:
-            output = generate_gpt4v(
-                endpoint=vlm_endpoint,
-                prompt="Provide a short 2 sentence summary of this image?",
-                images=figure,
-            )
-            if "sorry" in output.lower():
-                output = ""
-        except Exception as e:
-            print(f"Error generating caption: {e}")
+    cache = get_caption_cache()
+    key = cache.key(vlm_endpoint, FIGURE_CAPTION_PROMPT, figure)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    try:
+        output = generate_gpt4v(
+            endpoint=vlm_endpoint,
+            prompt=FIGURE_CAPTION_PROMPT,
+            images=downscale_image(figure, VLM_CAPTION_MAX_IMAGE_SIZE),
+        )
+        if "sorry" in output.lower():
+            output = ""
+    except Exception as e:
+        print(f"Error generating caption: {e}")
+
+    # failed calls are not cached, so they are tried again
+    if output:
+        cache.put(key, output)
 
     return output
 
@@ -225,6 +314,10 @@ def generate_figure_captions(
     vlm_endpoint: str, figures: List, max_figures_to_process: int
 ) -> List:
     """Summarize several figures using GPT-4V.
+
+    At most `VLM_CAPTION_WORKERS` figures are captioned at the same time, and
+    identical figures are captioned once.
+
     Args:
         vlm_endpoint (str): endpoint to the vision language model service
         figures (List): list of base64 images
@@ -237,14 +330,22 @@ def generate_figure_captions(
     """
     to_gen_figures = figures[:max_figures_to_process]
     other_figures = figures[max_figures_to_process:]
-
-    with ThreadPoolExecutor() as executor:
-        futures = [
-            executor.submit(
-                lambda: generate_single_figure_caption(vlm_endpoint, figure)
+    if not vlm_endpoint or not to_gen_figures:
+        return [""] * len(figures)
+
+    unique_figures = list(dict.fromkeys(to_gen_figures))
+    with ThreadPoolExecutor(
+        max_workers=max(1, min(VLM_CAPTION_WORKERS, len(unique_figures)))
+    ) as executor:
+        captions = dict(
+            zip(
+                unique_figures,
+                executor.map(
+                    lambda figure: generate_single_figure_caption(vlm_endpoint, figure),
+                    unique_figures,
+                ),
             )
-            for figure in to_gen_figures
-        ]
+        )
 
-    results = [future.result() for future in futures]
+    results = [captions[figure] for figure in to_gen_figures]
     return results + [""] * len(other_figures)
@@ -1,4 +1,7 @@
-from typing import List, Tuple
+from collections import defaultdict
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
 
 
 def bbox_to_points(box: List[int]):
@@ -103,6 +106,123 @@ def get_rect_iou(gt_box: List[tuple], pd_box: List[tuple], iou_type=0) -> int:
     return iou
 
 
+def locations_to_array(locations: Sequence[List[tuple]]) -> np.ndarray:
+    """Convert a list of locations (4 points, as in `get_rect_iou`) to an
+    (n, 4) array of [x1, y1, x2, y2] boxes"""
+    if len(locations) == 0:
+        return np.zeros((0, 4), dtype=np.float64)
+    return np.array(
+        [[*location[0], *location[2]] for location in locations], dtype=np.float64
+    )
+
+
+def get_rect_iou_matrix(
+    gt_boxes: np.ndarray, pd_boxes: np.ndarray, iou_type=0
+) -> np.ndarray:
+    """Vectorised `get_rect_iou` between two sets of boxes
+
+    Args:
+        gt_boxes: (n, 4) array of [x1, y1, x2, y2] boxes
+        pd_boxes: (m, 4) array of [x1, y1, x2, y2] boxes
+        iou_type: 0 for intersection / union, 1 for intersection / min(areas)
+
+    Returns:
+        (n, m) array of the IOU of each pair of boxes
+    """
+    assert iou_type in [0, 1], "Only support 0: origin iou, 1: intersection / min(area)"
+
+    gt_boxes = np.asarray(gt_boxes, dtype=np.float64).reshape(-1, 4)
+    pd_boxes = np.asarray(pd_boxes, dtype=np.float64).reshape(-1, 4)
+    gt, pd = gt_boxes[:, None, :], pd_boxes[None, :, :]
+
+    inter_w = np.minimum(gt[..., 2], pd[..., 2]) - np.maximum(gt[..., 0], pd[..., 0])
+    inter_h = np.minimum(gt[..., 3], pd[..., 3]) - np.maximum(gt[..., 1], pd[..., 1])
+    inter_area = np.maximum(inter_w, 0) * np.maximum(inter_h, 0)
+
+    gt_area = (gt[..., 2] - gt[..., 0]) * (gt[..., 3] - gt[..., 1])
+    pd_area = (pd[..., 2] - pd[..., 0]) * (pd[..., 3] - pd[..., 1])
+
+    if iou_type == 0:
+        denominator = gt_area + pd_area - inter_area
+    else:
+        denominator = np.maximum(np.minimum(gt_area, pd_area), 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        iou = inter_area / denominator
+    return np.nan_to_num(iou, nan=0.0, posinf=0.0, neginf=0.0)
+
+
+class BoxGridIndex:
+    """Uniform grid over a set of boxes, to find the boxes overlapping a region
+    without comparing it with all of them
+
+    Each box is registered in every grid cell it covers. The default cell size is
+    the median box size, so that a box usually covers a few cells.
+
+    Args:
+        boxes: (n, 4) array of [x1, y1, x2, y2] boxes
+        cell_size: size of the grid cells
+    """
+
+    def __init__(self, boxes: np.ndarray, cell_size: Optional[float] = None):
+        self.boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        sizes = np.maximum(
+            self.boxes[:, 2] - self.boxes[:, 0], self.boxes[:, 3] - self.boxes[:, 1]
+        )
+        if cell_size is None:
+            cell_size = float(np.median(sizes)) if len(sizes) else 1.0
+        self.cell_size = max(cell_size, 1.0)
+
+        self._cells: dict[tuple[int, int], list[int]] = defaultdict(list)
+        self._large: list[int] = []
+        grid = self._to_grid(self.boxes)
+        for box_id, (gx1, gy1, gx2, gy2) in enumerate(grid.tolist()):
+            if (gx2 - gx1 + 1) * (gy2 - gy1 + 1) > 64:
+                # boxes spanning many cells (e.g. tables) are always candidates
+                self._large.append(box_id)
+                continue
+            for gx in range(gx1, gx2 + 1):
+                for gy in range(gy1, gy2 + 1):
+                    self._cells[(gx, gy)].append(box_id)
+
+    def __len__(self) -> int:
+        return len(self.boxes)
+
+    def _to_grid(self, boxes: np.ndarray) -> np.ndarray:
+        return np.floor(boxes / self.cell_size).astype(np.int64)
+
+    def query(self, box: Sequence[float]) -> np.ndarray:
+        """Get the (sorted) ids of the boxes whose area intersects the box"""
+        box = np.asarray(box, dtype=np.float64)
+        gx1, gy1, gx2, gy2 = self._to_grid(box).tolist()
+
+        if (gx2 - gx1 + 1) * (gy2 - gy1 + 1) > len(self._cells):
+            candidates = np.arange(len(self.boxes))
+        else:
+            ids = set(self._large)
+            for gx in range(gx1, gx2 + 1):
+                for gy in range(gy1, gy2 + 1):
+                    ids.update(self._cells.get((gx, gy), ()))
+            candidates = np.fromiter(ids, dtype=np.int64, count=len(ids))
+            candidates.sort()
+
+        boxes = self.boxes[candidates]
+        overlap = (
+            (np.minimum(boxes[:, 2], box[2]) > np.maximum(boxes[:, 0], box[0]))
+            & (np.minimum(boxes[:, 3], box[3]) > np.maximum(boxes[:, 1], box[1]))
+            & (boxes[:, 2] > boxes[:, 0])
+            & (boxes[:, 3] > boxes[:, 1])
+        )
+        return candidates[overlap]
+
+    def query_iou(
+        self, box: Sequence[float], iou_type=0
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Get the ids of the boxes overlapping the box, and their IOU with it"""
+        ids = self.query(box)
+        iou = get_rect_iou_matrix(np.asarray(box)[None], self.boxes[ids], iou_type)
+        return ids, iou[0]
+
+
 def sort_funsd_reading_order(lines: List[dict], box_key_name: str = "box"):
     """Sort cell list to create the right reading order using their locations
 
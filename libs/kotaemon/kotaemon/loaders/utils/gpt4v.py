@@ -1,12 +1,60 @@
+import base64
 import json
 import logging
+from functools import lru_cache
+from io import BytesIO
 from typing import Any, List
 
 import requests
 from decouple import config
+from requests.adapters import HTTPAdapter
 
 logger = logging.getLogger(__name__)
 
+# maximum number of connections kept open to a VLM endpoint
+VLM_MAX_CONNECTIONS = config("VLM_MAX_CONNECTIONS", default=16, cast=int)
+
+
+@lru_cache
+def get_vlm_session() -> requests.Session:
+    """Get the HTTP session shared by the VLM calls, to reuse the connections"""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=VLM_MAX_CONNECTIONS, pool_maxsize=VLM_MAX_CONNECTIONS
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def downscale_image(image: str, max_size: int) -> str:
+    """Downscale a base64 image data URL so that its sides are at most `max_size`
+
+    The image is returned as is if it is small enough, or not a data URL.
+    """
+    if not image.startswith("data:image/") or ";base64," not in image:
+        return image
+
+    try:
+        from PIL import Image
+    except ImportError:
+        return image
+
+    header, data = image.split(",", 1)
+    try:
+        img = Image.open(BytesIO(base64.b64decode(data)))
+        if max(img.size) <= max_size:
+            return image
+        image_format = img.format or "PNG"
+        img.thumbnail((max_size, max_size))
+        buffer = BytesIO()
+        img.save(buffer, format=image_format)
+    except Exception as e:
+        logger.warning(f"Cannot downscale the image: {e}")
+        return image
+
+    return f"{header},{base64.b64encode(buffer.getvalue()).decode('utf-8')}"
+
 
 def generate_gpt4v(
     endpoint: str,
@@ -45,7 +93,7 @@ def generate_gpt4v(
     if len(images) > max_images:
         print(f"Truncated to {max_images} images (original {len(images)} images")
 
-    response = requests.post(endpoint, headers=headers, json=payload)
+    response = get_vlm_session().post(endpoint, headers=headers, json=payload)
 
     try:
         response.raise_for_status()
@@ -3,11 +3,12 @@ from pathlib import Path
 from typing import Dict, List, Optional, Union
 
 from .box import (
+    BoxGridIndex,
     bbox_to_points,
     box_area,
     box_h,
     box_w,
-    get_rect_iou,
+    locations_to_array,
     points_to_bbox,
     scale_box,
     scale_points,
@@ -74,15 +75,15 @@ def merge_ocr_and_pdf_texts(
     if debug_info is not None:
         cv2, debug_im = debug_info
 
-    for ocr_item in ocr_list:
-        matched = False
-        for pdf_item in pdf_text_list:
-            if (
-                get_rect_iou(ocr_item["location"], pdf_item["location"], iou_type=1)
-                > IOU_THRES
-            ):
-                matched = True
-                break
+    # only compare each OCR item with the PDF items overlapping it
+    pdf_index = BoxGridIndex(
+        locations_to_array([item["location"] for item in pdf_text_list])
+    )
+    ocr_boxes = locations_to_array([item["location"] for item in ocr_list])
+
+    for ocr_item, ocr_box in zip(ocr_list, ocr_boxes):
+        _, ious = pdf_index.query_iou(ocr_box, iou_type=1)
+        matched = bool((ious > IOU_THRES).any())
 
         color = (255, 0, 0)
         if not matched:
@@ -138,8 +139,21 @@ def merge_table_cell_and_ocr(
     table_list = sorted(table_list, key=lambda item: box_area(item["bbox"]))
 
     all_tables = []
-    matched_pdf_ids = []
-    matched_cell_ids = []
+    matched_pdf_ids: set[int] = set()
+    matched_cell_ids: set[int] = set()
+
+    # only compare each region with the items overlapping it
+    cell_index = BoxGridIndex(
+        locations_to_array([cell["location"] for cell in cell_list])
+    )
+    item_indices = {
+        "pdf": BoxGridIndex(
+            locations_to_array([item["location"] for item in pdf_list])
+        ),
+        "ocr": BoxGridIndex(
+            locations_to_array([item["location"] for item in ocr_list])
+        ),
+    }
 
     for table in table_list:
         if debug_info is not None:
@@ -152,27 +166,31 @@ def merge_table_cell_and_ocr(
             )
 
         cur_table_cells = []
-        for cell_id, cell in enumerate(cell_list):
+        table_box = locations_to_array([table["location"]])[0]
+        cell_ids, cell_ious = cell_index.query_iou(table_box, iou_type=1)
+        for cell_id, cell_iou in zip(cell_ids.tolist(), cell_ious.tolist()):
+            cell = cell_list[cell_id]
             if cell_id in matched_cell_ids:
                 continue
 
-            if get_rect_iou(
-                table["location"], cell["location"], iou_type=1
-            ) > IOU_THRES and box_area(table["bbox"]) > box_area(cell["bbox"]):
+            if cell_iou > IOU_THRES and box_area(table["bbox"]) > box_area(
+                cell["bbox"]
+            ):
                 color = [128, 0, 128]
                 # cell matched to table
+                cell_box = locations_to_array([cell["location"]])[0]
                 for item_list, item_type in [(pdf_list, "pdf"), (ocr_list, "ocr")]:
                     cell["ocr"] = []
-                    for item_id, item in enumerate(item_list):
+                    item_ids, item_ious = item_indices[item_type].query_iou(
+                        cell_box, iou_type=1
+                    )
+                    for item_id, item_iou in zip(item_ids.tolist(), item_ious.tolist()):
                         if item_type == "pdf" and item_id in matched_pdf_ids:
                             continue
-                        if (
-                            get_rect_iou(item["location"], cell["location"], iou_type=1)
-                            > IOU_THRES
-                        ):
-                            cell["ocr"].append(item)
+                        if item_iou > IOU_THRES:
+                            cell["ocr"].append(item_list[item_id])
                             if item_type == "pdf":
-                                matched_pdf_ids.append(item_id)
+                                matched_pdf_ids.add(item_id)
 
                     if len(cell["ocr"]) > 0:
                         # check if union of matched ocr does
@@ -203,7 +221,7 @@ def merge_table_cell_and_ocr(
                         thickness=3,
                     )
 
-                matched_cell_ids.append(cell_id)
+                matched_cell_ids.add(cell_id)
                 cur_table_cells.append(cell)
 
         all_tables.append(cur_table_cells)
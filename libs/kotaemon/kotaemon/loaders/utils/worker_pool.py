@@ -0,0 +1,272 @@
+"""Long-lived worker processes for heavy, possibly unreliable, file conversions
+
+Each worker loads its state (e.g. a model) once, then runs the conversions sent to
+it. A conversion that exceeds its timeout or memory limit kills its worker, which
+is replaced by a new one, so a pathological file cannot hang or exhaust the
+serving process. Conversions that are generators send their items back as they
+are produced.
+"""
+
+from __future__ import annotations
+
+import inspect
+import logging
+import multiprocessing
+import os
+import time
+import traceback
+from multiprocessing.connection import Connection
+from queue import Queue
+from typing import Any, Callable, Generator, Optional
+
+logger = logging.getLogger(__name__)
+
+# how often the memory of a busy worker is checked, in seconds
+_POLL_INTERVAL = 0.5
+
+
+def _process_rss(pid: int) -> Optional[int]:
+    """Resident memory of a process in bytes, None if it cannot be known"""
+    try:
+        import psutil
+
+        return psutil.Process(pid).memory_info().rss
+    except ImportError:
+        pass
+    except Exception:
+        return None
+
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _worker_main(
+    conn: Connection,
+    initializer: Optional[Callable[[], Any]],
+    func: Callable[..., Any],
+):
+    try:
+        state = initializer() if initializer is not None else None
+    except BaseException:
+        conn.send(("error", traceback.format_exc()))
+        return
+    conn.send(("ready", None))
+
+    while True:
+        try:
+            args = conn.recv()
+        except EOFError:
+            return
+        if args is None:
+            return
+
+        try:
+            result = func(state, *args)
+            if inspect.isgenerator(result):
+                conn.send(("done", yield_to_conn(result, conn)))
+            else:
+                conn.send(("ok", result))
+        except BaseException:
+            conn.send(("error", traceback.format_exc()))
+
+
+def yield_to_conn(generator: Generator, conn: Connection) -> Any:
+    """Send every item of the generator through the connection, and return its
+    value"""
+    while True:
+        try:
+            conn.send(("item", next(generator)))
+        except StopIteration as e:
+            return e.value
+
+
+class _Worker:
+    def __init__(self, ctx, initializer, func, name: str):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(child_conn, initializer, func),
+            name=name,
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class WarmProcessPool:
+    """Run a function in long-lived worker processes that are initialized once
+
+    `func(state, *args)` is called in a worker, where `state` is the value returned
+    by `initializer()` when the worker started. Both functions must be picklable
+    (defined at the top level of a module). The workers are started with "spawn",
+    so they do not inherit the threads and locks of the serving process.
+
+    Example:
+        ```python
+        pool = WarmProcessPool(load_model, convert, workers=2, timeout=600)
+        result = pool.run("/path/to/file.pdf")
+        ```
+
+    Args:
+        initializer: create the state of a worker, e.g. load a model
+        func: the function run for each call of `run`
+        workers: number of worker processes
+        timeout: maximum time of a call in seconds, not counting the
+            initialization of the worker. None for no limit
+        memory_limit: maximum resident memory of a worker in bytes. None for no
+            limit
+        name: name of the worker processes
+    """
+
+    def __init__(
+        self,
+        initializer: Optional[Callable[[], Any]],
+        func: Callable[..., Any],
+        workers: int = 1,
+        timeout: Optional[float] = None,
+        memory_limit: Optional[int] = None,
+        name: str = "warm-worker",
+    ):
+        self.initializer = initializer
+        self.func = func
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.name = name
+
+        self._ctx = multiprocessing.get_context("spawn")
+        self._idle: Queue[_Worker] = Queue()
+        self._closed = False
+        for _ in range(self.workers):
+            self._idle.put(self._spawn())
+
+    def _spawn(self) -> _Worker:
+        return _Worker(self._ctx, self.initializer, self.func, self.name)
+
+    def _replace(self, worker: _Worker):
+        logger.warning(f"Restarting a {self.name} worker")
+        worker.kill()
+        if not self._closed:
+            self._idle.put(self._spawn())
+
+    def _wait_ready(self, worker: _Worker):
+        """Wait until the worker is initialized"""
+        try:
+            status, value = worker.conn.recv()
+        except EOFError:
+            raise RuntimeError(f"The {self.name} worker died while starting")
+        if status != "ready":
+            raise RuntimeError(f"The {self.name} worker failed to start:\n{value}")
+        worker.ready = True
+
+    def _wait_result(self, worker: _Worker, start: float) -> tuple[str, Any]:
+        """Wait for the next message of the worker, within the time and memory
+        limits of the call started at `start`"""
+        while True:
+            wait = _POLL_INTERVAL
+            if self.timeout is not None:
+                remaining = self.timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    raise TimeoutError(
+                        f"The {self.name} worker did not finish in {self.timeout}s"
+                    )
+                wait = min(wait, remaining)
+
+            if worker.conn.poll(wait):
+                try:
+                    return worker.conn.recv()
+                except EOFError:
+                    raise RuntimeError(
+                        f"The {self.name} worker died "
+                        f"(exit code {worker.process.exitcode})"
+                    )
+
+            if self.memory_limit is not None:
+                rss = _process_rss(worker.process.pid)
+                if rss is not None and rss > self.memory_limit:
+                    raise MemoryError(
+                        f"The {self.name} worker used {rss} bytes, more than the "
+                        f"limit of {self.memory_limit} bytes"
+                    )
+
+    def _call(self, args: tuple) -> Generator[Any, None, tuple[bool, Any]]:
+        """Run `func(state, *args)` in an idle worker, yield the items it
+        produces, and return whether it is a generator, and its result"""
+        if self._closed:
+            raise RuntimeError(f"The {self.name} pool is closed")
+
+        worker = self._idle.get()
+        try:
+            if not worker.ready:
+                self._wait_ready(worker)
+            worker.conn.send(args)
+            start = time.monotonic()
+            while True:
+                status, value = self._wait_result(worker, start)
+                if status != "item":
+                    break
+                yield value
+        except BaseException:
+            # the worker may be stuck, in a bad state, or still producing items
+            # that nobody reads: start a new one
+            self._replace(worker)
+            raise
+
+        self._idle.put(worker)
+        if status == "error":
+            raise RuntimeError(f"The {self.name} worker failed:\n{value}")
+        return status == "done", value
+
+    def run(self, *args) -> Any:
+        """Run `func(state, *args)` in an idle worker, and return its result
+
+        If `func` is a generator, the list of its items is returned.
+
+        Raises:
+            TimeoutError: the call took more than `timeout` seconds
+            MemoryError: the worker used more than `memory_limit` bytes
+            RuntimeError: the call raised an exception, or the worker died
+        """
+        items = []
+        call = self._call(args)
+        while True:
+            try:
+                items.append(next(call))
+            except StopIteration as e:
+                is_generator, value = e.value
+                return items if is_generator else value
+
+    def stream(self, *args) -> Generator[Any, None, Any]:
+        """Run `func(state, *args)`, a generator, in an idle worker, and yield its
+        items as soon as they are produced
+
+        The timeout covers the whole call. Closing the returned generator early
+        stops the call, and restarts its worker.
+
+        Raises:
+            see `run`
+        """
+        _, value = yield from self._call(args)
+        return value
+
+    def close(self):
+        """Stop the workers"""
+        self._closed = True
+        while not self._idle.empty():
+            worker = self._idle.get()
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.kill()
@@ -8,7 +8,7 @@ from llama_index.core.vector_stores.types import BasePydanticVectorStore
 from llama_index.core.vector_stores.types import VectorStore as LIVectorStore
 from llama_index.core.vector_stores.types import VectorStoreQuery
 
-from kotaemon.base import DocumentWithEmbedding
+from kotaemon.base import DocumentWithEmbedding, EmbeddingMatrix
 
 
 class BaseVectorStore(ABC):
@@ -19,16 +19,17 @@ class BaseVectorStore(ABC):
     @abstractmethod
     def add(
         self,
-        embeddings: list[list[float]] | list[DocumentWithEmbedding],
+        embeddings: list[list[float]] | list[DocumentWithEmbedding] | EmbeddingMatrix,
         metadatas: Optional[list[dict]] = None,
         ids: Optional[list[str]] = None,
     ) -> list[str]:
         """Add vector embeddings to vector stores
 
         Args:
-            embeddings: List of embeddings
+            embeddings: List of embeddings, or an EmbeddingMatrix
             metadatas: List of metadata of the embeddings
-            ids: List of ids of the embeddings
+            ids: List of ids of the embeddings, default to the ids of the
+                EmbeddingMatrix if it is given
             kwargs: meant for vectorstore-specific parameters
 
         Returns:
@@ -112,10 +113,20 @@ class LlamaIndexVectorStore(BaseVectorStore):
 
     def add(
         self,
-        embeddings: list[list[float]] | list[DocumentWithEmbedding],
+        embeddings: list[list[float]] | list[DocumentWithEmbedding] | EmbeddingMatrix,
         metadatas: Optional[list[dict]] = None,
         ids: Optional[list[str]] = None,
     ):
+        if isinstance(embeddings, EmbeddingMatrix):
+            # LlamaIndex nodes only accept Python lists
+            if ids is None:
+                ids = embeddings.ids
+            texts = embeddings.texts or [""] * len(embeddings)
+            embeddings = [
+                DocumentWithEmbedding(embedding=embedding, text=text)
+                for embedding, text in zip(embeddings.to_lists(), texts)
+            ]
+
         if isinstance(embeddings[0], list):
             nodes: list[DocumentWithEmbedding] = [
                 DocumentWithEmbedding(embedding=embedding) for embedding in embeddings
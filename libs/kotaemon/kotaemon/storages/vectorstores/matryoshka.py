@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from kotaemon.base import DocumentWithEmbedding, EmbeddingMatrix
+
+from .base import BaseVectorStore
+
+
+class FullVectorTable:
+    """Persist full-dimension vectors in a SQLite file, to look them up by id
+
+    Args:
+        path: path to the SQLite file, ":memory:" to keep the vectors in memory
+    """
+
+    def __init__(self, path: str | Path = ":memory:"):
+        self.path = str(path)
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS vectors (id TEXT PRIMARY KEY, vector BLOB)"
+        )
+        self._conn.commit()
+
+    def add(self, matrix: EmbeddingMatrix):
+        rows = [
+            (id_, vector.tobytes()) for id_, vector in zip(matrix.ids, matrix.vectors)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO vectors (id, vector) VALUES (?, ?)", rows
+            )
+            self._conn.commit()
+
+    def get(self, ids: list[str]) -> dict[str, np.ndarray]:
+        if not ids:
+            return {}
+
+        placeholders = ",".join("?" * len(ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, vector FROM vectors WHERE id IN ({placeholders})", ids
+            ).fetchall()
+        return {id_: np.frombuffer(blob, dtype=np.float32) for id_, blob in rows}
+
+    def delete(self, ids: list[str]):
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM vectors WHERE id = ?", [(id_,) for id_ in ids]
+            )
+            self._conn.commit()
+
+    def drop(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM vectors")
+            self._conn.commit()
+
+
+class MatryoshkaVectorStore(BaseVectorStore):
+    """Store truncated Matryoshka embeddings in another vector store
+
+    Matryoshka embedding models (e.g. OpenAI text-embedding-3) are trained so that
+    the leading dimensions of an embedding are a good embedding on their own. This
+    store keeps only the first `dimensions` values of each vector (renormalized)
+    in the wrapped vector store, so that memory and search time shrink by the same
+    factor.
+
+    When `rescore` is enabled, the full vectors are also kept on disk, and the
+    `rescore_multiplier * top_k` best candidates of the truncated search are
+    re-ranked by the cosine similarity of the full vectors.
+
+    Args:
+        vector_store: the vector store holding the truncated vectors
+        dimensions: number of leading dimensions to keep
+        rescore: whether to re-rank the candidates with the full vectors
+        rescore_multiplier: number of candidates to re-rank, as a multiple of top_k
+        full_vector_path: SQLite file to store the full vectors, required to keep
+            them across restarts when rescore is enabled
+    """
+
+    def __init__(
+        self,
+        vector_store: BaseVectorStore,
+        dimensions: int = 256,
+        rescore: bool = False,
+        rescore_multiplier: int = 4,
+        full_vector_path: Optional[str] = None,
+    ):
+        self._vector_store = vector_store
+        self._dimensions = dimensions
+        self._rescore = rescore
+        self._rescore_multiplier = rescore_multiplier
+        self._full_vector_path = full_vector_path
+        self._full_vectors = (
+            FullVectorTable(full_vector_path or ":memory:") if rescore else None
+        )
+
+    def add(
+        self,
+        embeddings: list[list[float]] | list[DocumentWithEmbedding] | EmbeddingMatrix,
+        metadatas: Optional[list[dict]] = None,
+        ids: Optional[list[str]] = None,
+    ) -> list[str]:
+        if not isinstance(embeddings, EmbeddingMatrix):
+            if embeddings and isinstance(embeddings[0], DocumentWithEmbedding):
+                docs: list[DocumentWithEmbedding] = embeddings  # type: ignore
+                if metadatas is None:
+                    metadatas = [doc.metadata for doc in docs]
+                embeddings = EmbeddingMatrix(
+                    vectors=[doc.embedding for doc in docs],
+                    ids=ids or [doc.doc_id for doc in docs],
+                    texts=[doc.text for doc in docs],
+                )
+            else:
+                embeddings = EmbeddingMatrix(
+                    vectors=embeddings,  # type: ignore
+                    ids=ids or [str(idx) for idx in range(len(embeddings))],
+                )
+        if ids is not None:
+            embeddings = EmbeddingMatrix(
+                vectors=embeddings.vectors, ids=ids, texts=embeddings.texts
+            )
+
+        if self._full_vectors is not None:
+            self._full_vectors.add(embeddings)
+
+        return self._vector_store.add(
+            embeddings=embeddings.truncate(self._dimensions),
+            metadatas=metadatas,
+            ids=embeddings.ids,
+        )
+
+    def delete(self, ids: list[str], **kwargs):
+        self._vector_store.delete(ids, **kwargs)
+        if self._full_vectors is not None:
+            self._full_vectors.delete(ids)
+
+    def query(
+        self,
+        embedding: list[float],
+        top_k: int = 1,
+        ids: Optional[list[str]] = None,
+        **kwargs,
+    ) -> tuple[list[list[float]], list[float], list[str]]:
+        query = EmbeddingMatrix(vectors=embedding, ids=["query"])
+        short_query = query.truncate(self._dimensions).vectors[0].tolist()
+
+        if self._full_vectors is None:
+            return self._vector_store.query(
+                embedding=short_query, top_k=top_k, ids=ids, **kwargs
+            )
+
+        embeddings, scores, out_ids = self._vector_store.query(
+            embedding=short_query,
+            top_k=top_k * self._rescore_multiplier,
+            ids=ids,
+            **kwargs,
+        )
+        full_vectors = self._full_vectors.get(out_ids)
+        full_query = query.vectors[0] / (np.linalg.norm(query.vectors[0]) or 1.0)
+
+        rescored = []
+        for idx, (id_, score) in enumerate(zip(out_ids, scores)):
+            vector = full_vectors.get(id_)
+            if vector is not None:
+                norm = np.linalg.norm(vector) or 1.0
+                score = float(vector @ full_query / norm)
+                rescored.append((score, id_, vector.tolist()))
+            else:
+                fallback = embeddings[idx] if idx < len(embeddings) else []
+                rescored.append((score, id_, fallback))
+        rescored.sort(key=lambda item: item[0], reverse=True)
+        rescored = rescored[:top_k]
+
+        return (
+            [item[2] for item in rescored],
+            [item[0] for item in rescored],
+            [item[1] for item in rescored],
+        )
+
+    def drop(self):
+        self._vector_store.drop()
+        if self._full_vectors is not None:
+            self._full_vectors.drop()
+
+    def __persist_flow__(self):
+        return {
+            "vector_store": self._vector_store,
+            "dimensions": self._dimensions,
+            "rescore": self._rescore,
+            "rescore_multiplier": self._rescore_multiplier,
+            "full_vector_path": self._full_vector_path,
+        }
@@ -1,7 +1,7 @@
 import os
 from typing import Any, Optional, cast
 
-from kotaemon.base import DocumentWithEmbedding
+from kotaemon.base import DocumentWithEmbedding, EmbeddingMatrix
 
 from .base import LlamaIndexVectorStore
 
@@ -66,12 +66,14 @@ class MilvusVectorStore(LlamaIndexVectorStore):
 
     def add(
         self,
-        embeddings: list[list[float]] | list[DocumentWithEmbedding],
+        embeddings: list[list[float]] | list[DocumentWithEmbedding] | EmbeddingMatrix,
         metadatas: Optional[list[dict]] = None,
         ids: Optional[list[str]] = None,
     ):
         if not self._inited:
-            if isinstance(embeddings[0], list):
+            if isinstance(embeddings, EmbeddingMatrix):
+                dim = embeddings.vectors.shape[1]
+            elif isinstance(embeddings[0], list):
                 dim = len(embeddings[0])
             else:
                 dim = len(embeddings[0].embedding)
@@ -6,7 +6,7 @@ import fsspec
 from llama_index.core.vector_stores import SimpleVectorStore as LISimpleVectorStore
 from llama_index.core.vector_stores.simple import SimpleVectorStoreData
 
-from kotaemon.base import DocumentWithEmbedding
+from kotaemon.base import DocumentWithEmbedding, EmbeddingMatrix
 
 from .base import LlamaIndexVectorStore
 
@@ -45,7 +45,7 @@ class SimpleFileVectorStore(LlamaIndexVectorStore):
 
     def add(
         self,
-        embeddings: list[list[float]] | list[DocumentWithEmbedding],
+        embeddings: list[list[float]] | list[DocumentWithEmbedding] | EmbeddingMatrix,
         metadatas: Optional[list[dict]] = None,
         ids: Optional[list[str]] = None,
     ):
@@ -0,0 +1,173 @@
+"""Shared tiktoken encoders and memoized token counting
+
+Encoders are created once per model and shared by every component that needs to
+tokenize (splitting, trimming, scoring, token accounting). Token counts of
+documents are memoized by document id, so a chunk that was counted during
+indexing is not tokenized again when it is later trimmed or scored.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import TYPE_CHECKING, Callable, Optional, Sequence
+
+import tiktoken
+
+if TYPE_CHECKING:
+    from kotaemon.base import Document
+
+DEFAULT_TOKENIZER_MODEL = "gpt-3.5-turbo"
+DEFAULT_NUM_THREADS = 8
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str = DEFAULT_TOKENIZER_MODEL) -> tiktoken.Encoding:
+    """Get the shared tiktoken encoder of a model
+
+    Args:
+        model: an OpenAI model name (e.g. "gpt-3.5-turbo") or a tiktoken encoding
+            name (e.g. "cl100k_base")
+
+    Returns:
+        the tiktoken encoder, created only once per model
+    """
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding(model)
+
+
+@lru_cache(maxsize=None)
+def get_token_func(model: str = DEFAULT_TOKENIZER_MODEL) -> Callable[[str], list[int]]:
+    """Get the shared encode function of a model
+
+    The encoder is only loaded on the first call, so this is safe to use as a
+    default value at import time. The same function object is returned for the
+    same model.
+    """
+
+    def encode(text: str) -> list[int]:
+        return get_encoding(model).encode(text)
+
+    return encode
+
+
+def encode_batch(
+    texts: Sequence[str],
+    model: str = DEFAULT_TOKENIZER_MODEL,
+    num_threads: int = DEFAULT_NUM_THREADS,
+) -> list[list[int]]:
+    """Tokenize many texts at once, using tiktoken's native thread pool"""
+    return get_encoding(model).encode_batch(
+        list(texts), num_threads=num_threads, disallowed_special=()
+    )
+
+
+def count_tokens(text: str, model: str = DEFAULT_TOKENIZER_MODEL) -> int:
+    """Count the number of tokens of a text"""
+    return len(get_encoding(model).encode(text, disallowed_special=()))
+
+
+def count_tokens_batch(
+    texts: Sequence[str],
+    model: str = DEFAULT_TOKENIZER_MODEL,
+    num_threads: int = DEFAULT_NUM_THREADS,
+) -> list[int]:
+    """Count the number of tokens of many texts at once"""
+    return [len(tokens) for tokens in encode_batch(texts, model, num_threads)]
+
+
+class TokenCountCache:
+    """Memoize the token counts of documents by document id
+
+    An entry is only reused if the text of the document has not changed since it
+    was counted. The least recently used entries are evicted once `max_size`
+    entries are stored.
+
+    Args:
+        max_size: maximum number of (model, document id) entries to keep
+    """
+
+    def __init__(self, max_size: int = 200_000):
+        self.max_size = max_size
+        self._counts: OrderedDict[tuple[str, str], tuple[int, int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def count(
+        self,
+        docs: Sequence[Document],
+        model: str = DEFAULT_TOKENIZER_MODEL,
+        num_threads: int = DEFAULT_NUM_THREADS,
+    ) -> list[int]:
+        """Count the tokens of each document, tokenizing only unseen documents
+
+        Args:
+            docs: the documents to count
+            model: the model whose tokenizer is used
+            num_threads: number of threads to tokenize the unseen documents
+
+        Returns:
+            the number of tokens of each document
+        """
+        encoding_name = get_encoding(model).name
+        counts: list[Optional[int]] = []
+        misses: list[int] = []
+
+        with self._lock:
+            for idx, doc in enumerate(docs):
+                key = (encoding_name, doc.doc_id)
+                entry = self._counts.get(key)
+                if entry is not None and entry[0] == hash(doc.text):
+                    self._counts.move_to_end(key)
+                    counts.append(entry[1])
+                else:
+                    counts.append(None)
+                    misses.append(idx)
+
+        if misses:
+            new_counts = count_tokens_batch(
+                [docs[idx].text for idx in misses], model, num_threads
+            )
+            with self._lock:
+                for idx, count in zip(misses, new_counts):
+                    counts[idx] = count
+                    self._counts[(encoding_name, docs[idx].doc_id)] = (
+                        hash(docs[idx].text),
+                        count,
+                    )
+                while len(self._counts) > self.max_size:
+                    self._counts.popitem(last=False)
+
+        return counts  # type: ignore[return-value]
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
+
+
+token_counts = TokenCountCache()
+
+
+def count_document_tokens(
+    docs: Sequence[Document], model: str = DEFAULT_TOKENIZER_MODEL
+) -> list[int]:
+    """Count the tokens of each document, memoized by document id"""
+    return token_counts.count(docs, model)
+
+
+__all__ = [
+    "DEFAULT_TOKENIZER_MODEL",
+    "TokenCountCache",
+    "count_document_tokens",
+    "count_tokens",
+    "count_tokens_batch",
+    "encode_batch",
+    "get_encoding",
+    "get_token_func",
+    "token_counts",
+]
@@ -0,0 +1,59 @@
+import random
+
+import numpy as np
+
+from kotaemon.loaders.utils.box import (
+    BoxGridIndex,
+    bbox_to_points,
+    get_rect_iou,
+    get_rect_iou_matrix,
+)
+from kotaemon.loaders.utils.pdf_ocr import merge_ocr_and_pdf_texts
+
+
+def _random_boxes(n: int, seed: int) -> list[list[int]]:
+    rng = random.Random(seed)
+    boxes = []
+    for _ in range(n):
+        x, y = rng.randint(0, 1000), rng.randint(0, 1000)
+        boxes.append([x, y, x + rng.randint(1, 120), y + rng.randint(1, 40)])
+    return boxes
+
+
+def test_rect_iou_matrix():
+    gt_boxes, pd_boxes = _random_boxes(50, 0), _random_boxes(60, 1)
+    for iou_type in [0, 1]:
+        matrix = get_rect_iou_matrix(np.array(gt_boxes), np.array(pd_boxes), iou_type)
+        expected = [
+            [
+                get_rect_iou(bbox_to_points(gt), bbox_to_points(pd), iou_type)
+                for pd in pd_boxes
+            ]
+            for gt in gt_boxes
+        ]
+        assert np.allclose(matrix, expected)
+
+
+def test_box_grid_index():
+    boxes = _random_boxes(500, 2) + [[0, 0, 1000, 1000]]
+    index = BoxGridIndex(np.array(boxes))
+    for query in _random_boxes(50, 3):
+        ids, ious = index.query_iou(query, iou_type=1)
+        iou = get_rect_iou_matrix(np.array([query]), np.array(boxes), iou_type=1)[0]
+        # all the overlapping boxes are found, and only them
+        assert ids.tolist() == np.flatnonzero(iou > 0).tolist()
+        assert np.allclose(ious, iou[ids])
+
+
+def test_merge_ocr_and_pdf_texts():
+    def item(text, box):
+        return {"text": text, "box": box, "location": bbox_to_points(box)}
+
+    pdf_list = [item("pdf 1", [0, 0, 100, 20]), item("pdf 2", [0, 30, 100, 50])]
+    ocr_list = [
+        item("ocr 1", [2, 1, 98, 19]),
+        item("ocr 2", [200, 0, 300, 20]),
+        item("ocr 3", [0, 45, 100, 65]),
+    ]
+    merged = merge_ocr_and_pdf_texts(ocr_list, pdf_list)
+    assert [each["text"] for each in merged] == ["pdf 1", "pdf 2", "ocr 2", "ocr 3"]
@@ -0,0 +1,95 @@
+import json
+import time
+
+import pytest
+
+from kotaemon.base import Document
+from kotaemon.indices.export import ChunkExportWriter
+
+
+def _chunks(file_name: str, n: int) -> list[Document]:
+    return [
+        Document(text=f"chunk {i}", metadata={"file_name": file_name, "page": i})
+        for i in range(n)
+    ]
+
+
+def test_export_jsonl(tmp_path):
+    writer = ChunkExportWriter(tmp_path, format="jsonl")
+    writer.write(_chunks("a.pdf", 3))
+    writer.write(_chunks("a.pdf", 2) + _chunks("a.txt", 1))
+    writer.flush()
+
+    with open(tmp_path / "a.pdf.jsonl") as f:
+        rows = [json.loads(line) for line in f]
+    assert [row["text"] for row in rows] == [
+        "chunk 0",
+        "chunk 1",
+        "chunk 2",
+        "chunk 0",
+        "chunk 1",
+    ]
+    assert json.loads(rows[2]["metadata"])["page"] == 2
+    # files with the same stem are exported separately
+    with open(tmp_path / "a.txt.jsonl") as f:
+        assert len(f.readlines()) == 1
+
+    writer.clear("a.pdf")
+    writer.write(_chunks("a.pdf", 1))
+    writer.flush()
+    with open(tmp_path / "a.pdf.jsonl") as f:
+        assert len(f.readlines()) == 1
+    assert (tmp_path / "a.txt.jsonl").exists()
+
+
+def test_export_parquet(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    # the rows written while the writer is idle are appended as row groups to
+    # the open file, instead of rewriting it
+    writer = ChunkExportWriter(tmp_path, format="parquet", idle_seconds=0.05)
+    writer.write(_chunks("a.pdf", 3))
+    time.sleep(0.3)
+    writer.write(_chunks("a.pdf", 2))
+    time.sleep(0.3)
+    writer.close_file("a.pdf")
+    writer.flush()
+
+    parquet_file = pq.ParquetFile(tmp_path / "a.pdf.parquet")
+    assert parquet_file.metadata.num_row_groups == 2
+    table = parquet_file.read()
+    assert table.num_rows == 5
+    assert table.column_names == ["id", "text", "metadata"]
+
+    # more rows after the file is finished are added to it
+    writer.write(_chunks("a.pdf", 1))
+    writer.flush()
+    assert pq.read_table(tmp_path / "a.pdf.parquet").num_rows == 6
+
+    writer.clear("a.pdf")
+    writer.write(_chunks("a.pdf", 2))
+    writer.flush()
+    assert pq.read_table(tmp_path / "a.pdf.parquet").num_rows == 2
+
+
+def test_export_markdown(tmp_path):
+    # the per-chunk markdown export is the default
+    writer = ChunkExportWriter(tmp_path)
+    assert writer.format == "markdown"
+    writer.write(_chunks("a.pdf", 2))
+    writer.write(_chunks("a.pdf_b.pdf", 1))
+    writer.write(_chunks("a.txt", 1))
+    writer.flush()
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "a.pdf_0.md",
+        "a.pdf_1.md",
+        "a.pdf_b.pdf_0.md",
+        "a.txt_0.md",
+    ]
+
+    writer.clear("a.pdf")
+    writer.flush()
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "a.pdf_b.pdf_0.md",
+        "a.txt_0.md",
+    ]
@@ -0,0 +1,79 @@
+from kotaemon.base import Document
+from kotaemon.indices import ChunkDeduplicator, ChunkMatcher
+from kotaemon.indices.dedup import content_hash
+
+disclaimer = (
+    "This document is provided for information purposes only and does not "
+    "constitute an offer or solicitation to buy or sell any financial instrument. "
+    "Past performance is not indicative of future results and the value of "
+    "investments may go down as well as up."
+)
+
+
+def test_exact_duplicates():
+    docs = [
+        Document(text=disclaimer, id_="a"),
+        Document(text="Some unique content", id_="b"),
+        Document(text=disclaimer.replace(" ", "  "), id_="c"),
+        Document(text="", id_="d"),
+    ]
+    result = ChunkDeduplicator()(docs)
+
+    assert [doc.doc_id for doc in result.unique] == ["a", "b", "d"]
+    assert result.duplicates == {"c": "a"}
+    assert result.hashes[content_hash(disclaimer)] == "a"
+
+
+def test_duplicates_of_stored_chunks():
+    known = {content_hash(disclaimer): "stored"}
+    docs = [Document(text=disclaimer, id_="a"), Document(text="other", id_="b")]
+
+    looked_up = []
+
+    def lookup(hashes):
+        looked_up.extend(hashes)
+        return {h: known[h] for h in hashes if h in known}
+
+    result = ChunkDeduplicator()(docs, lookup=lookup)
+
+    assert sorted(looked_up) == sorted(content_hash(doc.text) for doc in docs)
+    assert [doc.doc_id for doc in result.unique] == ["b"]
+    assert result.duplicates == {"a": "stored"}
+    assert content_hash(disclaimer) not in result.hashes
+
+
+def test_near_duplicates():
+    docs = [
+        Document(text=disclaimer + " Updated on 1 January 2024.", id_="a"),
+        Document(text=disclaimer + " Updated on 2 January 2024.", id_="b"),
+        Document(text="The pink cockatoo is a medium-sized cockatoo.", id_="c"),
+    ]
+
+    result = ChunkDeduplicator()(docs)
+    assert not result.duplicates
+
+    result = ChunkDeduplicator(near_duplicate=True, threshold=0.7)(docs)
+    assert [doc.doc_id for doc in result.unique] == ["a", "c"]
+    assert result.duplicates == {"b": "a"}
+    assert result.hashes[content_hash(docs[1].text)] == "a"
+
+
+def test_chunk_matcher():
+    old = [
+        Document(text="intro", id_="1"),
+        Document(text=disclaimer, id_="2"),
+        Document(text="old section", id_="3"),
+        Document(text=disclaimer, id_="4"),
+    ]
+    new = [
+        Document(text="intro", id_="a"),
+        Document(text="new section", id_="b"),
+        Document(text=disclaimer, id_="c"),
+        Document(text=disclaimer, id_="d"),
+    ]
+    matcher = ChunkMatcher(old)
+    matched = [matcher.match(doc, position) for position, doc in enumerate(new)]
+
+    assert [doc.doc_id if doc else None for doc in matched] == ["1", None, "2", "4"]
+    assert [doc.doc_id for doc in matcher.unmatched] == ["3"]
+    assert matcher.reused == 3
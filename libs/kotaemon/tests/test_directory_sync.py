@@ -0,0 +1,155 @@
+import os
+import threading
+from pathlib import Path
+
+import pytest
+
+sync = pytest.importorskip("ktem.index.file.sync")
+
+
+class FakeIndex:
+    """Record the indexed and deleted files, and fail to index some files"""
+
+    def __init__(self, file_id=lambda path: f"id-{Path(path).name}"):
+        self.file_id = file_id
+        self.indexed: list[str] = []
+        self.deleted: list[str] = []
+        self.failing: set[str] = set()
+        self.called = threading.Event()
+
+    def index_files(self, paths):
+        yield f"Indexing {len(paths)} files"
+        self.called.set()
+        names = [Path(path).name for path in paths]
+        self.indexed.extend(names)
+        return [
+            None if name in self.failing else self.file_id(path)
+            for name, path in zip(names, paths)
+        ]
+
+    def delete_file(self, file_id):
+        self.deleted.append(file_id)
+
+
+def run_sync(dir_sync, index):
+    messages = []
+    generator = dir_sync.sync(index.index_files, index.delete_file)
+    while True:
+        try:
+            messages.append(next(generator))
+        except StopIteration as e:
+            return e.value
+
+
+def modify(path: Path, text: str, mtime_ns: int):
+    path.write_text(text)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_directory_sync(tmp_path):
+    folder = tmp_path / "share"
+    (folder / "sub").mkdir(parents=True)
+    for name in ["a.txt", "b.txt", "sub/c.md"]:
+        (folder / name).write_text(f"content of {name}")
+    # files without an extension are not indexed
+    (folder / "LICENSE").write_text("license")
+
+    dir_sync = sync.DirectorySync(folder, tmp_path / "manifest.json", workers=2)
+    index = FakeIndex()
+
+    plan = run_sync(dir_sync, index)
+    assert sorted(Path(path).name for path in plan.added) == ["a.txt", "b.txt", "c.md"]
+    assert sorted(index.indexed) == ["a.txt", "b.txt", "c.md"]
+    # the manifest is keyed on the path relative to the directory
+    assert sorted(dir_sync.load_manifest()) == ["a.txt", "b.txt", "sub/c.md"]
+
+    # nothing changed
+    index.indexed.clear()
+    plan = run_sync(dir_sync, index)
+    assert (plan.added, plan.modified, plan.deleted) == ([], [], [])
+    assert plan.n_unchanged == 3
+    assert index.indexed == []
+
+    # a.txt is modified, b.txt is touched, c.md is deleted, d.txt fails to index
+    mtime_ns = (folder / "a.txt").stat().st_mtime_ns + 10**9
+    modify(folder / "a.txt", "new content of a.txt", mtime_ns)
+    modify(folder / "b.txt", "content of b.txt", mtime_ns)
+    (folder / "sub" / "c.md").unlink()
+    (folder / "d.txt").write_text("content of d.txt")
+    index.failing.add("d.txt")
+
+    plan = run_sync(dir_sync, index)
+    assert [Path(path).name for path in plan.modified] == ["a.txt"]
+    assert [Path(path).name for path in plan.added] == ["d.txt"]
+    assert [Path(path).name for path in plan.deleted] == ["c.md"]
+    assert plan.n_unchanged == 1
+    assert sorted(index.indexed) == ["a.txt", "d.txt"]
+    assert index.deleted == ["id-c.md"]
+
+    # the failed file is tried again at the next sync
+    index.indexed.clear()
+    index.failing.clear()
+    plan = run_sync(dir_sync, index)
+    assert [Path(path).name for path in plan.added] == ["d.txt"]
+    assert plan.n_unchanged == 2
+    assert index.indexed == ["d.txt"]
+
+
+def test_directory_sync_same_file_names(tmp_path):
+    folder = tmp_path / "share"
+    for name in ["x", "y"]:
+        (folder / name).mkdir(parents=True)
+        (folder / name / "notes.txt").write_text(f"notes of {name}")
+
+    dir_sync = sync.DirectorySync(folder, tmp_path / "manifest.json")
+    index = FakeIndex(file_id=lambda path: f"id-{dir_sync.relative_path(path)}")
+    run_sync(dir_sync, index)
+    manifest = dir_sync.load_manifest()
+    assert {path: entry["file_id"] for path, entry in manifest.items()} == {
+        "x/notes.txt": "id-x/notes.txt",
+        "y/notes.txt": "id-y/notes.txt",
+    }
+
+    # deleting one of them removes only its file from the index
+    (folder / "x" / "notes.txt").unlink()
+    plan = run_sync(dir_sync, index)
+    assert plan.deleted == ["x/notes.txt"]
+    assert index.deleted == ["id-x/notes.txt"]
+    assert list(dir_sync.load_manifest()) == ["y/notes.txt"]
+
+
+def test_directory_sync_file_deleted_after_scan(tmp_path):
+    folder = tmp_path / "share"
+    folder.mkdir()
+    for name in ["a.txt", "b.txt"]:
+        (folder / name).write_text(f"content of {name}")
+
+    dir_sync = sync.DirectorySync(folder, tmp_path / "manifest.json")
+    run_sync(dir_sync, FakeIndex())
+
+    # a.txt changes, then is deleted before it is hashed
+    mtime_ns = (folder / "a.txt").stat().st_mtime_ns + 10**9
+    modify(folder / "a.txt", "new content of a.txt", mtime_ns)
+    stats = dir_sync.scan()
+    (folder / "a.txt").unlink()
+
+    plan, hashes = dir_sync.plan(dir_sync.load_manifest(), stats)
+    assert [Path(path).name for path in plan.deleted] == ["a.txt"]
+    assert (plan.added, plan.modified, plan.n_unchanged) == ([], [], 1)
+    assert hashes == {}
+
+
+def test_directory_sync_polling(tmp_path):
+    folder = tmp_path / "share"
+    folder.mkdir()
+    (folder / "a.txt").write_text("content of a.txt")
+
+    dir_sync = sync.DirectorySync(folder, tmp_path / "manifest.json")
+    index = FakeIndex()
+    dir_sync.start_polling(0.05, index.index_files, index.delete_file)
+    assert index.called.wait(timeout=5)
+
+    dir_sync.stop_polling()
+    dir_sync._poller.join(timeout=5)
+    assert not dir_sync._poller.is_alive()
+    assert index.indexed == ["a.txt"]
@@ -1,15 +1,20 @@
+import asyncio
 import json
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from unittest.mock import Mock, patch
 
+import numpy as np
 from openai.types.create_embedding_response import CreateEmbeddingResponse
 
-from kotaemon.base import Document, DocumentWithEmbedding
+from kotaemon.base import Document, DocumentWithEmbedding, EmbeddingMatrix
 from kotaemon.embeddings import (
     AzureOpenAIEmbeddings,
+    BaseEmbeddings,
     FastEmbedEmbeddings,
     LCCohereEmbeddings,
     LCHuggingFaceEmbeddings,
+    MicroBatchEmbeddings,
     OpenAIEmbeddings,
     VoyageAIEmbeddings,
 )
@@ -111,6 +116,42 @@ def test_openai_embeddings_batch_raw(openai_embedding_call):
     openai_embedding_call.assert_called()
 
 
+@patch(
+    "openai.resources.embeddings.Embeddings.create",
+    side_effect=lambda *args, **kwargs: openai_embedding_batch,
+)
+def test_openai_embeddings_array(openai_embedding_call):
+    model = OpenAIEmbeddings(
+        api_key="some-key",
+        model="text-embedding-ada-002",
+    )
+    docs = [Document(text="Hello world"), Document(text="Goodbye world")]
+    output = model.embed_array(docs)
+    assert isinstance(output, EmbeddingMatrix)
+    assert output.vectors.dtype == np.float32
+    assert output.vectors.flags["C_CONTIGUOUS"]
+    assert output.vectors.shape[0] == 2
+    assert output.ids == [doc.doc_id for doc in docs]
+    openai_embedding_call.assert_called()
+
+
+@patch("openai.resources.embeddings.Embeddings.create")
+def test_openai_embeddings_empty(openai_embedding_call):
+    model = OpenAIEmbeddings(
+        api_key="some-key",
+        model="text-embedding-ada-002",
+    )
+    assert model([]) == []
+    output = model.embed_array([])
+    assert len(output) == 0
+    assert output.vectors.shape == (0, 0)
+    assert output.to_lists() == []
+    openai_embedding_call.assert_not_called()
+
+    # an empty matrix can be built from lists too
+    assert EmbeddingMatrix(vectors=[], ids=[]).vectors.shape == (0, 0)
+
+
 @skip_when_sentence_bert_not_installed
 @patch(
     "sentence_transformers.SentenceTransformer",
@@ -170,3 +211,63 @@ def test_voyageai_embeddings(sync_call, async_call):
     model = VoyageAIEmbeddings(api_key="test")
     output = model("Hello, world!")
     assert all(isinstance(doc, DocumentWithEmbedding) for doc in output)
+
+
+class CountingEmbeddings(BaseEmbeddings):
+    calls: list = []
+
+    def invoke(self, text, *args, **kwargs):
+        docs = self.prepare_input(text)
+        self.calls.append(len(docs))
+        return [
+            DocumentWithEmbedding(content=doc, embedding=[float(len(doc.text))])
+            for doc in docs
+        ]
+
+
+def test_micro_batch_embeddings():
+    base = CountingEmbeddings(calls=[])
+    model = MicroBatchEmbeddings(embedding=base, max_batch_size=8, max_wait_ms=50)
+    texts = ["a" * i for i in range(1, 17)]
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        outputs = list(executor.map(model, texts))
+
+    # each caller gets back the embedding of its own text
+    for text, output in zip(texts, outputs):
+        assert_embedding_result(output)
+        assert output[0].text == text
+        assert output[0].embedding == [float(len(text))]
+
+    # concurrent single-text calls are coalesced into fewer batched calls
+    assert sum(base.calls) == len(texts)
+    assert len(base.calls) < len(texts)
+    assert max(base.calls) <= 8
+
+    # multi-text calls are forwarded directly
+    base.calls.clear()
+    model(["Hello world", "Goodbye world"])
+    assert base.calls == [2]
+
+
+def test_micro_batch_embeddings_cancelled_caller():
+    base = CountingEmbeddings(calls=[])
+    model = MicroBatchEmbeddings(embedding=base, max_batch_size=8, max_wait_ms=200)
+
+    async def run():
+        tasks = [asyncio.create_task(model.ainvoke(text)) for text in ["a", "bb", "c"]]
+        await asyncio.sleep(0.05)
+        # a caller gives up while its batch is still being collected
+        tasks[1].cancel()
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    outputs = asyncio.run(run())
+
+    assert isinstance(outputs[1], asyncio.CancelledError)
+    assert outputs[0][0].embedding == [1.0]
+    assert outputs[2][0].embedding == [1.0]
+    # the cancelled text is not embedded
+    assert base.calls == [2]
+
+    # the batching thread is still serving the other callers
+    assert model("ddd")[0].embedding == [3.0]
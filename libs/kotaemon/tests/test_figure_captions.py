@@ -0,0 +1,54 @@
+import base64
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+from PIL import Image
+
+from kotaemon.loaders.utils.adobe import generate_figure_captions
+
+
+def _image(color: str, size: int) -> str:
+    buffer = BytesIO()
+    Image.new("RGB", (size, size), color).save(buffer, format="PNG")
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+
+def test_generate_figure_captions():
+    received_sizes = []
+
+    class StandInVLMHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            image = body["messages"][0]["content"][1]["image_url"]["url"]
+            img = Image.open(BytesIO(base64.b64decode(image.split(",", 1)[1])))
+            received_sizes.append(img.size)
+
+            content = json.dumps(
+                {"choices": [{"message": {"content": f"color {img.getpixel((0, 0))}"}}]}
+            ).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInVLMHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = f"http://127.0.0.1:{server.server_port}/"
+    red, blue, green = _image("red", 2048), _image("blue", 64), _image("green", 64)
+    try:
+        captions = generate_figure_captions(endpoint, [red, blue, red, green], 3)
+        # figures are cached by content, including across calls
+        assert generate_figure_captions(endpoint, [blue], 3) == [captions[1]]
+    finally:
+        server.shutdown()
+
+    assert captions[0] == captions[2] != captions[1]
+    assert captions[3] == ""
+    # the same figure is captioned once, and large figures are downscaled
+    assert sorted(received_sizes) == [(64, 64), (1024, 1024)]
@@ -0,0 +1,405 @@
+import threading
+import time
+import uuid
+from pathlib import Path
+
+import pytest
+from sqlalchemy import JSON, Column, Integer, String, create_engine, inspect, select
+from sqlalchemy import text as sql_text
+from sqlalchemy.ext.mutable import MutableDict
+from sqlalchemy.orm import Session, declarative_base
+
+from kotaemon.base import Document, DocumentWithEmbedding
+from kotaemon.embeddings import BaseEmbeddings
+from kotaemon.loaders.base import BaseReader
+from kotaemon.storages import InMemoryDocumentStore, InMemoryVectorStore
+from kotaemon.tokenizers import get_token_func
+
+pipelines = pytest.importorskip("ktem.index.file.pipelines")
+
+
+def run_stream(generator):
+    """Collect the messages of a generator, and its return value"""
+    messages = []
+    while True:
+        try:
+            messages.append(next(generator))
+        except StopIteration as e:
+            return messages, e.value
+
+
+class FakeFilePipeline:
+    """Index a file after a delay, or fail to parse it"""
+
+    def __init__(self, delay: float, fail: bool = False):
+        self.delay = delay
+        self.fail = fail
+
+    def stream(self, file_path, reindex=False, **kwargs):
+        time.sleep(self.delay)
+        if self.fail:
+            raise ValueError(f"Cannot parse {file_path.name}")
+        yield Document(f"Parsed {file_path.name}", channel="debug")
+        return f"id-{file_path.stem}", [Document(text=file_path.name)]
+
+
+class FakeIndexDocumentPipeline(pipelines.IndexDocumentPipeline):
+    def route(self, file_path):
+        # the first files take the longest, so they finish last
+        delay = {"a": 0.3, "b": 0.2, "c": 0.1, "d": 0.0}[file_path.stem]
+        return FakeFilePipeline(delay, fail=file_path.stem == "b")
+
+    def index_file(self, file_path, reindex, **kwargs):
+        if file_path.stem == "c":
+            raise RuntimeError("Unexpected failure")
+        return super().index_file(file_path, reindex, **kwargs)
+
+
+def test_stream_parallel_order_and_failures():
+    pipeline = FakeIndexDocumentPipeline(file_workers=4)
+    file_paths = [Path(f"{name}.txt") for name in "abcd"]
+
+    messages, (file_ids, errors, docs) = run_stream(pipeline.stream(file_paths))
+
+    # the failures of a file do not affect the others
+    assert file_ids == ["id-a", None, None, "id-d"]
+    assert errors == [None, "Cannot parse b.txt", "Unexpected failure", None]
+    assert [doc.text for doc in docs] == ["a.txt", "d.txt"]
+
+    # the progress is streamed file by file, in the order of the files
+    debug = [msg.content for msg in messages if msg.channel == "debug"]
+    assert debug == [
+        "Indexing [1/4]: a.txt",
+        "Parsed a.txt",
+        "Indexing [2/4]: b.txt",
+        "Indexing [3/4]: c.txt",
+        "Indexing [4/4]: d.txt",
+        "Parsed d.txt",
+    ]
+    statuses = [msg.content["status"] for msg in messages if msg.channel == "index"]
+    assert statuses == ["success", "failed", "success"]
+
+
+class ParagraphReader(BaseReader):
+    """Load each paragraph of a text file as a document"""
+
+    def run(self, file_path, extra_info=None, **kwargs):
+        return self.load_data(file_path, extra_info=extra_info, **kwargs)
+
+    def load_data(self, file_path, extra_info=None, **kwargs):
+        paragraphs = Path(file_path).read_text().split("\n\n")
+        return [
+            Document(text=text, metadata={**(extra_info or {}), "page_label": idx})
+            for idx, text in enumerate(paragraphs, start=1)
+        ]
+
+
+class FakeEmbeddings(BaseEmbeddings):
+    """Record the embedded texts, and fail after `fail_after` batches"""
+
+    texts: list = []
+    fail_after: int = -1
+
+    def invoke(self, text, *args, **kwargs):
+        docs = self.prepare_input(text)
+        if self.fail_after == 0:
+            raise RuntimeError("The embedding service is down")
+        self.fail_after -= 1
+        self.texts.extend(doc.text for doc in docs)
+        return [
+            DocumentWithEmbedding(content=doc, embedding=[float(len(doc.text)), 1.0])
+            for doc in docs
+        ]
+
+
+@pytest.fixture
+def index_pipeline(tmp_path, monkeypatch):
+    """Make an IndexPipeline on its own database, doc store and vector store"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'index.db'}")
+    monkeypatch.setattr(pipelines, "engine", engine)
+    # do not export the chunks to the app data
+    monkeypatch.setattr(pipelines.VectorIndexing, "get_chunk_writer", lambda _: None)
+
+    Base = declarative_base()
+
+    class Source(Base):
+        __tablename__ = "source"
+        id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+        name = Column(String, unique=True)
+        path = Column(String)
+        size = Column(Integer, default=0)
+        user = Column(String, default="")
+        note = Column(MutableDict.as_mutable(JSON), default={})
+
+    class Index(Base):
+        __tablename__ = "index"
+        id = Column(Integer, primary_key=True, autoincrement=True)
+        source_id = Column(String)
+        target_id = Column(String)
+        relation_type = Column(String)
+        user = Column(String, default="")
+
+    Base.metadata.create_all(engine)
+
+    def make_pipeline(
+        embedding: BaseEmbeddings, DS=None, loader=None
+    ) -> "pipelines.IndexPipeline":
+        return pipelines.IndexPipeline(
+            loader=loader or ParagraphReader(),
+            splitter=None,
+            doc_batch_size=2,
+            chunk_batch_size=2,
+            parse_cache_dir=None,
+            Source=Source,
+            Index=Index,
+            VS=vector_store,
+            DS=DS or doc_store,
+            FSPath=tmp_path / "files",
+            user_id="user",
+            embedding=embedding,
+        )
+
+    doc_store = InMemoryDocumentStore()
+    vector_store = InMemoryVectorStore()
+    (tmp_path / "files").mkdir()
+    return make_pipeline
+
+
+@pytest.fixture
+def text_file(tmp_path) -> Path:
+    file_path = tmp_path / "notes.txt"
+    file_path.write_text(
+        "\n\n".join(f"Paragraph {idx} about topic {idx * 7}." for idx in range(10))
+    )
+    return file_path
+
+
+def get_source(pipeline, file_id: str):
+    with Session(pipelines.engine) as session:
+        return session.get(pipeline.Source, file_id)
+
+
+def test_index_pipeline_token_count(index_pipeline, text_file):
+    pipeline = index_pipeline(FakeEmbeddings(texts=[]))
+    _, (file_id, _) = run_stream(pipeline.stream(text_file, reindex=False))
+
+    # the tokens of each chunk are counted as it is split
+    token_func = get_token_func("gpt-3.5-turbo")
+    chunks = pipeline.get_file_chunks(file_id)
+    assert len(chunks) == 10
+    for chunk in chunks:
+        assert chunk.metadata["token_count"] == len(token_func(chunk.text))
+    n_tokens = sum(chunk.metadata["token_count"] for chunk in chunks)
+    assert get_source(pipeline, file_id).note["tokens"] == n_tokens
+
+    # the given number of tokens is used as is
+    pipeline.finish(file_id, text_file, n_tokens=42)
+    assert get_source(pipeline, file_id).note["tokens"] == 42
+
+    # otherwise it is counted from the stored chunks
+    pipeline.finish(file_id, text_file)
+    assert get_source(pipeline, file_id).note["tokens"] == n_tokens
+
+
+def test_index_pipeline_resume(index_pipeline, text_file):
+    # the embedding service goes down after 2 batches
+    pipeline = index_pipeline(FakeEmbeddings(texts=[], fail_after=2))
+    with pytest.raises(RuntimeError):
+        run_stream(pipeline.stream(text_file, reindex=False))
+
+    file_id = pipeline.get_id_by_name(text_file)
+    assert pipeline.get_checkpoint(file_id) is not None
+    stored_ids = {chunk.doc_id for chunk in pipeline.get_file_chunks(file_id)}
+    embedded_ids = pipeline.get_embedded_ids(file_id)
+    assert 0 < len(embedded_ids) < 10
+
+    # indexing the file again continues from the stored chunks
+    embedding = FakeEmbeddings(texts=[])
+    pipeline = index_pipeline(embedding)
+    messages, (resumed_id, _) = run_stream(pipeline.stream(text_file, reindex=False))
+    assert resumed_id == file_id
+    assert any("Resuming" in str(msg.content) for msg in messages)
+    assert pipeline.get_checkpoint(file_id) is None
+
+    # only the chunks without a vector are embedded
+    chunk_ids = {chunk.doc_id for chunk in pipeline.get_file_chunks(file_id)}
+    assert len(chunk_ids) == 10
+    assert stored_ids <= chunk_ids
+    assert len(embedding.texts) == 10 - len(embedded_ids)
+    assert pipeline.get_embedded_ids(file_id) == chunk_ids
+    assert set(pipeline.VS._client.data.embedding_dict) == chunk_ids
+
+
+def test_index_pipeline_same_file_names(index_pipeline, tmp_path):
+    folder = tmp_path / "share"
+    for name in ["x", "y"]:
+        (folder / name).mkdir(parents=True)
+        (folder / name / "notes.txt").write_text(f"Paragraph of {name}.")
+
+    # the files under the root directory are named by their relative path, so
+    # files with the same name in different subdirectories are kept apart
+    file_ids = []
+    for name in ["x", "y"]:
+        pipeline = index_pipeline(FakeEmbeddings(texts=[]))
+        pipeline.root_dir = str(folder)
+        _, (file_id, _) = run_stream(
+            pipeline.stream(folder / name / "notes.txt", reindex=False)
+        )
+        file_ids.append(file_id)
+        assert get_source(pipeline, file_id).name == f"{name}/notes.txt"
+        assert pipeline.get_id_by_name(folder / name / "notes.txt") == file_id
+
+    assert file_ids[0] != file_ids[1]
+
+
+def test_index_pipeline_delete_file(index_pipeline, tmp_path):
+    file_paths = []
+    for name in ["a", "b"]:
+        file_path = tmp_path / f"{name}.txt"
+        file_path.write_text(
+            "\n\n".join(f"Paragraph {idx} of {name}." for idx in range(4))
+        )
+        file_paths.append(file_path)
+
+    pipeline = index_pipeline(FakeEmbeddings(texts=[]))
+    file_ids = [
+        run_stream(pipeline.stream(file_path, reindex=False))[1][0]
+        for file_path in file_paths
+    ]
+
+    def get_records(file_id):
+        with Session(pipelines.engine) as session:
+            return session.execute(
+                select(pipeline.Index.target_id, pipeline.Index.relation_type).where(
+                    pipeline.Index.source_id == file_id
+                )
+            ).all()
+
+    kept_records = get_records(file_ids[1])
+    kept_ids = {chunk.doc_id for chunk in pipeline.get_file_chunks(file_ids[1])}
+    assert get_records(file_ids[0]) and kept_records
+
+    # the records, chunks and vectors of exactly one file are removed
+    pipeline.delete_file(file_ids[0])
+    assert get_records(file_ids[0]) == []
+    assert get_records(file_ids[1]) == kept_records
+    assert get_source(pipeline, file_ids[0]) is None
+    assert pipeline.DS.count() == len(kept_ids)
+    assert set(pipeline.VS._client.data.embedding_dict) == kept_ids
+
+
+def test_file_index_migrate_tables(tmp_path, monkeypatch):
+    index_module = pytest.importorskip("ktem.index.file.index")
+    engine = create_engine(f"sqlite:///{tmp_path / 'index.db'}")
+    monkeypatch.setattr(index_module, "engine", engine)
+    monkeypatch.setattr(index_module, "get_vectorstore", lambda _: None)
+    monkeypatch.setattr(index_module, "get_docstore", lambda _: None)
+
+    # the Index table of an index created before the table indexes existed
+    with engine.begin() as conn:
+        conn.execute(
+            sql_text(
+                "CREATE TABLE index__7__index (id INTEGER PRIMARY KEY, "
+                "source_id VARCHAR, target_id VARCHAR, relation_type VARCHAR, "
+                "user VARCHAR)"
+            )
+        )
+    assert inspect(engine).get_indexes("index__7__index") == []
+
+    file_index = index_module.FileIndex(None, 7, "files", {})
+    file_index._setup_resources()
+    file_index._migrate_tables()
+    file_index._migrate_tables()  # the indexes are only created once
+
+    indexes = {
+        index["name"]: index["column_names"]
+        for index in inspect(engine).get_indexes("index__7__index")
+    }
+    assert indexes == {
+        "ix_index__7__index_source_relation": ["source_id", "relation_type"],
+        "ix_index__7__index_target_relation": ["target_id", "relation_type"],
+    }
+
+
+class SlowDocumentStore(InMemoryDocumentStore):
+    """Record whether two writes ever run at the same time"""
+
+    def __init__(self):
+        super().__init__()
+        self.writing = 0
+        self.overlapped = False
+
+    def add(self, *args, **kwargs):
+        self.writing += 1
+        self.overlapped |= self.writing > 1
+        time.sleep(0.01)
+        super().add(*args, **kwargs)
+        self.writing -= 1
+
+
+def test_index_pipeline_shared_docstore(index_pipeline, tmp_path):
+    doc_store = SlowDocumentStore()
+    file_paths = []
+    for name in ["a", "b", "c"]:
+        file_path = tmp_path / f"{name}.txt"
+        file_path.write_text(
+            "\n\n".join(f"Paragraph {idx} of {name}." for idx in range(6))
+        )
+        file_paths.append(file_path)
+
+    # the files are indexed at the same time into the same doc store
+    file_ids = {}
+
+    def index(file_path):
+        pipeline = index_pipeline(FakeEmbeddings(texts=[]), DS=doc_store)
+        _, (file_ids[file_path.stem], _) = run_stream(
+            pipeline.stream(file_path, reindex=False)
+        )
+
+    threads = [threading.Thread(target=index, args=(path,)) for path in file_paths]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not doc_store.overlapped
+    assert doc_store.count() == 18
+    pipeline = index_pipeline(FakeEmbeddings(texts=[]), DS=doc_store)
+    for name, file_id in file_ids.items():
+        chunks = pipeline.get_file_chunks(file_id)
+        assert len(chunks) == 6
+        assert all(f"of {name}." in chunk.text for chunk in chunks)
+
+
+def test_index_pipeline_lazy_loading(index_pipeline, text_file):
+    doc_store = InMemoryDocumentStore()
+    n_stored_while_parsing = []
+
+    class LazyParagraphReader(ParagraphReader):
+        """Yield the paragraphs one by one, and wait for the first ones to be
+        stored before yielding the last one"""
+
+        lazy_loading = True
+
+        def lazy_load_data(self, file_path, extra_info=None, **kwargs):
+            docs = self.load_data(file_path, extra_info=extra_info)
+            yield from docs[:-1]
+            deadline = time.time() + 5
+            while doc_store.count() == 0 and time.time() < deadline:
+                time.sleep(0.01)
+            n_stored_while_parsing.append(doc_store.count())
+            yield docs[-1]
+
+    pipeline = index_pipeline(
+        FakeEmbeddings(texts=[]), DS=doc_store, loader=LazyParagraphReader()
+    )
+    messages, (file_id, docs) = run_stream(pipeline.stream(text_file, reindex=False))
+
+    # the first paragraphs are indexed while the file is still parsed
+    assert n_stored_while_parsing[0] > 0
+    assert len(docs) == 10
+    assert len(pipeline.get_file_chunks(file_id)) == 10
+    debug = [msg.content for msg in messages if msg.channel == "debug"]
+    assert debug.index(" => Converted notes.txt to text") > debug.index(
+        " => [notes.txt] Processed 2 chunks"
+    )
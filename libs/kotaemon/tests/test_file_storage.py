@@ -0,0 +1,100 @@
+import os
+import shutil
+
+import pytest
+
+utils = pytest.importorskip("ktem.index.file.utils")
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage_path = tmp_path / "storage"
+    storage_path.mkdir()
+    return storage_path
+
+
+def fail(*args, **kwargs):
+    raise OSError("Not supported")
+
+
+def test_hash_file_cache(tmp_path):
+    file_path = tmp_path / "a.txt"
+    file_path.write_text("content of a")
+    file_hash = utils.hash_file(file_path)
+
+    # the file is only read again if its size or modification time changed
+    hits = utils._hash_file.cache_info().hits
+    assert utils.hash_file(file_path) == file_hash
+    assert utils._hash_file.cache_info().hits == hits + 1
+
+    mtime_ns = file_path.stat().st_mtime_ns
+    file_path.write_text("content of b")
+    os.utime(file_path, ns=(mtime_ns + 10**9, mtime_ns + 10**9))
+    assert utils.hash_file(file_path) != file_hash
+
+    file_path.write_text("longer content of a")
+    os.utime(file_path, ns=(mtime_ns, mtime_ns))
+    assert utils.hash_file(file_path) != file_hash
+
+    file_path.write_text("content of a")
+    os.utime(file_path, ns=(mtime_ns + 2 * 10**9, mtime_ns + 2 * 10**9))
+    assert utils.hash_file(file_path) == file_hash
+
+
+def test_store_content_addressed_reflink(tmp_path, storage, monkeypatch):
+    cloned = []
+
+    def clone_file(src, dst):
+        cloned.append(src)
+        shutil.copyfile(src, dst)
+
+    file_path = tmp_path / "a.txt"
+    file_path.write_text("content of a")
+    monkeypatch.setattr(utils, "_clone_file", clone_file)
+    file_hash = utils.store_content_addressed(file_path, storage, "reflink")
+    assert cloned == [file_path]
+    assert (storage / file_hash).read_text() == "content of a"
+
+    # without cloning support, the file is copied
+    file_path = tmp_path / "b.txt"
+    file_path.write_text("content of b")
+    monkeypatch.setattr(utils, "_clone_file", fail)
+    file_hash = utils.store_content_addressed(file_path, storage, "reflink")
+    assert (storage / file_hash).read_text() == "content of b"
+    assert not (storage / file_hash).samefile(file_path)
+
+
+def test_store_content_addressed_hardlink(tmp_path, storage, monkeypatch):
+    file_path = tmp_path / "a.txt"
+    file_path.write_text("content of a")
+    file_hash = utils.store_content_addressed(file_path, storage, "hardlink")
+    assert (storage / file_hash).samefile(file_path)
+
+    # across filesystems, the file is copied
+    file_path = tmp_path / "b.txt"
+    file_path.write_text("content of b")
+    monkeypatch.setattr(utils.os, "link", fail)
+    file_hash = utils.store_content_addressed(file_path, storage, "hardlink")
+    assert (storage / file_hash).read_text() == "content of b"
+    assert not (storage / file_hash).samefile(file_path)
+
+
+def test_store_content_addressed_dedup(tmp_path, storage, monkeypatch):
+    copied = []
+    shutil_copyfile = shutil.copyfile
+
+    def copyfile(src, dst):
+        copied.append(src)
+        return shutil_copyfile(src, dst)
+
+    monkeypatch.setattr(utils.shutil, "copyfile", copyfile)
+    paths = [tmp_path / "a.txt", tmp_path / "copy of a.txt"]
+    for path in paths:
+        path.write_text("content of a")
+
+    # files with the same content are stored once, under the same hash
+    hashes = [utils.store_content_addressed(path, storage, "copy") for path in paths]
+    assert hashes[0] == hashes[1] == utils.hash_file(paths[0])
+    assert copied == [paths[0]]
+    # no temporary file is left behind
+    assert [path.name for path in storage.iterdir()] == [hashes[0]]
@@ -0,0 +1,120 @@
+import time
+
+import pytest
+from sqlalchemy import create_engine, update
+from sqlalchemy.orm import Session
+
+jobs = pytest.importorskip("ktem.index.file.jobs")
+
+
+@pytest.fixture
+def job_queue(tmp_path, monkeypatch):
+    """Make a job queue on its own database, run by hand instead of by threads"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}")
+    jobs.IndexingJob.__table__.create(engine)
+    monkeypatch.setattr(jobs, "engine", engine)
+
+    queue = jobs.IndexingJobQueue(max_workers=2, max_attempts=3, backoff_seconds=10)
+    monkeypatch.setattr(queue, "_start", lambda: None)
+    return queue
+
+
+def make_due(job_id: str):
+    """Let the job be retried now instead of after its backoff"""
+    with Session(jobs.engine) as session:
+        session.execute(
+            update(jobs.IndexingJob)
+            .where(jobs.IndexingJob.id == job_id)
+            .values(next_attempt_at=0.0)
+        )
+        session.commit()
+
+
+def test_indexing_jobs_claim(job_queue):
+    job_queue.register(1, lambda job, progress: None)
+    job_ids = [job_queue.submit(1, f"file-{idx}", "a.pdf", {}, 10) for idx in range(3)]
+    other_id = job_queue.submit(2, "file-3", "b.pdf", {}, 10)
+
+    # the oldest jobs of the registered indices are claimed, up to max_workers
+    assert job_queue._claim_jobs() == job_ids[:2]
+    assert job_queue._claim_jobs() == []
+    assert job_queue.status(job_ids[0])["status"] == jobs.RUNNING
+    assert job_queue.status(job_ids[2])["status"] == jobs.PENDING
+    assert job_queue.status(other_id)["status"] == jobs.PENDING
+
+    # a finished job frees its slot
+    job_queue._run(job_ids[0])
+    assert job_queue.status(job_ids[0])["status"] == jobs.COMPLETED
+    assert job_queue._claim_jobs() == [job_ids[2]]
+
+    # the running jobs are resumed after a restart
+    job_queue.register(1, lambda job, progress: None)
+    assert job_queue.status(job_ids[1])["status"] == jobs.PENDING
+
+
+def test_indexing_jobs_retry_with_backoff(job_queue):
+    attempts = []
+
+    def runner(job, progress):
+        attempts.append(job["n_done"])
+        progress(job["n_done"] + 5)
+        raise RuntimeError("The embedding service is down")
+
+    job_queue.register(1, runner)
+    job_id = job_queue.submit(1, "file-0", "a.pdf", {}, 10)
+
+    for attempt in range(1, 3):
+        assert job_queue._claim_jobs() == [job_id]
+        start = time.time()
+        job_queue._run(job_id)
+
+        # the job waits twice as long before each retry
+        job = job_queue.status(job_id)
+        assert job["status"] == jobs.PENDING
+        assert job["attempts"] == attempt
+        assert job["error"] == "RuntimeError: The embedding service is down"
+        delay = job["next_attempt_at"] - start
+        assert 10 * 2 ** (attempt - 1) <= delay < 10 * 2 ** (attempt - 1) + 5
+        assert job_queue._claim_jobs() == []
+        make_due(job_id)
+
+    assert job_queue._claim_jobs() == [job_id]
+    job_queue._run(job_id)
+    job = job_queue.status(job_id)
+    assert job["status"] == jobs.FAILED
+    assert job["attempts"] == 3
+
+    # each attempt resumes from the progress of the previous one
+    assert attempts == [0, 5, 10]
+
+
+def test_indexing_jobs_cancel(job_queue):
+    steps = []
+
+    def runner(job, progress):
+        for n_done in range(1, 4):
+            steps.append(n_done)
+            if n_done == 2:
+                job_queue.cancel(job["id"])
+            if not progress(n_done):
+                return
+
+    job_queue.register(1, runner)
+    running_id, pending_id, other_id = [
+        job_queue.submit(1, file_id, "a.pdf", {}, 3)
+        for file_id in ["file-0", "file-1", "file-2"]
+    ]
+
+    # a running job stops after its current step
+    assert job_queue._claim_jobs() == [running_id, pending_id]
+    job_queue._run(running_id)
+    assert steps == [1, 2]
+    job = job_queue.status(running_id)
+    assert job["status"] == jobs.CANCELLED
+    assert job["n_done"] == 1
+
+    # only the unfinished jobs can be cancelled
+    assert job_queue.cancel(running_id) is False
+    assert job_queue.cancel_file_jobs(1, "file-1") == 1
+    assert job_queue.status(pending_id)["status"] == jobs.CANCELLED
+    assert job_queue.status(other_id)["status"] == jobs.PENDING
@@ -0,0 +1,58 @@
+from kotaemon.base import Document
+from kotaemon.loaders import PandasExcelReader, ParseCache
+from kotaemon.loaders.cache import loader_cache_key
+
+
+def _docs(file_id: str) -> list[Document]:
+    return [
+        Document(
+            text=f"page {i}",
+            metadata={"page_label": i + 1, "file_id": file_id, "file_name": "a.pdf"},
+        )
+        for i in range(3)
+    ]
+
+
+def test_parse_cache(tmp_path):
+    cache = ParseCache(tmp_path)
+    key = loader_cache_key("hash", PandasExcelReader())
+    assert cache.get(key) is None
+
+    docs = _docs("id1")
+    cache.put(key, docs, extra_info={"file_id": "id1", "file_name": "a.pdf"})
+
+    # the metadata given by the caller are replaced, the ids are new
+    cached = ParseCache(tmp_path).get(key, {"file_id": "id2", "file_name": "a.pdf"})
+    assert [doc.text for doc in cached] == ["page 0", "page 1", "page 2"]
+    assert cached[0].metadata == {
+        "page_label": 1,
+        "file_id": "id2",
+        "file_name": "a.pdf",
+    }
+    assert cached[0].doc_id != docs[0].doc_id
+
+    assert cache.purge() == 1
+    assert cache.get(key) is None and cache.size == 0
+
+
+def test_parse_cache_key():
+    key = loader_cache_key("hash", PandasExcelReader())
+    assert key == loader_cache_key("hash", PandasExcelReader())
+    assert key != loader_cache_key("other hash", PandasExcelReader())
+    assert key != loader_cache_key("hash", PandasExcelReader(block_tokens=64))
+
+
+def test_parse_cache_eviction(tmp_path):
+    cache = ParseCache(tmp_path)
+    cache.put("a", _docs("a"))
+    entry_size = cache.size
+    cache.max_bytes = 2 * entry_size
+
+    cache.put("b", _docs("b"))
+    cache.get("a")
+    cache.put("c", _docs("c"))
+
+    # "b" is the least recently used entry
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
@@ -83,6 +83,33 @@ def test_mhtml_reader():
     assert docs[0].text.startswith("This is a test")
 
 
+def test_unstructured_reader_lazy_loading():
+    batches = [
+        [{"text": "a", "str": "a", "metadata": {"page_number": 1}}] * 2,
+        [{"text": "b", "str": "b  c", "metadata": {"page_number": 2}}],
+    ]
+    reader = UnstructuredReader()
+    with patch.object(
+        UnstructuredReader, "iter_element_batches", return_value=iter(batches)
+    ):
+        documents = list(reader.lazy_load_data(Path("file.docx")))
+    # a document is yielded for each batch of elements, as it is extracted
+    assert [doc.text for doc in documents] == ["a\n\na", "b c"]
+
+    with patch.object(
+        UnstructuredReader, "iter_element_batches", return_value=iter(batches)
+    ):
+        documents = reader.load_data(Path("file.docx"))
+    assert [doc.text for doc in documents] == ["a\n\na\n\nb c"]
+    assert documents[0].metadata["file_name"] == "file.docx"
+
+    with patch.object(
+        UnstructuredReader, "iter_element_batches", return_value=iter(batches)
+    ):
+        documents = reader.load_data(Path("file.docx"), split_documents=True)
+    assert [doc.metadata["page_number"] for doc in documents] == [1, 1, 2]
+
+
 @patch("azure.ai.documentintelligence.DocumentIntelligenceClient")
 def test_azureai_document_intelligence_reader(mock_client):
     reader = AzureAIDocumentIntelligenceLoader(
@@ -93,3 +120,117 @@ def test_azureai_document_intelligence_reader(mock_client):
 
     assert len(docs) == 1
     mock_client.assert_called_once()
+
+
+def test_pdf_thumbnail_reader(tmp_path):
+    from kotaemon.loaders import PDFThumbnailReader
+
+    file_path = Path(__file__).parent / "resources" / "multimodal.pdf"
+
+    reader = PDFThumbnailReader(thumbnail_dir=str(tmp_path), thumbnail_workers=1)
+    documents = reader.load_data(file_path)
+    thumbnails = [doc for doc in documents if doc.metadata.get("type") == "thumbnail"]
+    assert len(thumbnails) == 3
+    for doc in thumbnails:
+        assert "image_origin" not in doc.metadata
+        assert Path(doc.metadata["image_path"]).read_bytes()[:2] == b"\xff\xd8"
+
+    reader = PDFThumbnailReader(
+        thumbnail_dir=None, thumbnail_format="webp", thumbnail_workers=1
+    )
+    documents = reader.load_data(file_path)
+    thumbnails = [doc for doc in documents if doc.metadata.get("type") == "thumbnail"]
+    assert thumbnails[0].metadata["image_origin"].startswith("data:image/webp")
+
+
+def test_pdf_thumbnail_dir_setting(tmp_path):
+    from kotaemon.loaders import pdf_loader
+
+    with patch.object(
+        pdf_loader.flowsettings, "KH_PDF_THUMBNAIL_DIR", str(tmp_path), create=True
+    ):
+        assert pdf_loader.PDFThumbnailReader().thumbnail_dir == str(tmp_path)
+        # the thumbnails can still be inlined
+        assert pdf_loader.PDFThumbnailReader(thumbnail_dir=None).thumbnail_dir is None
+
+
+def test_pdf_thumbnails_in_parallel(tmp_path):
+    from kotaemon.loaders import pdf_loader
+
+    file_path = Path(__file__).parent / "resources" / "multimodal.pdf"
+    with patch.object(pdf_loader, "PDF_THUMBNAIL_PAGES_PER_WORKER", 1):
+        assert pdf_loader.split_page_ranges([0, 1, 2], workers=2) == [[0, 1], [2]]
+        thumbnails = pdf_loader.get_page_thumbnails(
+            file_path, [0, 1, 2], output_dir=tmp_path, workers=2
+        )
+
+    assert thumbnails == [str(tmp_path / f"{page}_40.png") for page in range(3)]
+    assert all(Path(thumbnail).exists() for thumbnail in thumbnails)
+
+
+def test_pdf_lazy_thumbnails(tmp_path):
+    from kotaemon.embeddings import AzureOpenAIEmbeddings
+    from kotaemon.indices import VectorRetrieval
+    from kotaemon.loaders import pdf_loader
+    from kotaemon.storages import InMemoryVectorStore
+
+    file_path = Path(__file__).parent / "resources" / "multimodal.pdf"
+    reader = pdf_loader.PDFThumbnailReader(thumbnail_mode="lazy")
+    documents = reader.load_data(file_path, extra_info={"file_path": str(file_path)})
+    thumbnails = [doc for doc in documents if doc.metadata.get("type") == "thumbnail"]
+    assert [doc.metadata["thumbnail_page"] for doc in thumbnails] == [0, 1, 2]
+    assert "image_origin" not in thumbnails[0].metadata
+
+    # rendered on retrieval, then served from the cache
+    retrieval = VectorRetrieval(
+        vector_store=InMemoryVectorStore(),
+        embedding=AzureOpenAIEmbeddings(
+            azure_deployment="text-embedding-ada-002",
+            azure_endpoint="https://test.openai.azure.com/",
+            api_key="some-key",
+            api_version="version",
+        ),
+        thumbnail_cache_dir=str(tmp_path),
+    )
+    retrieval._load_thumbnail(thumbnails[1])
+    assert thumbnails[1].metadata["image_origin"].startswith("data:image/")
+    file_hash = thumbnails[1].metadata["file_hash"]
+    assert len(list((tmp_path / file_hash).iterdir())) == 1
+
+
+def test_thumbnail_cache_eviction(tmp_path):
+    from kotaemon.loaders.pdf_loader import PageThumbnailCache
+
+    file_path = Path(__file__).parent / "resources" / "multimodal.pdf"
+    cache = PageThumbnailCache(tmp_path, max_bytes=1)
+    first = cache.get(file_path, "hash", 0)
+    assert first.exists()
+
+    # the cache is full: the least recently used thumbnail is evicted
+    second = cache.get(file_path, "hash", 1)
+    assert second.exists() and not first.exists()
+    assert cache.size == second.stat().st_size
+
+    cache = PageThumbnailCache(tmp_path, max_bytes=1 << 20)
+    assert cache.get(file_path, "hash", 1) == second
+    assert cache.size == second.stat().st_size
+
+
+def test_pdf_text_in_parallel():
+    from kotaemon.loaders import pdf_loader
+
+    file_path = Path(__file__).parent / "resources" / "multimodal.pdf"
+    reader = pdf_loader.PDFThumbnailReader(thumbnail_mode="lazy", text_workers=2)
+    with patch.object(pdf_loader, "PDF_TEXT_PAGES_PER_WORKER", 1):
+        documents = reader.load_data(file_path, extra_info={"source": "test"})
+    pages = [doc for doc in documents if doc.metadata.get("type") != "thumbnail"]
+
+    serial_pages = pdf_loader.PDFThumbnailReader(thumbnail_mode="lazy").load_data(
+        file_path
+    )
+    serial_pages = [doc for doc in serial_pages if "thumbnail_page" not in doc.metadata]
+    assert [doc.metadata["page_label"] for doc in pages] == [
+        doc.metadata["page_label"] for doc in serial_pages
+    ]
+    assert all(doc.metadata["source"] == "test" for doc in pages)
+    assert all(doc.text.strip() for doc in pages)
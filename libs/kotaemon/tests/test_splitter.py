@@ -2,6 +2,7 @@ from llama_index.core.schema import NodeRelationship
 
 from kotaemon.base import Document
 from kotaemon.indices.splitters import TokenSplitter
+from kotaemon.tokenizers import TokenCountCache, count_tokens, get_token_func
 
 source1 = Document(
     content="The City Hall and Raffles Place MRT stations are paired cross-platform "
@@ -53,3 +54,23 @@ def test_split_token():
     )
     assert chunks[1].relationships[NodeRelationship.NEXT].node_id == chunks[2].doc_id
     assert chunks[-1].relationships[NodeRelationship.SOURCE].node_id == source2.doc_id
+
+
+def test_token_counts_memoized():
+    """Test that token counts are shared per document id and refreshed on change"""
+    assert get_token_func() is get_token_func()
+
+    cache = TokenCountCache(max_size=2)
+    doc = Document(content="hello world", id_="chunk-1")
+    assert cache.count([doc, source1]) == [
+        count_tokens("hello world"),
+        count_tokens(source1.text),
+    ]
+    assert len(cache) == 2
+
+    # changed text with the same id is counted again
+    doc.text = "hello there world"
+    assert cache.count([doc]) == [count_tokens("hello there world")]
+
+    cache.count([source2])
+    assert len(cache) == 2
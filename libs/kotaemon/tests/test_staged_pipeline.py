@@ -0,0 +1,61 @@
+import pytest
+
+from kotaemon.indices.ingests import StagedPipeline
+
+
+def batch(items, size=3):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def test_staged_pipeline_order_and_metrics():
+    def square(numbers):
+        for number in numbers:
+            yield number * number
+
+    def total(batches):
+        for numbers in batches:
+            pipeline.add_count("total", len(numbers))
+            pipeline.report(f"summed {len(numbers)}")
+            yield sum(numbers)
+
+    pipeline = StagedPipeline(
+        [("square", square), ("batch", batch), ("total", total)], maxsize=1
+    )
+    outputs = list(pipeline.run(range(7)))
+
+    sums = [item for item in outputs if isinstance(item, int)]
+    assert sums == [0 + 1 + 4, 9 + 16 + 25, 36]
+    assert [item for item in outputs if isinstance(item, str)] == [
+        "summed 3",
+        "summed 3",
+        "summed 1",
+    ]
+    assert [metrics.name for metrics in pipeline.metrics] == [
+        "source",
+        "square",
+        "batch",
+        "total",
+    ]
+    assert pipeline.metrics[0].items_out == 7
+    assert pipeline.metrics[2].items_in == 7
+    assert pipeline.metrics[2].items_out == 3
+    assert pipeline.metrics[3].count == 7
+
+
+def test_staged_pipeline_raises_stage_error():
+    def fail(numbers):
+        for number in numbers:
+            if number == 3:
+                raise ValueError("bad number")
+            yield number
+
+    pipeline = StagedPipeline([("fail", fail)], maxsize=1)
+    with pytest.raises(ValueError, match="bad number"):
+        list(pipeline.run(range(100)))
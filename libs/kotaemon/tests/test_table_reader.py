@@ -1,9 +1,14 @@
 import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 
 import pytest
 
 from kotaemon.loaders import MathpixPDFReader, OCRReader, PandasExcelReader
+from kotaemon.loaders import ocr_loader
+from kotaemon.loaders.ocr_loader import ocr_pages
 
 from .conftest import skip_when_unstructured_pdf_not_installed
 
@@ -36,6 +41,91 @@ def test_ocr_reader(fullocr_output):
     assert len(table_docs) == 2
 
 
+def test_ocr_pages(monkeypatch):
+    requests_by_page: dict[str, int] = {}
+
+    class StandInOCRHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            page = re.search(rb'filename="(page_\d+)\.png"', body).group(1).decode()
+            requests_by_page[page] = requests_by_page.get(page, 0) + 1
+            if page == "page_1" and requests_by_page[page] == 1:
+                # the first attempt of a page fails, only this page is sent again
+                self.send_response(500)
+                self.end_headers()
+                return
+
+            content = json.dumps(
+                {"result": [{"image": page, "json": {"ocr": [], "table": []}}]}
+            ).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInOCRHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        results = ocr_pages(
+            f"http://127.0.0.1:{server.server_port}/",
+            Path(__file__).parent / "resources" / "multimodal.pdf",
+            table_only=False,
+            workers=2,
+        )
+    finally:
+        server.shutdown()
+
+    assert [result["image"] for result in results] == ["page_0", "page_1", "page_2"]
+    assert requests_by_page == {"page_0": 1, "page_1": 2, "page_2": 1}
+
+    # a page that fails every attempt fails the file, instead of being left empty
+    requests_by_page.clear()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInOCRHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with pytest.raises(RuntimeError, match="page_1.png"):
+            ocr_pages(
+                f"http://127.0.0.1:{server.server_port}/",
+                Path(__file__).parent / "resources" / "multimodal.pdf",
+                table_only=False,
+                workers=2,
+                retries=1,
+            )
+    finally:
+        server.shutdown()
+
+    # once a page has failed, the next pages are neither rendered nor sent
+    rendered = []
+
+    def render_pages(file_path, dpi):
+        for idx in range(1, 10):
+            rendered.append(idx)
+            yield f"page_{idx}.png", b"png"
+
+    monkeypatch.setattr(ocr_loader, "render_ocr_pages", render_pages)
+    requests_by_page.clear()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInOCRHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with pytest.raises(RuntimeError, match="page_1.png"):
+            ocr_pages(
+                f"http://127.0.0.1:{server.server_port}/",
+                Path("scan.pdf"),
+                table_only=False,
+                workers=1,
+                retries=1,
+            )
+    finally:
+        server.shutdown()
+
+    assert requests_by_page == {"page_1": 1}
+    assert rendered == [1, 2, 3]
+
+
 def test_mathpix_reader(mathpix_output):
     reader = MathpixPDFReader()
     documents = reader.load_data(input_file, response_content=mathpix_output)
@@ -49,3 +139,24 @@ def test_excel_reader():
         input_file_excel,
     )
     assert len(documents) == 1
+
+
+def test_excel_reader_streaming():
+    reader = PandasExcelReader(streaming=True, block_tokens=1)
+    documents = reader.load_data(input_file_excel, extra_info={"file_name": "x"})
+    header = documents[0].text.split("\n")[0]
+
+    assert len(documents) > 1
+    # one row per block, each block repeats the header of its sheet
+    for doc in documents:
+        lines = doc.text.split("\n")
+        assert len(lines) == 2 and lines[0] == header
+        assert doc.metadata["row_start"] == doc.metadata["row_end"]
+        assert doc.metadata["sheet_name"] == "Sheet1"
+        assert doc.metadata["file_name"] == "x"
+    assert [doc.metadata["row_start"] for doc in documents] == sorted(
+        {doc.metadata["row_start"] for doc in documents}
+    )
+
+    documents = PandasExcelReader(streaming=True).load_data(input_file_excel)
+    assert len(documents) == 1
@@ -3,10 +3,11 @@ import os
 
 import pytest
 
-from kotaemon.base import DocumentWithEmbedding
+from kotaemon.base import DocumentWithEmbedding, EmbeddingMatrix
 from kotaemon.storages import (
     ChromaVectorStore,
     InMemoryVectorStore,
+    MatryoshkaVectorStore,
     MilvusVectorStore,
     QdrantVectorStore,
     SimpleFileVectorStore,
@@ -41,6 +42,22 @@ class TestChromaVectorStore:
         assert len(output) == 2, "Expected outputting 2 ids"
         assert db._collection.count() == 2, "Expected 2 added entries"
 
+    def test_add_from_matrix(self, tmp_path):
+        db = ChromaVectorStore(path=str(tmp_path))
+
+        embeddings = EmbeddingMatrix(
+            vectors=[[0.1, 0.2, 0.3], [0.4, 0.5, 0.6]],
+            ids=["1", "2"],
+            texts=["first", "second"],
+        )
+        metadatas = [{"a": 1, "b": 2}, {"a": 3, "b": 4}]
+        assert db._collection.count() == 0, "Expected empty collection"
+        output = db.add(embeddings, metadatas=metadatas)
+        assert output == ["1", "2"], "Expected output to be the matrix ids"
+        assert db._collection.count() == 2, "Expected 2 added entries"
+        stored = db._collection.get(ids=["1", "2"])
+        assert stored["documents"] == ["first", "second"], "Expected the texts"
+
     def test_delete(self, tmp_path):
         db = ChromaVectorStore(path=str(tmp_path))
 
@@ -131,6 +148,37 @@ class TestInMemoryVectorStore:
         ], "load function does not load data completely"
 
 
+class TestMatryoshkaVectorStore:
+    def test_add_query(self, tmp_path):
+        """Test that truncated vectors are stored and rescored with full ones"""
+        embeddings = EmbeddingMatrix(
+            vectors=[[1.0, 0.0, 0.0, 0.0], [0.8, 0.0, 0.6, 0.0], [0.0, 1.0, 0.0, 0.0]],
+            ids=["1", "2", "3"],
+        )
+        inner = InMemoryVectorStore()
+        db = MatryoshkaVectorStore(
+            inner,
+            dimensions=2,
+            rescore=True,
+            full_vector_path=str(tmp_path / "full.db"),
+        )
+        assert db.add(embeddings=embeddings) == ["1", "2", "3"]
+
+        # only the renormalized prefixes are in the wrapped store
+        stored, _, ids = inner.query(embedding=[1.0, 0.0], top_k=3)
+        assert set(ids[:2]) == {"1", "2"}
+        assert all(len(vector) == 2 for vector in stored)
+
+        # "1" and "2" tie on the prefix, the full vectors decide
+        _, scores, ids = db.query(embedding=[0.6, 0.0, 0.8, 0.0], top_k=2)
+        assert ids == ["2", "1"]
+        assert scores[0] == pytest.approx(0.96)
+
+        db.delete(["2"])
+        _, _, ids = db.query(embedding=[0.6, 0.0, 0.8, 0.0], top_k=1)
+        assert ids == ["1"]
+
+
 class TestSimpleFileVectorStore:
     def test_add_delete(self, tmp_path):
         """Test that delete func deletes correctly."""
@@ -0,0 +1,67 @@
+import os
+import time
+
+import pytest
+
+from kotaemon.loaders.utils.worker_pool import WarmProcessPool
+
+
+def _init_state():
+    return {"pid": os.getpid()}
+
+
+def _count(n: int):
+    for i in range(n):
+        yield i
+    time.sleep(30)
+
+
+def _work(state, action: str, value=None):
+    if action == "pid":
+        return state["pid"]
+    if action == "count":
+        return _count(value)
+    if action == "sleep":
+        time.sleep(value)
+    if action == "allocate":
+        data = bytearray(value)  # noqa: F841
+        time.sleep(30)
+    if action == "fail":
+        raise ValueError("cannot convert")
+    return value
+
+
+def test_warm_process_pool():
+    pool = WarmProcessPool(_init_state, _work, workers=1, timeout=5)
+    try:
+        # the state is created once per worker, in the worker process
+        pid = pool.run("pid")
+        assert pid != os.getpid()
+        assert pool.run("pid") == pid
+
+        with pytest.raises(RuntimeError, match="cannot convert"):
+            pool.run("fail")
+        assert pool.run("pid") == pid
+
+        # the items of a generator are sent back as they are produced
+        items = pool.stream("count", 3)
+        assert [next(items) for _ in range(3)] == [0, 1, 2]
+        items.close()
+
+        # a stuck call kills its worker, which is replaced
+        pool.timeout = 0.5
+        with pytest.raises(TimeoutError):
+            pool.run("sleep", 10)
+        pool.timeout = 20
+        assert pool.run("echo", 1) == 1
+        new_pid = pool.run("pid")
+        assert new_pid != pid
+        pid = new_pid
+
+        # so does a call using too much memory
+        pool.memory_limit = 200 * 1024 * 1024
+        with pytest.raises(MemoryError):
+            pool.run("allocate", 400 * 1024 * 1024)
+        assert pool.run("pid") != pid
+    finally:
+        pool.close()
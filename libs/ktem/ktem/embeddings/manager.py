@@ -42,7 +42,7 @@ class EmbeddingManager:
             items = sess.execute(stmt)
 
             for (item,) in items:
-                self._models[item.name] = deserialize(item.spec, safe=False)
+                self._models[item.name] = self._wrap(deserialize(item.spec, safe=False))
                 self._info[item.name] = {
                     "name": item.name,
                     "spec": item.spec,
@@ -52,6 +52,19 @@ class EmbeddingManager:
                     self._default = item.name
                     self._models["default"] = self._models[item.name]
 
+    def _wrap(self, model: BaseEmbeddings) -> BaseEmbeddings:
+        """Share one micro-batching layer per model across all requests, if enabled"""
+        if not getattr(flowsettings, "KH_EMBEDDINGS_MICRO_BATCH", False):
+            return model
+
+        from libs.kotaemon.kotaemon.embeddings import MicroBatchEmbeddings
+
+        return MicroBatchEmbeddings(
+            embedding=model,
+            max_batch_size=getattr(flowsettings, "KH_EMBEDDINGS_MICRO_BATCH_SIZE", 32),
+            max_wait_ms=getattr(flowsettings, "KH_EMBEDDINGS_MICRO_BATCH_WAIT_MS", 5),
+        )
+
     def load_vendors(self):
         from libs.kotaemon.kotaemon.embeddings import (
             AzureOpenAIEmbeddings,
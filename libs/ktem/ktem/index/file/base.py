@@ -57,6 +57,17 @@ class BaseFileIndexIndexing(BaseComponent):
     private = Param(False, help="Whether this is private index")
     chunk_size = Param(help="Chunk size for this index")
     chunk_overlap = Param(help="Chunk overlap for this index")
+    dedup_chunks = Param(
+        "off", help="Chunk deduplication before embedding: off, exact or near"
+    )
+    index_id = Param(None, help="The id of the file index")
+    root_dir = Param(
+        None,
+        help=(
+            "The files under this directory are named by their path relative to "
+            "it, e.g. in a directory sync, instead of by their file name"
+        ),
+    )
 
     def run(
         self, file_paths: str | Path | list[str | Path], *args, **kwargs
@@ -123,19 +134,18 @@ class BaseFileIndexIndexing(BaseComponent):
         Returns:
             the new file paths, relative to the file storage
         """
-        import shutil
-        from hashlib import sha256
+        from theflow.settings import settings
+
+        from .utils import store_content_addressed
 
         if not isinstance(file_paths, list):
             file_paths = [file_paths]
 
-        paths = []
-        for file_path in file_paths:
-            with open(file_path, "rb") as f:
-                paths.append(sha256(f.read()).hexdigest())
-            shutil.copy(file_path, self.FSPath / paths[-1])
-
-        return paths
+        mode = getattr(settings, "KH_FILE_STORAGE_MODE", "reflink")
+        return [
+            store_content_addressed(file_path, self.FSPath, mode)
+            for file_path in file_paths
+        ]
 
     def get_filestorage_path(self, rel_paths: str | list[str]) -> list[str]:
         """Get the file storage path for the relative path
@@ -7,7 +7,6 @@ from typing import Generator
 from uuid import uuid4
 
 import pandas as pd
-import tiktoken
 import yaml
 from decouple import config
 from ktem.db.models import engine
@@ -15,6 +14,7 @@ from sqlalchemy.orm import Session
 from theflow.settings import settings
 
 from kotaemon.base import Document, Param, RetrievedDocument
+from kotaemon.tokenizers import get_encoding
 
 from ..pipelines import BaseFileIndexRetriever, IndexDocumentPipeline, IndexPipeline
 from .visualize import create_knowledge_graph, visualize_graph
@@ -276,7 +276,7 @@ class GraphRAGRetrieverPipeline(BaseFileIndexRetriever):
             deployment_name=embedding_model,
             max_retries=20,
         )
-        token_encoder = tiktoken.get_encoding("cl100k_base")
+        token_encoder = get_encoding("cl100k_base")
 
         context_builder = LocalSearchMixedContext(
             community_reports=reports,
@@ -1,20 +1,27 @@
 import uuid
 from datetime import datetime
-from typing import Any, Optional, Type
+from typing import Any, Callable, Optional, Type
 
 from ktem.components import filestorage_path, get_docstore, get_vectorstore
 from ktem.db.engine import engine
 from libs.ktem.ktem.index.base import BaseIndex
-from sqlalchemy import JSON, Column, DateTime, Integer, String, UniqueConstraint
+from sqlalchemy import JSON, Column, DateTime
+from sqlalchemy import Index as SQLIndex
+from sqlalchemy import Integer, String, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.ext.mutable import MutableDict
 from theflow.settings import settings as flowsettings
 from theflow.utils.modules import import_dotted_string
 from tzlocal import get_localzone
 
-from libs.kotaemon.kotaemon.storages import BaseDocumentStore, BaseVectorStore
+from libs.kotaemon.kotaemon.storages import (
+    BaseDocumentStore,
+    BaseVectorStore,
+    MatryoshkaVectorStore,
+)
 
 from .base import BaseFileIndexIndexing, BaseFileIndexRetriever
+from .jobs import UNFINISHED_STATES, indexing_jobs
 
 
 def generate_uuid():
@@ -117,6 +124,19 @@ class FileIndex(BaseIndex):
             (Base,),
             {
                 "__tablename__": f"index__{self.id}__index",
+                # retrieval and deletion look records up by file or by chunk
+                "__table_args__": (
+                    SQLIndex(
+                        f"ix_index__{self.id}__index_source_relation",
+                        "source_id",
+                        "relation_type",
+                    ),
+                    SQLIndex(
+                        f"ix_index__{self.id}__index_target_relation",
+                        "target_id",
+                        "relation_type",
+                    ),
+                ),
                 "id": Column(Integer, primary_key=True, autoincrement=True),
                 "source_id": Column(String),
                 "target_id": Column(String),
@@ -150,9 +170,26 @@ class FileIndex(BaseIndex):
             },
         )
 
-        self._vs: BaseVectorStore = get_vectorstore(f"index_{self.id}")
+        self._vs: BaseVectorStore
         self._docstore: BaseDocumentStore = get_docstore(f"index_{self.id}")
         self._fs_path = filestorage_path / f"index_{self.id}"
+
+        dimensions = self.config.get("embedding_dimensions", 0)
+        if dimensions:
+            # truncated vectors live in their own collection, since the number of
+            # dimensions of a collection cannot change. The full vectors, if
+            # kept, go to a table next to it: the full size collection is not
+            # used
+            self._vs = MatryoshkaVectorStore(
+                get_vectorstore(f"index_{self.id}_dim{dimensions}"),
+                dimensions=dimensions,
+                rescore=self.config.get("rescore_full_vectors", False),
+                full_vector_path=str(
+                    filestorage_path / f"index_{self.id}_full_vectors.db"
+                ),
+            )
+        else:
+            self._vs = get_vectorstore(f"index_{self.id}")
         self._resources = {
             "Source": Source,
             "Index": Index,
@@ -336,6 +373,10 @@ class FileIndex(BaseIndex):
         import shutil
 
         self._setup_resources()
+        for job in indexing_jobs.list_jobs(
+            index_id=self.id, statuses=list(UNFINISHED_STATES)
+        ):
+            indexing_jobs.cancel(job["id"])
         self._resources["Source"].__table__.drop(engine)  # type: ignore
         self._resources["Index"].__table__.drop(engine)  # type: ignore
         self._resources["FileGroup"].__table__.drop(engine)  # type: ignore
@@ -343,9 +384,45 @@ class FileIndex(BaseIndex):
         self._docstore.drop()
         shutil.rmtree(self._fs_path)
 
+    def _migrate_tables(self):
+        """Add the table indexes missing from indices created by older versions"""
+        for table_index in self._resources["Index"].__table__.indexes:
+            table_index.create(engine, checkfirst=True)
+
+    def _run_indexing_job(self, job: dict, progress: Callable[[int], bool]):
+        """Embed the chunks of a file that were stored in quick-index mode"""
+        from ktem.embeddings.manager import embedding_models_manager
+
+        from .pipelines import IndexPipeline
+
+        pipeline = IndexPipeline(
+            splitter=None,
+            Source=self._resources["Source"],
+            Index=self._resources["Index"],
+            VS=self._vs,
+            DS=self._docstore,
+            FSPath=self._fs_path,
+            private=self.config.get("private", False),
+            index_id=self.id,
+            embedding=embedding_models_manager[
+                self.config.get(
+                    "embedding", embedding_models_manager.get_default_name()
+                )
+            ],
+        )
+        pipeline.embed_stored_chunks(
+            job["file_id"],
+            job["payload"]["chunk_ids"],
+            job["n_done"],
+            progress,
+            job["payload"].get("content_hashes"),
+        )
+
     def on_start(self):
         """Setup the classes and hooks"""
         self._setup_resources()
+        self._migrate_tables()
+        indexing_jobs.register(self.id, self._run_indexing_job)
         self._setup_indexing_cls()
         self._setup_retriever_cls()
         self._setup_file_index_ui_cls()
@@ -435,6 +512,41 @@ class FileIndex(BaseIndex):
                     "Set 0 to use developer setting."
                 ),
             },
+            "embedding_dimensions": {
+                "name": "Stored embedding dimensions",
+                "value": 0,
+                "component": "number",
+                "info": (
+                    "Only store the first N dimensions of each embedding "
+                    "(for Matryoshka models such as text-embedding-3). "
+                    "Set 0 to store the full embeddings. "
+                    "Changing this requires re-indexing the files."
+                ),
+            },
+            "rescore_full_vectors": {
+                "name": "Rescore with full embeddings",
+                "value": False,
+                "component": "radio",
+                "choices": [("Yes", True), ("No", False)],
+                "info": (
+                    "When storing reduced embeddings, keep the full embeddings on "
+                    "disk to re-rank the top candidates of each search."
+                ),
+            },
+            "dedup_chunks": {
+                "name": "Deduplicate chunks before embedding",
+                "value": "off",
+                "component": "dropdown",
+                "choices": [
+                    ("Off", "off"),
+                    ("Exact duplicates", "exact"),
+                    ("Exact and near-duplicates", "near"),
+                ],
+                "info": (
+                    "Embed and store repeated text (headers, disclaimers...) only "
+                    "once. Near-duplicates are detected within each file."
+                ),
+            },
         }
 
     def get_indexing_pipeline(self, settings, user_id) -> BaseFileIndexIndexing:
@@ -456,6 +568,8 @@ class FileIndex(BaseIndex):
         obj.private = self.config.get("private", False)
         obj.chunk_size = self.config.get("chunk_size", 0)
         obj.chunk_overlap = self.config.get("chunk_overlap", 0)
+        obj.dedup_chunks = self.config.get("dedup_chunks", "off")
+        obj.index_id = self.id
 
         return obj
 
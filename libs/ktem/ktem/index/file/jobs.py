@@ -0,0 +1,351 @@
+"""Durable queue of background indexing jobs, stored in the app database
+
+Quick-index mode stores the chunks of a file right away and leaves the
+embedding to a background job. The jobs are recorded in the app database, so
+their status survives restarts: unfinished jobs are resumed from their last
+progress when the index that owns them starts again.
+"""
+
+import logging
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Optional
+
+from ktem.db.engine import engine
+from sqlalchemy import JSON, Column, select, update
+from sqlalchemy.orm import Session
+from sqlmodel import Field, SQLModel
+from theflow.settings import settings
+from tzlocal import get_localzone
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+UNFINISHED_STATES = (PENDING, RUNNING)
+
+# a runner processes a job, calling `progress(n_done)` after each step. It stops
+# early when `progress` returns False, i.e. when the job was cancelled
+JobRunner = Callable[[dict, Callable[[int], bool]], None]
+
+
+class IndexingJob(SQLModel, table=True):
+    """A background indexing job
+
+    Attributes:
+        id: canonical id of the job
+        index_id: id of the file index that runs the job
+        file_id: id of the indexed file
+        file_name: name of the indexed file
+        kind: kind of work, e.g. "embedding"
+        status: pending, running, completed, failed or cancelled
+        payload: what the runner needs to do the job, e.g. the chunk ids
+        n_done: number of units of work done
+        n_total: number of units of work in the job
+        attempts: number of failed attempts
+        error: the error of the last failed attempt
+        next_attempt_at: timestamp before which the job is not retried
+    """
+
+    __table_args__ = {"extend_existing": True}
+    __tablename__ = "ktem__indexing_job"  # type: ignore
+
+    id: str = Field(
+        default_factory=lambda: uuid.uuid4().hex, primary_key=True, index=True
+    )
+    index_id: int = Field(index=True)
+    file_id: str = Field(default="", index=True)
+    file_name: str = Field(default="")
+    kind: str = Field(default="embedding")
+    status: str = Field(default=PENDING, index=True)
+    payload: dict = Field(default={}, sa_column=Column(JSON))
+    n_done: int = Field(default=0)
+    n_total: int = Field(default=0)
+    attempts: int = Field(default=0)
+    error: str = Field(default="")
+    next_attempt_at: float = Field(default=0.0)
+    date_created: datetime = Field(
+        default_factory=lambda: datetime.now(get_localzone())
+    )
+    date_updated: datetime = Field(
+        default_factory=lambda: datetime.now(get_localzone())
+    )
+
+
+IndexingJob.metadata.create_all(engine)
+
+
+class IndexingJobQueue:
+    """Run the indexing jobs of the app database in a pool of worker threads
+
+    Each file index registers a runner for its jobs. Jobs are retried with an
+    exponential backoff when their runner raises, and jobs interrupted by a
+    restart are resumed from their last recorded progress.
+
+    Example:
+        ```python
+        indexing_jobs.register(index_id, run_job)
+        job_id = indexing_jobs.submit(index_id, file_id, file_name, payload, 100)
+        indexing_jobs.status(job_id)  # {"status": "running", "n_done": 40, ...}
+        indexing_jobs.cancel(job_id)
+        ```
+
+    Args:
+        max_workers: maximum number of jobs running at the same time
+        max_attempts: number of attempts before a job is marked as failed
+        backoff_seconds: delay before the first retry, doubled at each retry
+        poll_interval: seconds between two checks for jobs to run
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 1,
+        max_attempts: int = 3,
+        backoff_seconds: float = 10.0,
+        poll_interval: float = 1.0,
+    ):
+        self.max_workers = max_workers
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.poll_interval = poll_interval
+
+        self._runners: dict[int, JobRunner] = {}
+        self._running: set[str] = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._dispatcher: Optional[threading.Thread] = None
+
+    def register(self, index_id: int, runner: JobRunner):
+        """Run the jobs of the index with `runner`, resuming its unfinished jobs"""
+        with Session(engine) as session:
+            # the jobs running when the app stopped were interrupted
+            session.execute(
+                update(IndexingJob)
+                .where(
+                    IndexingJob.index_id == index_id,
+                    IndexingJob.status == RUNNING,
+                )
+                .values(status=PENDING)
+            )
+            session.commit()
+
+        with self._lock:
+            self._runners[index_id] = runner
+        self._start()
+
+    def submit(
+        self,
+        index_id: int,
+        file_id: str,
+        file_name: str,
+        payload: dict,
+        n_total: int,
+        kind: str = "embedding",
+    ) -> str:
+        """Add a job to the queue and return its id"""
+        job = IndexingJob(
+            index_id=index_id,
+            file_id=file_id,
+            file_name=file_name,
+            kind=kind,
+            payload=payload,
+            n_total=n_total,
+        )
+        with Session(engine) as session:
+            session.add(job)
+            session.commit()
+            job_id = job.id
+
+        self._start()
+        return job_id
+
+    def status(self, job_id: str) -> Optional[dict]:
+        """Get the job as a dict, None if it does not exist"""
+        with Session(engine) as session:
+            job = session.get(IndexingJob, job_id)
+            return job.dict(exclude={"payload"}) if job else None
+
+    def list_jobs(
+        self,
+        index_id: Optional[int] = None,
+        file_id: Optional[str] = None,
+        statuses: Optional[list[str]] = None,
+    ) -> list[dict]:
+        """List the jobs, most recent first"""
+        stmt = select(IndexingJob)
+        if index_id is not None:
+            stmt = stmt.where(IndexingJob.index_id == index_id)
+        if file_id is not None:
+            stmt = stmt.where(IndexingJob.file_id == file_id)
+        if statuses:
+            stmt = stmt.where(IndexingJob.status.in_(statuses))  # type: ignore
+
+        with Session(engine) as session:
+            jobs = (
+                session.execute(
+                    stmt.order_by(IndexingJob.date_created.desc())  # type: ignore
+                )
+                .scalars()
+                .all()
+            )
+            return [job.dict(exclude={"payload"}) for job in jobs]
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a pending or running job, return whether it was cancelled
+
+        A running job stops after its current step.
+        """
+        with Session(engine) as session:
+            result = session.execute(
+                update(IndexingJob)
+                .where(
+                    IndexingJob.id == job_id,
+                    IndexingJob.status.in_(UNFINISHED_STATES),  # type: ignore
+                )
+                .values(status=CANCELLED, date_updated=datetime.now(get_localzone()))
+            )
+            session.commit()
+            return bool(result.rowcount)
+
+    def cancel_file_jobs(self, index_id: int, file_id: str) -> int:
+        """Cancel the unfinished jobs of a file, return the number of cancelled jobs"""
+        with Session(engine) as session:
+            result = session.execute(
+                update(IndexingJob)
+                .where(
+                    IndexingJob.index_id == index_id,
+                    IndexingJob.file_id == file_id,
+                    IndexingJob.status.in_(UNFINISHED_STATES),  # type: ignore
+                )
+                .values(status=CANCELLED, date_updated=datetime.now(get_localzone()))
+            )
+            session.commit()
+            return result.rowcount
+
+    def _start(self):
+        with self._lock:
+            if self._dispatcher is None:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="indexing-job"
+                )
+                self._dispatcher = threading.Thread(
+                    target=self._dispatch, name="indexing-job-dispatcher", daemon=True
+                )
+                self._dispatcher.start()
+        self._wakeup.set()
+
+    def _dispatch(self):
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            try:
+                for job_id in self._claim_jobs():
+                    assert self._pool is not None
+                    self._pool.submit(self._run, job_id)
+            except Exception:
+                logger.exception("Failed to dispatch the indexing jobs")
+
+    def _claim_jobs(self) -> list[str]:
+        """Mark the due jobs as running, within the concurrency limit"""
+        with self._lock:
+            n_free = self.max_workers - len(self._running)
+            index_ids = list(self._runners)
+        if n_free <= 0 or not index_ids:
+            return []
+
+        now = time.time()
+        claimed = []
+        with Session(engine) as session:
+            stmt = (
+                select(IndexingJob.id)
+                .where(
+                    IndexingJob.status == PENDING,
+                    IndexingJob.index_id.in_(index_ids),  # type: ignore
+                    IndexingJob.next_attempt_at <= now,
+                )
+                .order_by(IndexingJob.date_created)  # type: ignore
+                .limit(n_free)
+            )
+            for job_id in session.execute(stmt).scalars().all():
+                # another process may have claimed the job in the meantime
+                result = session.execute(
+                    update(IndexingJob)
+                    .where(IndexingJob.id == job_id, IndexingJob.status == PENDING)
+                    .values(status=RUNNING, date_updated=datetime.now(get_localzone()))
+                )
+                if result.rowcount:
+                    claimed.append(job_id)
+            session.commit()
+
+        with self._lock:
+            self._running.update(claimed)
+        return claimed
+
+    def _progress(self, job_id: str, n_done: int) -> bool:
+        """Record the progress of the job, return False if it was cancelled"""
+        with Session(engine) as session:
+            result = session.execute(
+                update(IndexingJob)
+                .where(IndexingJob.id == job_id, IndexingJob.status == RUNNING)
+                .values(n_done=n_done, date_updated=datetime.now(get_localzone()))
+            )
+            session.commit()
+            return bool(result.rowcount)
+
+    def _finish(self, job_id: str, **values):
+        values["date_updated"] = datetime.now(get_localzone())
+        with Session(engine) as session:
+            session.execute(
+                update(IndexingJob)
+                .where(IndexingJob.id == job_id, IndexingJob.status == RUNNING)
+                .values(**values)
+            )
+            session.commit()
+
+    def _run(self, job_id: str):
+        try:
+            with Session(engine) as session:
+                job = session.get(IndexingJob, job_id)
+                job_dict = job.dict() if job else None
+            if job_dict is None:
+                return
+
+            runner = self._runners[job_dict["index_id"]]
+            try:
+                runner(job_dict, lambda n_done: self._progress(job_id, n_done))
+            except Exception as e:
+                attempts = job_dict["attempts"] + 1
+                error = "".join(traceback.format_exception_only(type(e), e)).strip()
+                logger.exception(f"Indexing job {job_id} failed")
+                if attempts < self.max_attempts:
+                    delay = self.backoff_seconds * 2 ** (attempts - 1)
+                    self._finish(
+                        job_id,
+                        status=PENDING,
+                        attempts=attempts,
+                        error=error,
+                        next_attempt_at=time.time() + delay,
+                    )
+                else:
+                    self._finish(job_id, status=FAILED, attempts=attempts, error=error)
+            else:
+                self._finish(job_id, status=COMPLETED)
+        finally:
+            with self._lock:
+                self._running.discard(job_id)
+            self._wakeup.set()
+
+
+indexing_jobs = IndexingJobQueue(
+    max_workers=getattr(settings, "KH_INDEXING_JOB_WORKERS", 1),
+    max_attempts=getattr(settings, "KH_INDEXING_JOB_MAX_ATTEMPTS", 3),
+    backoff_seconds=getattr(settings, "KH_INDEXING_JOB_BACKOFF", 10.0),
+)
@@ -2,18 +2,21 @@ from __future__ import annotations
 
 import json
 import logging
-import shutil
+import multiprocessing
+import pickle
 import threading
 import time
 import warnings
 from collections import defaultdict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from copy import deepcopy
 from functools import lru_cache
 from hashlib import sha256
 from pathlib import Path
-from typing import Generator, Optional, Sequence
+from queue import Queue
+from typing import Callable, Generator, Iterable, Iterator, Optional, Sequence
 
-import tiktoken
 from decouple import config
 from ktem.db.models import engine
 from ktem.embeddings.manager import embedding_models_manager
@@ -28,14 +31,28 @@ from llama_index.core.vector_stores import (
     MetadataFilters,
 )
 from llama_index.core.vector_stores.types import VectorStoreQueryMode
-from sqlalchemy import delete, select
+from sqlalchemy import delete, insert, select
 from sqlalchemy.orm import Session
 from theflow.settings import settings
 from theflow.utils.modules import import_dotted_string
 
-from kotaemon.base import BaseComponent, Document, Node, Param, RetrievedDocument
+from kotaemon.base import (
+    BaseComponent,
+    Document,
+    EmbeddingMatrix,
+    Node,
+    Param,
+    RetrievedDocument,
+)
 from kotaemon.embeddings import BaseEmbeddings
-from kotaemon.indices import VectorIndexing, VectorRetrieval
+from kotaemon.indices import (
+    ChunkDeduplicator,
+    ChunkMatcher,
+    DedupResult,
+    VectorIndexing,
+    VectorRetrieval,
+)
+from kotaemon.indices.ingests import StagedPipeline
 from kotaemon.indices.ingests.files import (
     KH_DEFAULT_FILE_EXTRACTORS,
     adobe_reader,
@@ -46,11 +63,54 @@ from kotaemon.indices.ingests.files import (
 )
 from kotaemon.indices.rankings import BaseReranking, LLMReranking, LLMTrulensScoring
 from kotaemon.indices.splitters import BaseSplitter, TokenSplitter
+from kotaemon.loaders.cache import ParseCache, get_parse_cache, loader_cache_key
+from kotaemon.tokenizers import count_document_tokens, get_token_func
 
 from .base import BaseFileIndexIndexing, BaseFileIndexRetriever
+from .jobs import indexing_jobs
+from .utils import hash_file, pop_file_index_records, store_content_addressed
 
 logger = logging.getLogger(__name__)
 
+# the file id, the error message and the parsed documents of an indexed file
+FileIndexingResult = tuple[Optional[str], Optional[str], list[Document]]
+
+# serialize the updates of the checkpoints with the other updates of the file notes
+_checkpoint_lock = threading.Lock()
+# serialize the writes to the doc stores, which are not thread-safe (e.g.
+# SimpleFileDocumentStore saves the whole store on each write) and are shared by
+# the files indexed at the same time
+_docstore_lock = threading.Lock()
+
+# metadata that describe the whole file rather than a chunk
+FILE_METADATA_KEYS = {
+    "file_path",
+    "file_name",
+    "file_type",
+    "file_size",
+    "creation_date",
+    "last_modified_date",
+    "last_accessed_date",
+    "file_id",
+    "collection_name",
+}
+
+
+def collect(items: Iterable, into: list) -> Iterator:
+    """Yield the items, and append them to `into`"""
+    for item in items:
+        into.append(item)
+        yield item
+
+
+def yield_to_queue(generator: Generator, queue: Queue):
+    """Put every item of the generator into the queue, and return its value"""
+    while True:
+        try:
+            queue.put(next(generator))
+        except StopIteration as e:
+            return e.value
+
 
 @lru_cache
 def dev_settings():
@@ -74,7 +134,42 @@ def dev_settings():
     return file_extractors, chunk_size, chunk_overlap
 
 
-_default_token_func = tiktoken.encoding_for_model("gpt-3.5-turbo").encode
+def chunk_metadata(doc: Document) -> dict:
+    """The metadata of a chunk that do not describe the whole file"""
+    return {
+        key: value
+        for key, value in doc.metadata.items()
+        if key not in FILE_METADATA_KEYS
+    }
+
+
+def is_picklable_loader(loader: BaseReader) -> bool:
+    """Check if a loader can be sent to worker processes"""
+    try:
+        pickle.dumps(loader)
+        return True
+    except Exception:
+        return False
+
+
+@lru_cache
+def get_parse_pool(workers: int) -> ProcessPoolExecutor:
+    """Get the pool of `workers` processes shared by the pipelines to parse files
+
+    The processes are started with "spawn", so they do not inherit the threads and
+    locks of the serving process.
+    """
+    return ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    )
+
+
+def load_file(loader: BaseReader, file_path: str | Path, extra_info: dict):
+    """Parse a file, top-level so that it can run in a worker process"""
+    return loader.load_data(file_path, extra_info=extra_info)
+
+
+_default_token_func = get_token_func("gpt-3.5-turbo")
 
 
 class DocumentRetrievalPipeline(BaseFileIndexRetriever):
@@ -100,7 +195,7 @@ class DocumentRetrievalPipeline(BaseFileIndexRetriever):
     top_k: int = 5
     retrieval_mode: str = "hybrid"
 
-    @Node.auto(depends_on=["embedding", "VS", "DS"])
+    @Node.auto(depends_on=["embedding", "VS", "DS", "FSPath"])
     def vector_retrieval(self) -> VectorRetrieval:
         return VectorRetrieval(
             embedding=self.embedding,
@@ -108,6 +203,7 @@ class DocumentRetrievalPipeline(BaseFileIndexRetriever):
             doc_store=self.DS,
             retrieval_mode=self.retrieval_mode,  # type: ignore
             rerankers=self.rerankers,
+            file_storage_path=str(self.FSPath) if self.FSPath else None,
         )
 
     def run(
@@ -149,6 +245,7 @@ class DocumentRetrievalPipeline(BaseFileIndexRetriever):
             )
             results = session.execute(stmt)
             chunk_ids = [r[0].target_id for r in results.all()]
+            shared_vectors, shared_owners = self.get_shared_vectors(session, doc_ids)
 
         # do first round top_k extension
         retrieval_kwargs["do_extend"] = True
@@ -157,7 +254,7 @@ class DocumentRetrievalPipeline(BaseFileIndexRetriever):
             filters=[
                 MetadataFilter(
                     key="file_id",
-                    value=doc_ids,
+                    value=doc_ids + shared_owners,
                     operator=FilterOperator.IN,
                 )
             ],
@@ -173,6 +270,8 @@ class DocumentRetrievalPipeline(BaseFileIndexRetriever):
         s_time = time.time()
         print(f"retrieval_kwargs: {retrieval_kwargs.keys()}")
         docs = self.vector_retrieval(text=text, top_k=self.top_k, **retrieval_kwargs)
+        if shared_owners:
+            docs = self.resolve_shared_vectors(docs, doc_ids, shared_vectors)
         print("retrieval step took", time.time() - s_time)
 
         if not self.get_extra_table:
@@ -210,6 +309,78 @@ class DocumentRetrievalPipeline(BaseFileIndexRetriever):
 
         return docs
 
+    def get_shared_vectors(
+        self, session: Session, doc_ids: list[str]
+    ) -> tuple[dict[str, str], list[str]]:
+        """Get the vectors of other files that the selected files' chunks share
+
+        Returns:
+            the map from each shared vector id to the chunk of the selected files,
+            and the ids of the files that own those vectors
+        """
+        selected_chunks = select(self.Index.target_id).where(
+            self.Index.relation_type == "document",
+            self.Index.source_id.in_(doc_ids),
+        )
+        shared_vectors = {
+            vector_id: chunk_id
+            for vector_id, chunk_id in session.execute(
+                select(self.Index.source_id, self.Index.target_id).where(
+                    self.Index.relation_type == "duplicate",
+                    self.Index.target_id.in_(selected_chunks),
+                )
+            )
+        }
+        if not shared_vectors:
+            return {}, []
+
+        owners = session.execute(
+            select(self.Index.source_id)
+            .where(
+                self.Index.relation_type.in_(["vector", "shared_vector"]),
+                self.Index.target_id.in_(list(shared_vectors)),
+            )
+            .distinct()
+        )
+        selected = set(doc_ids)
+        return shared_vectors, [each[0] for each in owners if each[0] not in selected]
+
+    def resolve_shared_vectors(
+        self,
+        docs: list[RetrievedDocument],
+        doc_ids: list[str],
+        shared_vectors: dict[str, str],
+    ) -> list[RetrievedDocument]:
+        """Replace the chunks of other files with the selected files' duplicates"""
+        selected = set(doc_ids)
+        resolved: list[RetrievedDocument | str] = []
+        for doc in docs:
+            if doc.metadata.get("file_id") in selected:
+                resolved.append(doc)
+            elif doc.doc_id in shared_vectors:
+                resolved.append(doc.doc_id)
+
+        own_chunks = {
+            chunk.doc_id: chunk
+            for chunk in self.DS.get(
+                [shared_vectors[each] for each in resolved if isinstance(each, str)]
+            )
+        }
+        scores = {doc.doc_id: doc.score for doc in docs}
+
+        output, seen = [], set()
+        for each in resolved:
+            if isinstance(each, str):
+                chunk = own_chunks.get(shared_vectors[each])
+                if chunk is None:
+                    continue
+                each = RetrievedDocument(**chunk.to_dict(), score=scores[each])
+            if each.doc_id not in seen:
+                seen.add(each.doc_id)
+                output.append(each)
+
+        return output
+
     def generate_relevant_scores(
         self, query: str, documents: list[RetrievedDocument]
     ) -> list[RetrievedDocument]:
@@ -331,6 +502,7 @@ class IndexPipeline(BaseComponent):
     loader: BaseReader
     splitter: BaseSplitter | None
     chunk_batch_size: int = 200
+    doc_batch_size: int = 8
 
     Source = Param(help="The SQLAlchemy Source table")
     Index = Param(help="The SQLAlchemy Index table")
@@ -338,9 +510,27 @@ class IndexPipeline(BaseComponent):
     DS = Param(help="The DocStore")
     FSPath = Param(help="The file storage path")
     user_id = Param(help="The user id")
+    file_storage_mode: str = Param(
+        getattr(settings, "KH_FILE_STORAGE_MODE", "reflink"),
+        help="How to store files: reflink, hardlink or copy",
+    )
     collection_name: str = "default"
     private: bool = False
     run_embedding_in_thread: bool = False
+    dedup_chunks: str = "off"
+    incremental_reindex: bool = False
+    index_id = Param(None, help="The id of the file index, to queue jobs")
+    root_dir = Param(
+        None,
+        help=(
+            "The files under this directory are named by their path relative to "
+            "it, e.g. in a directory sync, instead of by their file name"
+        ),
+    )
+    parse_cache_dir = Param(
+        getattr(settings, "KH_PARSE_CACHE_DIR", None),
+        help="The cache of the parsed files, disabled if None",
+    )
     embedding: BaseEmbeddings
 
     @Node.auto(depends_on=["Source", "Index", "embedding"])
@@ -349,120 +539,529 @@ class IndexPipeline(BaseComponent):
             vector_store=self.VS, doc_store=self.DS, embedding=self.embedding
         )
 
-    def handle_docs(self, docs, file_id, file_name) -> Generator[Document, None, int]:
-        s_time = time.time()
-        text_docs = []
-        non_text_docs = []
-        thumbnail_docs = []
+    @Node.auto(depends_on=["dedup_chunks"])
+    def deduplicator(self) -> ChunkDeduplicator:
+        return ChunkDeduplicator(near_duplicate=self.dedup_chunks == "near")
 
-        for doc in docs:
-            doc_type = doc.metadata.get("type", "text")
-            if doc_type == "text":
-                text_docs.append(doc)
-            elif doc_type == "thumbnail":
-                thumbnail_docs.append(doc)
-            else:
-                non_text_docs.append(doc)
+    def handle_docs(
+        self,
+        docs: Iterable[Document],
+        file_id,
+        file_name,
+        previous: Optional[list[Document]] = None,
+    ) -> Generator[Document, None, tuple[int, Optional[int]]]:
+        """Split, store and embed the documents of a file
+
+        The documents go through the stages split -> doc store -> embedding ->
+        vector store in batches of `doc_batch_size` documents. The stages run
+        concurrently, connected by bounded queues, so that e.g. a batch is split
+        and stored while the previous batch is embedded, and only a few batches
+        are in memory at any time.
+
+        `docs` can be an iterator of the documents as they are parsed, in which
+        case the first batches are indexed while the file is still parsed. The
+        thumbnails are then only linked to the chunks that come after them.
+
+        When `previous` is given, it is the list of chunks already stored for the
+        file. The new chunks with the same content keep the id of the old ones and
+        are not stored nor embedded again, and the old chunks without counterpart
+        are deleted.
+
+        The number of tokens of each chunk is counted as it is split, and stored
+        in its "token_count" metadata. The chunks are also exported to
+        `KH_CHUNKS_OUTPUT_DIR` (if set) by a background writer.
 
-        print(f"Got {len(thumbnail_docs)} page thumbnails")
-        page_label_to_thumbnail = {
-            doc.metadata["page_label"]: doc.doc_id for doc in thumbnail_docs
-        }
+        Returns:
+            the number of chunks and the number of tokens of the file (None if
+            tokens are not counted)
+        """
+        s_time = time.time()
+        matcher = ChunkMatcher(previous) if previous is not None else None
+        reused: dict[str, Document] = {}
+        # the stored chunks without vector, e.g. after an interruption
+        embedded_ids = (
+            self.get_embedded_ids(file_id) if matcher is not None and self.VS else None
+        )
+        page_label_to_thumbnail: dict[str, str] = {}
+
+        def add_thumbnail(doc: Document, position: int):
+            if matcher is not None:
+                self._reuse_chunk(matcher, doc, position, reused)
+            page_label_to_thumbnail[doc.metadata["page_label"]] = doc.doc_id
+
+        streamed = not isinstance(docs, list)
+        if not streamed:
+            for position, doc in enumerate(docs):
+                if doc.metadata.get("type", "text") == "thumbnail":
+                    add_thumbnail(doc, position)
+            print(f"Got {len(page_label_to_thumbnail)} page thumbnails")
+
+        dedup = self.dedup_chunks != "off" and bool(self.VS)
+        # the content hash of each chunk to embed first, recorded once its vector
+        # is stored
+        content_hashes: dict[str, str] = {}
+        n_chunks = 0
+        n_duplicates = 0
+        n_split = 0
+        n_tokens: Optional[int] = None
+        self.vector_indexing.clear_chunk_files(file_name)
+
+        def batch_docs(items: Iterable[Document]):
+            batch: list[Document] = []
+            for position, doc in enumerate(items):
+                if streamed and doc.metadata.get("type", "text") == "thumbnail":
+                    add_thumbnail(doc, position)
+                batch.append(doc)
+                if len(batch) >= self.doc_batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+
+        def split(batches):
+            nonlocal n_split, n_tokens
+            for batch in batches:
+                text_docs, other_docs = [], []
+                for doc in batch:
+                    if doc.metadata.get("type", "text") == "text":
+                        text_docs.append(doc)
+                    else:
+                        other_docs.append(doc)
+
+                chunks = self.splitter(text_docs) if self.splitter else text_docs
+
+                # add the thumbnails doc_id to the chunks
+                for chunk in chunks:
+                    page_label = chunk.metadata.get("page_label", None)
+                    if page_label and page_label in page_label_to_thumbnail:
+                        chunk.metadata["thumbnail_doc_id"] = page_label_to_thumbnail[
+                            page_label
+                        ]
+
+                pipeline.add_count("split", len(chunks))
+                token_counts = self.count_tokens(chunks + other_docs)
+                if token_counts is not None:
+                    for chunk, token_count in zip(chunks + other_docs, token_counts):
+                        chunk.metadata["token_count"] = token_count
+                    n_tokens = (n_tokens or 0) + sum(token_counts)
+
+                # export all the chunks, including the unchanged ones, off the
+                # embedding path
+                self.vector_indexing.write_chunk_to_file(chunks + other_docs)
+
+                to_update, to_repair = [], []
+                if matcher is not None:
+                    # keep only the chunks whose content changed
+                    for chunk in chunks + other_docs:
+                        n_split += 1
+                        if chunk.doc_id in reused or self._reuse_chunk(
+                            matcher, chunk, n_split, reused
+                        ):
+                            old_chunk = reused[chunk.doc_id]
+                            if chunk_metadata(chunk) != chunk_metadata(old_chunk):
+                                to_update.append(chunk)
+                            if (
+                                embedded_ids is not None
+                                and chunk.doc_id not in embedded_ids
+                            ):
+                                to_repair.append(chunk)
+                    chunks = [c for c in chunks if c.doc_id not in reused]
+                    other_docs = [d for d in other_docs if d.doc_id not in reused]
+                yield chunks, other_docs, to_update, to_repair
+            self.vector_indexing.close_chunk_file(file_name)
+
+        def store(batches):
+            # the only stage writing to the doc store of this file. The files
+            # indexed at the same time share the doc store: see `_docstore_lock`
+            nonlocal n_chunks, n_duplicates
+            for chunks, other_docs, to_update, to_repair in batches:
+                to_index_chunks = chunks + other_docs
+                to_embed_chunks = to_index_chunks
+
+                # the unchanged chunks whose metadata changed
+                if to_update:
+                    self.update_chunks_docstore(to_update)
+
+                # a vector may have been written without its record
+                if to_repair:
+                    self.VS.delete([chunk.doc_id for chunk in to_repair])
+
+                # embed and store the repeated text chunks only once
+                if dedup and chunks:
+                    result = self.deduplicate_chunks(chunks)
+                    to_embed_chunks = result.unique + other_docs
+                    self.handle_duplicates(result)
+                    content_hashes.update(
+                        {chunk_id: hash_ for hash_, chunk_id in result.hashes.items()}
+                    )
+                    n_duplicates += len(result.duplicates)
+
+                self.handle_chunks_docstore(to_index_chunks, file_id)
+                n_chunks += len(to_index_chunks)
+                pipeline.add_count("docstore", len(to_index_chunks))
+                pipeline.report(
+                    Document(
+                        f" => [{file_name}] Processed {n_chunks} chunks",
+                        channel="debug",
+                    )
+                )
+                yield to_embed_chunks + to_repair
+
+        def embed(batches):
+            # re-batch, since the number of chunks per batch of documents varies
+            pending: list[Document] = []
+            for chunks in batches:
+                pending.extend(chunks)
+                while len(pending) >= self.chunk_batch_size:
+                    chunks = pending[: self.chunk_batch_size]
+                    pending = pending[self.chunk_batch_size :]
+                    yield chunks, self.embed_chunks(chunks)
+                    vector_pipeline.add_count("embed", len(chunks))
+            if pending:
+                yield pending, self.embed_chunks(pending)
+                vector_pipeline.add_count("embed", len(pending))
+
+        def index(batches):
+            n_embedded = 0
+            for chunks, embeddings in batches:
+                self.handle_chunks_vectorstore(
+                    chunks, file_id, embeddings, content_hashes
+                )
+                n_embedded += len(chunks)
+                vector_pipeline.add_count("vectorstore", len(chunks))
+                if self.VS:
+                    vector_pipeline.report(
+                        Document(
+                            f" => [{file_name}] Created embedding for "
+                            f"{n_embedded} chunks",
+                            channel="debug",
+                        )
+                    )
+                yield n_embedded
 
-        if self.splitter:
-            all_chunks = self.splitter(text_docs)
+        vector_stages = [("embed", embed), ("vectorstore", index)]
+        if self.run_embedding_in_thread:
+            # embed in the background once all chunks are in the doc store
+            pipeline = StagedPipeline(
+                [("split", split), ("docstore", store)], source_name="documents"
+            )
         else:
-            all_chunks = text_docs
-
-        # add the thumbnails doc_id to the chunks
-        for chunk in all_chunks:
-            page_label = chunk.metadata.get("page_label", None)
-            if page_label and page_label in page_label_to_thumbnail:
-                chunk.metadata["thumbnail_doc_id"] = page_label_to_thumbnail[page_label]
+            pipeline = StagedPipeline(
+                [("split", split), ("docstore", store)] + vector_stages,
+                source_name="documents",
+            )
+        vector_pipeline = pipeline
 
-        to_index_chunks = all_chunks + non_text_docs + thumbnail_docs
+        to_embed_batches = []
+        for output in pipeline.run(batch_docs(docs)):
+            if isinstance(output, Document):
+                yield output
+            elif self.run_embedding_in_thread:
+                to_embed_batches.append(output)
 
-        # add to doc store
-        chunks = []
-        n_chunks = 0
-        chunk_size = self.chunk_batch_size * 4
-        for start_idx in range(0, len(to_index_chunks), chunk_size):
-            chunks = to_index_chunks[start_idx : start_idx + chunk_size]
-            self.handle_chunks_docstore(chunks, file_id)
-            n_chunks += len(chunks)
+        if n_duplicates:
             yield Document(
-                f" => [{file_name}] Processed {n_chunks} chunks",
+                f" => [{file_name}] Skipped embedding of "
+                f"{n_duplicates} duplicate chunks",
                 channel="debug",
             )
 
-        def insert_chunks_to_vectorstore():
-            chunks = []
-            n_chunks = 0
-            chunk_size = self.chunk_batch_size
-            for start_idx in range(0, len(to_index_chunks), chunk_size):
-                chunks = to_index_chunks[start_idx : start_idx + chunk_size]
-                self.handle_chunks_vectorstore(chunks, file_id)
-                n_chunks += len(chunks)
-                if self.VS:
-                    yield Document(
-                        f" => [{file_name}] Created embedding for {n_chunks} chunks",
-                        channel="debug",
-                    )
+        if matcher is not None:
+            removed = self.delete_chunks(
+                file_id, [chunk.doc_id for chunk in matcher.unmatched]
+            )
+            n_chunks += matcher.reused
+            yield Document(
+                f" => [{file_name}] Reused {matcher.reused} unchanged chunks, "
+                f"removed {removed} outdated chunks",
+                channel="debug",
+            )
 
-        # run vector indexing in thread if specified
-        if self.run_embedding_in_thread:
+        if self.run_embedding_in_thread and self.index_id is not None:
+            chunk_ids = [chunk.doc_id for batch in to_embed_batches for chunk in batch]
+            if chunk_ids and self.VS:
+                job_id = indexing_jobs.submit(
+                    self.index_id,
+                    file_id,
+                    file_name,
+                    payload={"chunk_ids": chunk_ids, "content_hashes": content_hashes},
+                    n_total=len(chunk_ids),
+                )
+                yield Document(
+                    f" => [{file_name}] Queued embedding of {len(chunk_ids)} "
+                    f"chunks (job {job_id})",
+                    channel="debug",
+                )
+        elif self.run_embedding_in_thread:
             print("Running embedding in thread")
+            vector_pipeline = StagedPipeline(vector_stages, source_name="chunks")
             threading.Thread(
-                target=lambda: list(insert_chunks_to_vectorstore())
+                target=lambda: list(vector_pipeline.run(to_embed_batches))
             ).start()
-        else:
-            yield from insert_chunks_to_vectorstore()
+
+        for metrics in pipeline.metrics[1:]:
+            yield Document(f" => [{file_name}] {metrics}", channel="debug")
 
         print("indexing step took", time.time() - s_time)
-        return n_chunks
+        return n_chunks, n_tokens
 
-    def handle_chunks_docstore(self, chunks, file_id):
-        """Run chunks"""
-        # run embedding, add to both vector store and doc store
-        self.vector_indexing.add_to_docstore(chunks)
+    def _reuse_chunk(
+        self,
+        matcher: ChunkMatcher,
+        chunk: Document,
+        position: int,
+        reused: dict[str, Document],
+    ) -> bool:
+        """Give the chunk the id of the stored chunk with the same content, if any"""
+        old_chunk = matcher.match(chunk, position)
+        if old_chunk is None:
+            return False
+        chunk.id_ = old_chunk.doc_id
+        reused[chunk.doc_id] = old_chunk
+        return True
+
+    def get_file_chunks(self, file_id: str, repair: bool = False) -> list[Document]:
+        """Get the chunks stored for the file, in the order they were indexed
 
-        # record in the index
+        Args:
+            file_id: the id of the file
+            repair: remove the records of the chunks missing from the doc store,
+                e.g. after an interruption between recording and storing them
+        """
         with Session(engine) as session:
-            nodes = []
-            for chunk in chunks:
-                nodes.append(
-                    self.Index(
-                        source_id=file_id,
-                        target_id=chunk.doc_id,
-                        relation_type="document",
+            stmt = (
+                select(self.Index.target_id)
+                .where(
+                    self.Index.source_id == file_id,
+                    self.Index.relation_type == "document",
+                )
+                .order_by(self.Index.id)
+            )
+            doc_ids = [each[0] for each in session.execute(stmt)]
+
+        if not doc_ids:
+            return []
+        try:
+            docs = {doc.doc_id: doc for doc in self.DS.get(doc_ids)}
+        except KeyError:
+            # some doc stores raise on missing ids
+            docs = {}
+            for doc_id in doc_ids:
+                try:
+                    docs.update({doc.doc_id: doc for doc in self.DS.get([doc_id])})
+                except KeyError:
+                    continue
+
+        missing_ids = [doc_id for doc_id in doc_ids if doc_id not in docs]
+        if repair and missing_ids:
+            with Session(engine) as session:
+                session.execute(
+                    delete(self.Index).where(
+                        self.Index.source_id == file_id,
+                        self.Index.target_id.in_(missing_ids),
                     )
                 )
-            session.add_all(nodes)
+                session.commit()
+            if self.VS:
+                self.VS.delete(missing_ids)
+        return [docs[doc_id] for doc_id in doc_ids if doc_id in docs]
+
+    def get_embedded_ids(self, file_id: str) -> set[str]:
+        """Get the ids of the chunks of the file that have a vector"""
+        with Session(engine) as session:
+            vector_ids = select(self.Index.target_id).where(
+                self.Index.source_id == file_id,
+                self.Index.relation_type == "vector",
+            )
+            # deduplicated chunks use the vector of another chunk
+            duplicate_ids = select(self.Index.target_id).where(
+                self.Index.relation_type == "duplicate",
+                self.Index.target_id.in_(
+                    select(self.Index.target_id).where(
+                        self.Index.source_id == file_id,
+                        self.Index.relation_type == "document",
+                    )
+                ),
+            )
+            return set(session.execute(vector_ids.union(duplicate_ids)).scalars())
+
+    def get_checkpoint(self, file_id: str) -> Optional[dict]:
+        """Get the checkpoint of the file if its indexing was interrupted"""
+        with Session(engine) as session:
+            source = session.get(self.Source, file_id)
+            checkpoint = (source.note or {}).get("checkpoint") if source else None
+        if not checkpoint or checkpoint.get("complete", True):
+            return None
+        return checkpoint
+
+    def save_checkpoint(self, file_id: str, reset: bool = False, **values):
+        """Record the progress of the indexing of the file in its note
+
+        Args:
+            file_id: the id of the file
+            reset: start a new checkpoint instead of updating the current one
+            **values: the progress to record
+        """
+        with _checkpoint_lock, Session(engine) as session:
+            source = session.get(self.Source, file_id)
+            if source is None:
+                return
+            checkpoint = {} if reset else dict(source.note.get("checkpoint", {}))
+            checkpoint.update(values)
+            checkpoint["file_hash"] = source.path
+            source.note["checkpoint"] = checkpoint
+            session.add(source)
             session.commit()
 
-    def handle_chunks_vectorstore(self, chunks, file_id):
+    def update_chunks_docstore(self, chunks: list[Document]):
+        """Replace the stored chunks, e.g. to update their metadata"""
+        with _docstore_lock:
+            self.DS.delete([chunk.doc_id for chunk in chunks])
+            self.vector_indexing.add_to_docstore(chunks)
+
+    def delete_chunks(self, file_id: str, chunk_ids: list[str]) -> int:
+        """Delete some chunks of the file, return the number of deleted chunks"""
+        if not chunk_ids:
+            return 0
+
+        with Session(engine) as session:
+            vs_ids, ds_ids = pop_file_index_records(
+                session, self.Index, file_id, chunk_ids=chunk_ids
+            )
+            session.commit()
+
+        if vs_ids and self.VS:
+            self.VS.delete(vs_ids)
+        if ds_ids:
+            with _docstore_lock:
+                self.DS.delete(ds_ids)
+        return len(chunk_ids)
+
+    def embed_stored_chunks(
+        self,
+        file_id: str,
+        chunk_ids: list[str],
+        n_done: int = 0,
+        progress: Optional[Callable[[int], bool]] = None,
+        content_hashes: Optional[dict[str, str]] = None,
+    ):
+        """Embed chunks that are already in the doc store, e.g. in a background job
+
+        Args:
+            file_id: the id of the file of the chunks
+            chunk_ids: the ids of the chunks to embed
+            n_done: number of chunks already embedded, to resume a job
+            progress: called with the number of embedded chunks after each
+                batch, embedding stops when it returns False
+            content_hashes: the content hash of the chunks whose text is
+                embedded for the first time in this index
+        """
+        for start_idx in range(n_done, len(chunk_ids), self.chunk_batch_size):
+            batch_ids = chunk_ids[start_idx : start_idx + self.chunk_batch_size]
+
+            # skip the chunks removed since the job was queued
+            with Session(engine) as session:
+                stmt = select(self.Index.target_id).where(
+                    self.Index.source_id == file_id,
+                    self.Index.relation_type == "document",
+                    self.Index.target_id.in_(batch_ids),
+                )
+                stored_ids = set(session.execute(stmt).scalars())
+
+            chunks = self.DS.get([_id for _id in batch_ids if _id in stored_ids])
+            if chunks:
+                self.handle_chunks_vectorstore(
+                    chunks, file_id, self.embed_chunks(chunks), content_hashes
+                )
+            if progress is not None and not progress(start_idx + len(batch_ids)):
+                return
+
+    def handle_chunks_docstore(self, chunks, file_id):
         """Run chunks"""
-        # run embedding, add to both vector store and doc store
-        self.vector_indexing.add_to_vectorstore(chunks)
-        self.vector_indexing.write_chunk_to_file(chunks)
+        # record in the index first, so that chunks missing from the doc store
+        # after an interruption can be found and repaired
+        self.add_index_records(
+            [(file_id, chunk.doc_id, "document") for chunk in chunks]
+        )
 
+        with _docstore_lock:
+            self.vector_indexing.add_to_docstore(chunks)
+
+    def embed_chunks(self, chunks: list[Document]) -> Optional[EmbeddingMatrix]:
+        """Embed the chunks, if they are to be stored in a vector store"""
+        if not self.VS:
+            return None
+        return self.vector_indexing.embed(chunks)
+
+    def handle_chunks_vectorstore(
+        self,
+        chunks,
+        file_id,
+        embeddings: Optional[EmbeddingMatrix] = None,
+        content_hashes: Optional[dict[str, str]] = None,
+    ):
+        """Run chunks"""
+        # run embedding if not done yet, and add to vector store
+        if embeddings is None:
+            self.vector_indexing.add_to_vectorstore(chunks)
+        else:
+            self.vector_indexing.add_embeddings_to_vectorstore(chunks, embeddings)
         if self.VS:
-            # record in the index
+            # record in the index. The content hashes are only recorded once the
+            # vectors exist, since later duplicates will point to them
+            content_hashes = content_hashes or {}
+            self.add_index_records(
+                [(file_id, chunk.doc_id, "vector") for chunk in chunks]
+                + [
+                    (content_hashes[chunk.doc_id], chunk.doc_id, "content_hash")
+                    for chunk in chunks
+                    if chunk.doc_id in content_hashes
+                ]
+            )
+
+    def add_index_records(self, records: list[tuple[str, str, str]]):
+        """Insert the (source_id, target_id, relation_type) records at once"""
+        if not records:
+            return
+
+        with Session(engine) as session:
+            session.execute(
+                insert(self.Index),
+                [
+                    {
+                        "source_id": source_id,
+                        "target_id": target_id,
+                        "relation_type": relation_type,
+                    }
+                    for source_id, target_id, relation_type in records
+                ],
+            )
+            session.commit()
+
+    def deduplicate_chunks(self, chunks: list[Document]) -> DedupResult:
+        """Find the chunks whose text is already embedded in this index"""
+
+        def lookup(hashes: list[str]) -> dict[str, str]:
             with Session(engine) as session:
-                nodes = []
-                for chunk in chunks:
-                    nodes.append(
-                        self.Index(
-                            source_id=file_id,
-                            target_id=chunk.doc_id,
-                            relation_type="vector",
-                        )
-                    )
-                session.add_all(nodes)
-                session.commit()
+                stmt = select(self.Index.source_id, self.Index.target_id).where(
+                    self.Index.relation_type == "content_hash",
+                    self.Index.source_id.in_(hashes),
+                )
+                return {hash_: chunk_id for hash_, chunk_id in session.execute(stmt)}
+
+        return self.deduplicator(chunks, lookup=lookup)
+
+    def handle_duplicates(self, dedup: DedupResult):
+        """Record which chunk holds the vector of each duplicate chunk"""
+        self.add_index_records(
+            [
+                (vector_id, chunk_id, "duplicate")
+                for chunk_id, vector_id in dedup.duplicates.items()
+            ]
+        )
 
     def get_id_if_exists(self, file_path: str | Path) -> Optional[str]:
-        """Check if the file is already indexed
+        """Check if the file is already indexed, by name or by content
 
         Args:
             file_path: the path to the file
@@ -470,7 +1069,24 @@ class IndexPipeline(BaseComponent):
         Returns:
             the file id if the file is indexed, otherwise None
         """
-        file_name = file_path.name if isinstance(file_path, Path) else file_path
+        file_id = self.get_id_by_name(file_path)
+        if file_id is None and isinstance(file_path, Path):
+            file_id = self.get_id_by_content(file_path)
+        return file_id
+
+    def get_file_name(self, file_path: str | Path) -> str:
+        """Get the name of the file record: the URL, the path relative to
+        `root_dir` for the files under it, or the file name"""
+        if not isinstance(file_path, Path):
+            return file_path
+        root_dir = Path(self.root_dir).resolve() if self.root_dir else None
+        if root_dir is not None and file_path.resolve().is_relative_to(root_dir):
+            return file_path.resolve().relative_to(root_dir).as_posix()
+        return file_path.name
+
+    def get_id_by_name(self, file_path: str | Path) -> Optional[str]:
+        """Get the id of the indexed file with the same name, if any"""
+        file_name = self.get_file_name(file_path)
         if self.private:
             cond: tuple = (
                 self.Source.name == file_name,
@@ -487,6 +1103,32 @@ class IndexPipeline(BaseComponent):
 
         return None
 
+    def get_id_by_content(self, file_path: Path) -> Optional[str]:
+        """Get the id of an indexed file with the same content, if any"""
+        cond = [self.Source.path == hash_file(file_path)]
+        if self.private:
+            cond.append(self.Source.user == self.user_id)
+
+        with Session(engine) as session:
+            for source in session.execute(select(self.Source).where(*cond)).scalars():
+                # a file whose indexing was interrupted is not a usable copy
+                if source.note.get("checkpoint", {}).get("complete", True):
+                    return source.id
+
+        return None
+
+    def link_file(self, file_id: str, file_path: Path):
+        """Record the name of a file with the same content as an indexed file"""
+        with Session(engine) as session:
+            source = session.get(self.Source, file_id)
+            aliases = list(source.note.get("aliases", []))
+            file_name = self.get_file_name(file_path)
+            if file_name not in aliases and file_name != source.name:
+                aliases.append(file_name)
+            source.note["aliases"] = aliases
+            session.add(source)
+            session.commit()
+
     def store_url(self, url: str) -> str:
         """Store URL into the database and storage, return the file id
 
@@ -519,12 +1161,11 @@ class IndexPipeline(BaseComponent):
         Returns:
             the file id
         """
-        with file_path.open("rb") as fi:
-            file_hash = sha256(fi.read()).hexdigest()
-
-        shutil.copy(file_path, self.FSPath / file_hash)
+        file_hash = store_content_addressed(
+            file_path, self.FSPath, self.file_storage_mode
+        )
         source = self.Source(
-            name=file_path.name,
+            name=self.get_file_name(file_path),
             path=file_hash,
             size=file_path.stat().st_size,
             user=self.user_id,  # type: ignore
@@ -536,8 +1177,39 @@ class IndexPipeline(BaseComponent):
 
         return file_id
 
-    def finish(self, file_id: str, file_path: str | Path) -> str:
-        """Finish the indexing"""
+    def update_file(self, file_id: str, file_path: Path):
+        """Point the file record to the new version of the file
+
+        The chunks of the file are kept, to be reused by `handle_docs`, while the
+        other records of the file (e.g. its graph) are removed.
+        """
+        file_hash = store_content_addressed(
+            file_path, self.FSPath, self.file_storage_mode
+        )
+        with Session(engine) as session:
+            source = session.get(self.Source, file_id)
+            source.path = file_hash
+            source.size = file_path.stat().st_size
+            session.add(source)
+            session.execute(
+                delete(self.Index).where(
+                    self.Index.source_id == file_id,
+                    self.Index.relation_type.not_in(["document", "vector"]),
+                )
+            )
+            session.commit()
+
+    def finish(
+        self, file_id: str, file_path: str | Path, n_tokens: Optional[int] = None
+    ) -> str:
+        """Finish the indexing
+
+        Args:
+            file_id: the id of the file
+            file_path: the path to the file
+            n_tokens: the number of tokens of the file, counted from the stored
+                chunks if not given
+        """
         with Session(engine) as session:
             stmt = select(self.Source).where(self.Source.id == file_id)
             result = session.execute(stmt).first()
@@ -547,24 +1219,46 @@ class IndexPipeline(BaseComponent):
             item = result[0]
 
             # populate the number of tokens
-            doc_ids_stmt = select(self.Index.target_id).where(
-                self.Index.source_id == file_id,
-                self.Index.relation_type == "document",
-            )
-            doc_ids = [_[0] for _ in session.execute(doc_ids_stmt)]
-            token_func = self.get_token_func()
-            if doc_ids and token_func:
-                docs = self.DS.get(doc_ids)
-                item.note["tokens"] = sum([len(token_func(doc.text)) for doc in docs])
+            if n_tokens is None:
+                n_tokens = self.count_file_tokens(session, file_id)
+            if n_tokens is not None:
+                item.note["tokens"] = n_tokens
 
             # populate the note
             item.note["loader"] = self.get_from_path("loader").__class__.__name__
+            with _checkpoint_lock:
+                if "checkpoint" in item.note:
+                    item.note["checkpoint"] = {
+                        **item.note["checkpoint"],
+                        "complete": True,
+                    }
 
             session.add(item)
             session.commit()
 
         return file_id
 
+    def count_tokens(self, docs: list[Document]) -> Optional[list[int]]:
+        """Count the tokens of each document, None if there is no token function"""
+        token_func = self.get_token_func()
+        if not token_func:
+            return None
+        if token_func is _default_token_func:
+            return count_document_tokens(docs)
+        return [len(token_func(doc.text)) for doc in docs]
+
+    def count_file_tokens(self, session: Session, file_id: str) -> Optional[int]:
+        """Count the tokens of the chunks stored for the file"""
+        doc_ids_stmt = select(self.Index.target_id).where(
+            self.Index.source_id == file_id,
+            self.Index.relation_type == "document",
+        )
+        doc_ids = [_[0] for _ in session.execute(doc_ids_stmt)]
+        if not doc_ids:
+            return None
+        token_counts = self.count_tokens(self.DS.get(doc_ids))
+        return sum(token_counts) if token_counts is not None else None
+
     def get_token_func(self):
         """Get the token function for calculating the number of tokens"""
         return _default_token_func
@@ -575,24 +1269,59 @@ class IndexPipeline(BaseComponent):
         Args:
             file_id: the file id
         """
+        if self.index_id is not None:
+            indexing_jobs.cancel_file_jobs(self.index_id, file_id)
+
         with Session(engine) as session:
             session.execute(delete(self.Source).where(self.Source.id == file_id))
-            vs_ids, ds_ids = [], []
-            index = session.execute(
-                select(self.Index).where(self.Index.source_id == file_id)
-            ).all()
-            for each in index:
-                if each[0].relation_type == "vector":
-                    vs_ids.append(each[0].target_id)
-                elif each[0].relation_type == "document":
-                    ds_ids.append(each[0].target_id)
-                session.delete(each[0])
+            vs_ids, ds_ids = pop_file_index_records(session, self.Index, file_id)
             session.commit()
 
         if vs_ids and self.VS:
             self.VS.delete(vs_ids)
         if ds_ids:
-            self.DS.delete(ds_ids)
+            with _docstore_lock:
+                self.DS.delete(ds_ids)
+
+    def load_data(
+        self,
+        file_path: str | Path,
+        extra_info: dict,
+        parse_pool: Optional[Executor] = None,
+    ) -> Iterable[Document]:
+        """Parse the file into documents, in `parse_pool` if given
+
+        Loaders that cannot be pickled are run in the current thread. When they run
+        in the current thread, the loaders with `lazy_loading` (e.g. Unstructured)
+        return an iterator of the documents, yielded as the file is parsed.
+        Otherwise, the list of documents is returned.
+        """
+        loader = self.get_from_path("loader")
+        if parse_pool is None or not is_picklable_loader(loader):
+            if getattr(loader, "lazy_loading", False):
+                return self.loader.lazy_load_data(file_path, extra_info=extra_info)
+            return self.loader.load_data(file_path, extra_info=extra_info)
+
+        try:
+            return parse_pool.submit(load_file, loader, file_path, extra_info).result()
+        except BrokenProcessPool:
+            # a worker died, e.g. out of memory: start a new pool for the next files
+            get_parse_pool.cache_clear()
+            raise
+
+    def get_parse_cache(
+        self, file_path: str | Path
+    ) -> tuple[Optional[ParseCache], Optional[str]]:
+        """Get the parse cache, and the key of the parsed file in it"""
+        if not self.parse_cache_dir or not isinstance(file_path, Path):
+            return None, None
+
+        parse_cache = get_parse_cache(
+            str(self.parse_cache_dir),
+            getattr(settings, "KH_PARSE_CACHE_SIZE", 2 * 1024**3),
+        )
+        loader = self.get_from_path("loader")
+        return parse_cache, loader_cache_key(hash_file(file_path), loader)
 
     def run(
         self, file_path: str | Path, reindex: bool, **kwargs
@@ -606,15 +1335,50 @@ class IndexPipeline(BaseComponent):
         if isinstance(file_path, Path):
             file_path = file_path.resolve()
 
-        file_id = self.get_id_if_exists(file_path)
+        file_id = self.get_id_by_name(file_path)
+        previous: Optional[list[Document]] = None
+
+        if isinstance(file_path, Path) and file_id is None:
+            # the same content under another name is indexed only once
+            same_content_id = self.get_id_by_content(file_path)
+            if same_content_id is not None:
+                yield Document(
+                    f" => {file_path.name} has the same content as an indexed file, "
+                    "linking to it",
+                    channel="debug",
+                )
+                self.link_file(same_content_id, file_path)
+                return same_content_id, []
 
         if isinstance(file_path, Path):
-            if file_id is not None:
+            checkpoint = self.get_checkpoint(file_id) if file_id else None
+            if file_id is not None and self.index_id is not None:
+                indexing_jobs.cancel_file_jobs(self.index_id, file_id)
+
+            if checkpoint is not None and checkpoint["file_hash"] == hash_file(
+                file_path
+            ):
+                # continue from the chunks persisted before the interruption
+                assert file_id is not None
+                yield Document(
+                    f" => Resuming the interrupted indexing of {file_path.name}",
+                    channel="debug",
+                )
+                previous = self.get_file_chunks(file_id, repair=True)
+            elif file_id is not None:
                 if not reindex:
                     raise ValueError(
                         f"File {file_path.name} already indexed. Please rerun with "
                         "reindex=True to force reindexing."
                     )
+                elif self.incremental_reindex:
+                    # only re-embed the chunks that changed
+                    yield Document(
+                        f" => Updating the changed parts of {file_path.name}",
+                        channel="debug",
+                    )
+                    previous = self.get_file_chunks(file_id, repair=True)
+                    self.update_file(file_id, file_path)
                 else:
                     # remove the existing records
                     yield Document(
@@ -635,20 +1399,46 @@ class IndexPipeline(BaseComponent):
         # extract the file
         if isinstance(file_path, Path):
             extra_info = default_file_metadata_func(str(file_path))
-            file_name = file_path.name
+            file_name = self.get_file_name(file_path)
         else:
             extra_info = {"file_name": file_path}
             file_name = file_path
 
         extra_info["file_id"] = file_id
         extra_info["collection_name"] = self.collection_name
+        self.save_checkpoint(file_id, reset=True, complete=False)
 
-        yield Document(f" => Converting {file_name} to text", channel="debug")
-        docs = self.loader.load_data(file_path, extra_info=extra_info)
-        yield Document(f" => Converted {file_name} to text", channel="debug")
-        yield from self.handle_docs(docs, file_id, file_name)
+        parse_cache, cache_key = self.get_parse_cache(file_path)
+        docs = parse_cache.get(cache_key, extra_info) if parse_cache else None
+        loaded: Iterable[Document] = []
+        if docs is not None:
+            yield Document(
+                f" => Reusing the converted text of {file_name}", channel="debug"
+            )
+        else:
+            yield Document(f" => Converting {file_name} to text", channel="debug")
+            loaded = self.load_data(file_path, extra_info, kwargs.get("parse_pool"))
+            if isinstance(loaded, list):
+                docs = loaded
+                if parse_cache is not None:
+                    parse_cache.put(cache_key, docs, extra_info)
+                yield Document(f" => Converted {file_name} to text", channel="debug")
+
+        if docs is not None:
+            _, n_tokens = yield from self.handle_docs(
+                docs, file_id, file_name, previous=previous
+            )
+        else:
+            # index the documents while the file is parsed
+            docs = []
+            _, n_tokens = yield from self.handle_docs(
+                collect(loaded, docs), file_id, file_name, previous=previous
+            )
+            if parse_cache is not None:
+                parse_cache.put(cache_key, docs, extra_info)
+            yield Document(f" => Converted {file_name} to text", channel="debug")
 
-        self.finish(file_id, file_path)
+        self.finish(file_id, file_path, n_tokens=n_tokens)
 
         yield Document(f" => Finished indexing {file_name}", channel="debug")
         return file_id, docs
@@ -669,6 +1459,24 @@ class IndexDocumentPipeline(BaseFileIndexIndexing):
     reader_mode: str = Param("default", help="The reader mode")
     embedding: BaseEmbeddings
     run_embedding_in_thread: bool = False
+    incremental_reindex: bool = Param(
+        getattr(settings, "KH_INDEX_INCREMENTAL_REINDEX", True),
+        help=(
+            "When reindexing a file, only embed the chunks whose content changed "
+            "instead of rebuilding the whole file"
+        ),
+    )
+    file_workers: int = Param(
+        getattr(settings, "KH_INDEX_FILE_WORKERS", 1),
+        help="Number of files to index at the same time",
+    )
+    parse_workers: int = Param(
+        getattr(settings, "KH_INDEX_PARSE_WORKERS", 0),
+        help=(
+            "Number of processes to parse files when indexing several files at "
+            "once. Set 0 to parse in the indexing threads"
+        ),
+    )
 
     @Param.auto(depends_on="reader_mode")
     def readers(self):
@@ -761,6 +1569,10 @@ class IndexDocumentPipeline(BaseFileIndexIndexing):
                 backup_separators=["\n", ".", "\u200B"],
             ),
             run_embedding_in_thread=self.run_embedding_in_thread,
+            dedup_chunks=self.dedup_chunks or "off",
+            incremental_reindex=self.incremental_reindex,
+            index_id=self.index_id,
+            root_dir=self.root_dir,
             Source=self.Source,
             Index=self.Index,
             VS=self.VS,
@@ -787,51 +1599,112 @@ class IndexDocumentPipeline(BaseFileIndexIndexing):
         if not isinstance(file_paths, list):
             file_paths = [file_paths]
 
-        file_ids: list[str | None] = []
-        errors: list[str | None] = []
-        all_docs = []
+        file_paths = [
+            file_path if self.is_url(file_path) else Path(file_path)
+            for file_path in file_paths
+        ]
+        if self.file_workers > 1 and len(file_paths) > 1:
+            results = yield from self.stream_parallel(file_paths, reindex, **kwargs)
+        else:
+            results = []
+            for idx, file_path in enumerate(file_paths):
+                yield self.indexing_message(idx, file_paths)
+                result = yield from self.index_file(file_path, reindex, **kwargs)
+                results.append(result)
 
-        n_files = len(file_paths)
-        for idx, file_path in enumerate(file_paths):
-            if self.is_url(file_path):
-                file_name = file_path
-            else:
-                file_path = Path(file_path)
-                file_name = file_path.name
+        file_ids: list[str | None] = [result[0] for result in results]
+        errors: list[str | None] = [result[1] for result in results]
+        all_docs = [doc for result in results for doc in result[2]]
+
+        return file_ids, errors, all_docs
 
+    def indexing_message(self, idx: int, file_paths: list[str | Path]) -> Document:
+        file_path = file_paths[idx]
+        file_name = file_path.name if isinstance(file_path, Path) else file_path
+        return Document(
+            content=f"Indexing [{idx + 1}/{len(file_paths)}]: {file_name}",
+            channel="debug",
+        )
+
+    def index_file(
+        self, file_path: str | Path, reindex: bool, **kwargs
+    ) -> Generator[Document, None, FileIndexingResult]:
+        """Index one file, reporting a failure instead of raising it
+
+        Returns:
+            the file id, the error message and the parsed documents
+        """
+        file_name = file_path.name if isinstance(file_path, Path) else file_path
+        try:
+            pipeline = self.route(file_path)
+            file_id, docs = yield from pipeline.stream(
+                file_path, reindex=reindex, **kwargs
+            )
+        except Exception as e:
+            logger.exception(e)
             yield Document(
-                content=f"Indexing [{idx + 1}/{n_files}]: {file_name}",
-                channel="debug",
+                content={
+                    "file_path": file_path,
+                    "file_name": file_name,
+                    "status": "failed",
+                    "message": str(e),
+                },
+                channel="index",
             )
+            return None, str(e), []
+
+        yield Document(
+            content={
+                "file_path": file_path,
+                "file_name": file_name,
+                "status": "success",
+            },
+            channel="index",
+        )
+        return file_id, None, docs
 
+    def stream_parallel(
+        self, file_paths: list[str | Path], reindex: bool, **kwargs
+    ) -> Generator[Document, None, list[FileIndexingResult]]:
+        """Index several files at the same time
+
+        Each file is indexed in a thread of a pool of `file_workers` threads, and
+        parsed in the shared pool of `parse_workers` processes if set. The progress
+        of each file is buffered and streamed file by file, in the order of
+        `file_paths`.
+        """
+        done = object()
+        queues: list[Queue] = [Queue() for _ in file_paths]
+        results: list = [(None, "Indexing was cancelled", [])] * len(file_paths)
+
+        parse_pool = (
+            get_parse_pool(self.parse_workers) if self.parse_workers > 0 else None
+        )
+
+        def index_in_thread(idx: int):
             try:
-                pipeline = self.route(file_path)
-                file_id, docs = yield from pipeline.stream(
-                    file_path, reindex=reindex, **kwargs
-                )
-                all_docs.extend(docs)
-                file_ids.append(file_id)
-                errors.append(None)
-                yield Document(
-                    content={
-                        "file_path": file_path,
-                        "file_name": file_name,
-                        "status": "success",
-                    },
-                    channel="index",
+                results[idx] = yield_to_queue(
+                    self.index_file(
+                        file_paths[idx], reindex, parse_pool=parse_pool, **kwargs
+                    ),
+                    queues[idx],
                 )
             except Exception as e:
                 logger.exception(e)
-                file_ids.append(None)
-                errors.append(str(e))
-                yield Document(
-                    content={
-                        "file_path": file_path,
-                        "file_name": file_name,
-                        "status": "failed",
-                        "message": str(e),
-                    },
-                    channel="index",
-                )
+                results[idx] = (None, str(e), [])
+            finally:
+                queues[idx].put(done)
 
-        return file_ids, errors, all_docs
+        pool = ThreadPoolExecutor(max_workers=self.file_workers)
+        try:
+            for idx in range(len(file_paths)):
+                pool.submit(index_in_thread, idx)
+
+            for idx in range(len(file_paths)):
+                yield self.indexing_message(idx, file_paths)
+                while (message := queues[idx].get()) is not done:
+                    yield message
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+        return results
@@ -0,0 +1,259 @@
+"""Keep a file index in sync with a directory
+
+A manifest records the (size, modification time, hash, file id) of every file of
+the directory that was indexed, by path relative to the directory. Each sync only
+stats the files, hashes the ones whose size or modification time changed, indexes
+the new and modified files, and removes the deleted ones from the index. So
+keeping a large directory in sync costs a scan of the directory, not a reindex of
+all its files.
+"""
+
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Generator, Optional
+
+from .utils import hash_file
+
+logger = logging.getLogger(__name__)
+
+# index the files, yield progress messages and return the id of each file (None
+# if the file failed)
+IndexFilesFn = Callable[[list[str]], Generator[str, None, list[Optional[str]]]]
+# remove the file with the given id from the index
+DeleteFileFn = Callable[[str], None]
+
+
+def list_dir_files(folder_path: str | Path) -> list[str]:
+    """List the files of a directory, recursively
+
+    Files without an extension (e.g. LICENSE) are left out, since no loader can
+    be chosen for them.
+    """
+    paths = []
+    for root, _, file_names in os.walk(folder_path):
+        paths.extend(os.path.join(root, name) for name in file_names if "." in name)
+    return paths
+
+
+@dataclass
+class SyncPlan:
+    """Changes of a directory since the last sync
+
+    Attributes:
+        added: relative paths of the new files
+        modified: relative paths of the files whose content changed
+        deleted: relative paths of the files that no longer exist
+        n_unchanged: number of files that did not change
+    """
+
+    added: list[str] = field(default_factory=list)
+    modified: list[str] = field(default_factory=list)
+    deleted: list[str] = field(default_factory=list)
+    n_unchanged: int = 0
+
+    def __str__(self) -> str:
+        return (
+            f"{len(self.added)} new, {len(self.modified)} modified, "
+            f"{len(self.deleted)} deleted, {self.n_unchanged} unchanged files"
+        )
+
+
+class DirectorySync:
+    """Index the new and modified files of a directory, remove the deleted ones
+
+    Example:
+        ```python
+        dir_sync = DirectorySync("/data/share", "/app/manifests/share.json")
+        plan = yield from dir_sync.sync(index_files, delete_file)
+        ```
+
+    Args:
+        folder_path: the directory to sync, scanned recursively
+        manifest_path: the JSON file recording the state of the last sync
+        file_filter: select the files to index among the paths of the directory
+        workers: number of threads to stat and hash the files
+        batch_size: number of files indexed between two saves of the manifest
+    """
+
+    def __init__(
+        self,
+        folder_path: str | Path,
+        manifest_path: str | Path,
+        file_filter: Optional[Callable[[list[str]], list[str]]] = None,
+        workers: int = 8,
+        batch_size: int = 32,
+    ):
+        self.folder_path = Path(folder_path).resolve()
+        self.manifest_path = Path(manifest_path)
+        self.file_filter = file_filter
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._poller: Optional[threading.Thread] = None
+
+    def load_manifest(self) -> dict[str, dict]:
+        """Get the entry of each file indexed by the last sync, by relative path"""
+        if not self.manifest_path.exists():
+            return {}
+        with open(self.manifest_path, encoding="utf-8") as f:
+            return json.load(f)["files"]
+
+    def save_manifest(self, files: dict[str, dict]):
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"folder": str(self.folder_path), "files": files}, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def relative_path(self, path: str | Path) -> str:
+        """The path of a file of the directory, relative to the directory"""
+        return Path(path).relative_to(self.folder_path).as_posix()
+
+    def scan(self) -> dict[str, os.stat_result]:
+        """Stat the files of the directory in parallel, by relative path"""
+        paths = list_dir_files(self.folder_path)
+        if self.file_filter is not None:
+            paths = self.file_filter(paths)
+
+        def stat(path: str) -> Optional[os.stat_result]:
+            try:
+                return os.stat(path)
+            except OSError:  # deleted during the scan
+                return None
+
+        with ThreadPoolExecutor(self.workers) as pool:
+            stats = pool.map(stat, paths, chunksize=256)
+            return {
+                self.relative_path(path): st
+                for path, st in zip(paths, stats)
+                if st is not None
+            }
+
+    def plan(
+        self, manifest: dict[str, dict], stats: dict[str, os.stat_result]
+    ) -> tuple[SyncPlan, dict[str, str]]:
+        """Compare the directory with the manifest
+
+        Only the files whose size or modification time changed are hashed. Files
+        that were touched without changing their content are updated in the
+        manifest and not indexed again.
+
+        Returns:
+            the changes, and the hash of the new and modified files
+        """
+        plan = SyncPlan(deleted=[path for path in manifest if path not in stats])
+        to_hash = []
+        for path, st in stats.items():
+            entry = manifest.get(path)
+            if (
+                entry is not None
+                and entry["size"] == st.st_size
+                and entry["mtime_ns"] == st.st_mtime_ns
+            ):
+                plan.n_unchanged += 1
+            else:
+                to_hash.append(path)
+
+        def hash_(path: str) -> Optional[str]:
+            try:
+                return hash_file(self.folder_path / path)
+            except OSError:  # deleted since the scan
+                return None
+
+        with ThreadPoolExecutor(self.workers) as pool:
+            hashes = dict(zip(to_hash, pool.map(hash_, to_hash)))
+
+        for path in to_hash:
+            entry = manifest.get(path)
+            if hashes[path] is None:
+                del hashes[path]
+                if entry is not None:
+                    plan.deleted.append(path)
+            elif entry is None:
+                plan.added.append(path)
+            elif entry["hash"] != hashes[path]:
+                plan.modified.append(path)
+            else:
+                entry["size"] = stats[path].st_size
+                entry["mtime_ns"] = stats[path].st_mtime_ns
+                plan.n_unchanged += 1
+
+        return plan, hashes
+
+    def sync(
+        self, index_files: IndexFilesFn, delete_file: DeleteFileFn
+    ) -> Generator[str, None, SyncPlan]:
+        """Bring the index up to date with the directory
+
+        Files that fail to index are left out of the manifest, so they are tried
+        again at the next sync. A deleted file is removed from the index only if
+        no other file of the directory has the same file id (e.g. a renamed or
+        copied file).
+        """
+        with self._lock:
+            manifest = self.load_manifest()
+            stats = self.scan()
+            plan, hashes = self.plan(manifest, stats)
+            yield f"Scanned {self.folder_path}: {plan}"
+
+            to_index = plan.added + plan.modified
+            for start_idx in range(0, len(to_index), self.batch_size):
+                batch = to_index[start_idx : start_idx + self.batch_size]
+                file_ids = yield from index_files(
+                    [str(self.folder_path / path) for path in batch]
+                )
+                for path, file_id in zip(batch, file_ids):
+                    if file_id is None:
+                        continue
+                    manifest[path] = {
+                        "size": stats[path].st_size,
+                        "mtime_ns": stats[path].st_mtime_ns,
+                        "hash": hashes[path],
+                        "file_id": file_id,
+                    }
+                # keep the progress if the sync is interrupted
+                self.save_manifest(manifest)
+
+            deleted_ids = {manifest.pop(path)["file_id"] for path in plan.deleted}
+            deleted_ids -= {entry["file_id"] for entry in manifest.values()}
+            for file_id in deleted_ids:
+                try:
+                    delete_file(file_id)
+                except Exception as e:
+                    logger.exception(f"Failed to remove the file {file_id}")
+                    yield f"Failed to remove the file {file_id}: {e}"
+            if deleted_ids:
+                yield f"Removed {len(deleted_ids)} deleted files from the index"
+
+            self.save_manifest(manifest)
+        return plan
+
+    def start_polling(
+        self, interval: float, index_files: IndexFilesFn, delete_file: DeleteFileFn
+    ):
+        """Sync the directory every `interval` seconds, in a background thread"""
+        if self._poller is not None and self._poller.is_alive():
+            return
+
+        def poll():
+            while not self._stop.is_set():
+                try:
+                    for message in self.sync(index_files, delete_file):
+                        logger.info(message)
+                except Exception:
+                    logger.exception(f"Failed to sync {self.folder_path}")
+                self._stop.wait(interval)
+
+        self._stop.clear()
+        self._poller = threading.Thread(target=poll, name="directory-sync", daemon=True)
+        self._poller.start()
+
+    def stop_polling(self):
+        self._stop.set()
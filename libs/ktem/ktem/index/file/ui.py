@@ -5,6 +5,7 @@ import shutil
 import tempfile
 import zipfile
 from copy import deepcopy
+from hashlib import sha256
 from pathlib import Path
 from typing import Generator
 
@@ -21,7 +22,9 @@ from theflow.settings import settings as flowsettings
 
 from ...utils.commands import WEB_SEARCH_COMMAND
 from ...utils.rate_limit import check_rate_limit
-from .utils import download_arxiv_pdf, is_arxiv_url
+from .jobs import indexing_jobs
+from .sync import DirectorySync, list_dir_files
+from .utils import download_arxiv_pdf, is_arxiv_url, pop_file_index_records
 
 KH_DEMO_MODE = getattr(flowsettings, "KH_DEMO_MODE", False)
 KH_SSO_ENABLED = getattr(flowsettings, "KH_SSO_ENABLED", False)
@@ -132,6 +135,7 @@ class FileIndexPage(BasePage):
     def __init__(self, app, index):
         super().__init__(app)
         self._index = index
+        self._dir_syncs: dict[Path, DirectorySync] = {}
         self._supported_file_types_str = self._index.config.get(
             "supported_file_types", ""
         )
@@ -307,6 +311,18 @@ class FileIndexPage(BasePage):
                         )
                         gr.Markdown("(separated by new line)")
 
+                    with gr.Tab("Sync Folder"):
+                        self.sync_folder_path = gr.Textbox(
+                            label="Folder path on the server",
+                            lines=1,
+                        )
+                        self.sync_interval = gr.Number(
+                            value=0,
+                            minimum=0,
+                            label="Sync interval in seconds (0 to sync once)",
+                        )
+                        self.sync_button = gr.Button("Sync folder")
+
                     with gr.Accordion("Advanced indexing options", open=False):
                         with gr.Row():
                             self.reindex = gr.Checkbox(
@@ -445,6 +461,13 @@ class FileIndexPage(BasePage):
         )
 
     def delete_event(self, file_id):
+        file_name = self._delete_file(file_id)
+        gr.Info(f"File {file_name} has been deleted")
+
+        return None, self.selected_panel_false
+
+    def _delete_file(self, file_id) -> str:
+        """Remove the file and its chunks from the index, return its name"""
         file_name = ""
         with Session(engine) as session:
             source = session.execute(
@@ -456,27 +479,17 @@ class FileIndexPage(BasePage):
                 file_name = source[0].name
                 session.delete(source[0])
 
-            vs_ids, ds_ids = [], []
-            index = session.execute(
-                select(self._index._resources["Index"]).where(
-                    self._index._resources["Index"].source_id == file_id
-                )
-            ).all()
-            for each in index:
-                if each[0].relation_type == "vector":
-                    vs_ids.append(each[0].target_id)
-                elif each[0].relation_type == "document":
-                    ds_ids.append(each[0].target_id)
-                session.delete(each[0])
+            vs_ids, ds_ids = pop_file_index_records(
+                session, self._index._resources["Index"], file_id
+            )
             session.commit()
+        indexing_jobs.cancel_file_jobs(self._index.id, file_id)
 
         if vs_ids:
             self._index._vs.delete(vs_ids)
         self._index._docstore.delete(ds_ids)
 
-        gr.Info(f"File {file_name} has been deleted")
-
-        return None, self.selected_panel_false
+        return file_name
 
     def delete_no_event(self):
         return (
@@ -495,7 +508,8 @@ class FileIndexPage(BasePage):
             target_file_name = Path(source[0].name)
         zip_files = []
         for file_name in os.listdir(flowsettings.KH_CHUNKS_OUTPUT_DIR):
-            if target_file_name.stem in file_name:
+            # the chunks are exported under the full name of the file
+            if target_file_name.name in file_name:
                 zip_files.append(
                     os.path.join(flowsettings.KH_CHUNKS_OUTPUT_DIR, file_name)
                 )
@@ -897,6 +911,30 @@ class FileIndexPage(BasePage):
             outputs=[self.files],
         )
 
+        onSynced = self.sync_button.click(
+            fn=lambda: gr.update(visible=True),
+            outputs=[self.upload_progress_panel],
+        ).then(
+            fn=self.sync_files_from_dir,
+            inputs=[
+                self.sync_folder_path,
+                self._app.settings_state,
+                self._app.user_id,
+                self.sync_interval,
+            ],
+            outputs=[self.upload_result, self.upload_info],
+            concurrency_limit=20,
+        )
+
+        syncedEvent = onSynced.then(
+            fn=self.list_file,
+            inputs=[self._app.user_id, self.filter],
+            outputs=[self.file_list_state, self.file_list],
+            concurrency_limit=20,
+        )
+        for event in self._app.get_event(f"onFileIndex{self._index.id}Changed"):
+            syncedEvent = syncedEvent.then(**event)
+
         self.btn_close_upload_progress_panel.click(
             fn=lambda: (gr.update(visible=False), "", ""),
             outputs=[self.upload_progress_panel, self.upload_result, self.upload_info],
@@ -1294,8 +1332,14 @@ class FileIndexPage(BasePage):
             yield "", ""
             return
 
+        # get the files, the same way as the directory sync
+        files: list[str] = self._filter_dir_files(list_dir_files(folder_path))
+
+        yield from self.index_fn(files, [], reindex, settings, user_id)
+
+    def _filter_dir_files(self, files: list[str]) -> list[str]:
+        """Keep the files of a directory that should be indexed"""
         import fnmatch
-        from pathlib import Path
 
         include_patterns: list[str] = []
         exclude_patterns: list[str] = ["*.png", "*.gif", "*/.*"]
@@ -1320,8 +1364,6 @@ class FileIndexPage(BasePage):
                     Path.cwd() / exclude_patterns[idx].strip("/")
                 )
 
-        # get the files
-        files: list[str] = [str(p) for p in Path(folder_path).glob("**/*.*")]
         if include_patterns:
             for p in include_patterns:
                 files = fnmatch.filter(names=files, pat=p)
@@ -1330,7 +1372,69 @@ class FileIndexPage(BasePage):
             for p in exclude_patterns:
                 files = [f for f in files if not fnmatch.fnmatch(name=f, pat=p)]
 
-        yield from self.index_fn(files, [], reindex, settings, user_id)
+        return files
+
+    def get_dir_sync(self, folder_path) -> DirectorySync:
+        """Get the sync of a directory with the index, shared between calls"""
+        folder_path = Path(folder_path).resolve()
+        if folder_path not in self._dir_syncs:
+            folder_hash = sha256(str(folder_path).encode()).hexdigest()[:16]
+            manifest_path = (
+                Path(flowsettings.KH_APP_DATA_DIR)
+                / "sync_manifests"
+                / f"index_{self._index.id}_{folder_hash}.json"
+            )
+            self._dir_syncs[folder_path] = DirectorySync(
+                folder_path,
+                manifest_path,
+                file_filter=self._filter_dir_files,
+                workers=getattr(flowsettings, "KH_DIR_SYNC_WORKERS", 8),
+            )
+        return self._dir_syncs[folder_path]
+
+    def sync_files_from_dir(
+        self, folder_path, settings, user_id, interval: float = 0
+    ) -> Generator[tuple[str, str], None, None]:
+        """Index the new and modified files of the directory, and remove the
+        deleted ones from the index
+
+        Args:
+            folder_path: the directory to sync
+            settings: the settings of the app
+            user_id: the user that owns the indexed files
+            interval: if positive, keep syncing the directory every `interval`
+                seconds in the background
+        """
+        if not folder_path:
+            yield "", ""
+            return
+
+        dir_sync = self.get_dir_sync(folder_path)
+
+        def index_files(files: list[str]):
+            indexing_pipeline = self._index.get_indexing_pipeline(settings, user_id)
+            # name the files by their path in the directory, so that the files
+            # with the same name in different subdirectories are kept apart
+            indexing_pipeline.root_dir = str(dir_sync.folder_path)
+            output_stream = indexing_pipeline.stream(files, reindex=True)
+            try:
+                while True:
+                    response = next(output_stream)
+                    if response is not None and response.channel == "debug":
+                        yield response.text
+            except StopIteration as e:
+                file_ids, _, _ = e.value
+            return file_ids
+
+        debugs = []
+        for message in dir_sync.sync(index_files, self._delete_file):
+            debugs.append(message)
+            yield "", "\n".join(debugs)
+
+        if interval and interval > 0:
+            dir_sync.start_polling(interval, index_files, self._delete_file)
+            debugs.append(f"Syncing {folder_path} every {interval} seconds")
+            yield "", "\n".join(debugs)
 
     def format_size_human_readable(self, num: float | str, suffix="B"):
         try:
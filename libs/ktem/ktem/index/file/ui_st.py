@@ -19,6 +19,9 @@ from sqlalchemy.orm import Session
 from theflow.settings import settings as flowsettings
 from theflow.utils.modules import deserialize
 
+from .jobs import indexing_jobs
+from .utils import pop_file_index_records
+
 KH_DEMO_MODE = getattr(flowsettings, "KH_DEMO_MODE", False)
 KH_SSO_ENABLED = getattr(flowsettings, "KH_SSO_ENABLED", False)
 MAX_FILENAME_LENGTH = 20
@@ -539,19 +542,11 @@ class FileIndexPage(BasePage):
                 file_name = source[0].name
                 session.delete(source[0])
 
-            vs_ids, ds_ids = [], []
-            index = session.execute(
-                select(self._index._resources["Index"]).where(
-                    self._index._resources["Index"].source_id == file_id
-                )
-            ).all()
-            for each in index:
-                if each[0].relation_type == "vector":
-                    vs_ids.append(each[0].target_id)
-                elif each[0].relation_type == "document":
-                    ds_ids.append(each[0].target_id)
-                session.delete(each[0])
+            vs_ids, ds_ids = pop_file_index_records(
+                session, self._index._resources["Index"], file_id
+            )
             session.commit()
+        indexing_jobs.cancel_file_jobs(self._index.id, file_id)
 
         if vs_ids:
             self._index._vs.delete(vs_ids)
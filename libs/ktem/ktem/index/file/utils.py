@@ -1,6 +1,18 @@
 import os
+import shutil
+import tempfile
+from functools import lru_cache
+from hashlib import sha256
+from pathlib import Path
+from typing import Optional
 
 import requests
+from sqlalchemy import delete, select, update
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore
 
 # regex patterns for Arxiv URL
 ARXIV_URL_PATTERNS = [
@@ -10,6 +22,12 @@ ARXIV_URL_PATTERNS = [
 
 ILLEGAL_NAME_CHARS = ["\\", "/", ":", "*", "?", '"', "<", ">", "|"]
 
+# size of the blocks read when hashing a file
+HASH_BLOCK_SIZE = 1 << 20
+
+# ioctl to clone a file on copy-on-write filesystems (btrfs, xfs)
+FICLONE = 0x40049409
+
 
 def clean_name(name):
     for char in ILLEGAL_NAME_CHARS:
@@ -56,3 +74,188 @@ def download_arxiv_pdf(url, output_path):
             f.write(response.content)
 
     return output_file_path
+
+
+def pop_file_index_records(
+    session, Index, file_id: str, chunk_ids: Optional[list[str]] = None
+) -> tuple[list[str], list[str]]:
+    """Remove the index records of a file, and return the chunks that can be deleted
+
+    When chunk deduplication is enabled, a chunk of another file can share the
+    vector of a chunk of this file (a "duplicate" record). Such shared chunks are
+    kept in the vector store and the docstore until no file references them: the
+    vector record of the removed file becomes a "shared_vector" record.
+
+    Args:
+        session: the SQLAlchemy session, committed by the caller
+        Index: the SQLAlchemy Index table of the file index
+        file_id: the id of the file to remove
+        chunk_ids: if given, only remove the records of these chunks of the file
+
+    Returns:
+        the ids to delete from the vector store, and the ids to delete from
+        the docstore
+    """
+    cond = [Index.source_id == file_id]
+    if chunk_ids is not None:
+        cond.append(Index.target_id.in_(chunk_ids))
+    records = session.execute(
+        select(Index.target_id, Index.relation_type).where(*cond)
+    ).all()
+    doc_ids = [r.target_id for r in records if r.relation_type == "document"]
+    vector_ids = [r.target_id for r in records if r.relation_type == "vector"]
+
+    # the chunks of this file no longer reference the shared vectors
+    shared_ids: set[str] = set()
+    if doc_ids:
+        shared_ids = {
+            each[0]
+            for each in session.execute(
+                select(Index.source_id).where(
+                    Index.relation_type == "duplicate",
+                    Index.target_id.in_(doc_ids),
+                )
+            )
+        }
+        session.execute(
+            delete(Index).where(
+                Index.relation_type == "duplicate", Index.target_id.in_(doc_ids)
+            )
+        )
+
+    candidates = set(vector_ids) | shared_ids
+    still_referenced: set[str] = set()
+    if candidates:
+        still_referenced = {
+            each[0]
+            for each in session.execute(
+                select(Index.source_id).where(
+                    Index.relation_type == "duplicate",
+                    Index.source_id.in_(candidates),
+                )
+            )
+        }
+
+    # the vectors that are still referenced outlive this file, like the shared
+    # vectors of chunks removed earlier
+    if still_referenced:
+        session.execute(
+            update(Index)
+            .where(
+                *cond,
+                Index.relation_type == "vector",
+                Index.target_id.in_(still_referenced),
+            )
+            .values(relation_type="shared_vector")
+        )
+    session.execute(delete(Index).where(*cond, Index.relation_type != "shared_vector"))
+
+    # shared vectors of previously deleted files that are not referenced anymore
+    orphan_ids: list[str] = []
+    if shared_ids - still_referenced:
+        orphan_ids = [
+            each[0]
+            for each in session.execute(
+                select(Index.target_id).where(
+                    Index.relation_type == "shared_vector",
+                    Index.target_id.in_(shared_ids - still_referenced),
+                )
+            )
+        ]
+        session.execute(delete(Index).where(Index.target_id.in_(orphan_ids)))
+
+    released = (set(vector_ids) - still_referenced) | set(orphan_ids)
+    if released:
+        session.execute(
+            delete(Index).where(
+                Index.relation_type == "content_hash",
+                Index.target_id.in_(released),
+            )
+        )
+
+    vs_ids = [_id for _id in vector_ids if _id not in still_referenced] + orphan_ids
+    ds_ids = [_id for _id in doc_ids if _id not in still_referenced] + orphan_ids
+    return vs_ids, ds_ids
+
+
+@lru_cache(maxsize=1024)
+def _hash_file(path: str, size: int, mtime_ns: int) -> str:
+    digest = sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_file(file_path: str | Path) -> str:
+    """Compute the sha256 of a file, reading it block by block
+
+    The hash is cached as long as the size and the modification time of the file
+    stay the same, so that checking and storing a file only reads it once.
+    """
+    stat = os.stat(file_path)
+    return _hash_file(str(file_path), stat.st_size, stat.st_mtime_ns)
+
+
+def _clone_file(src: Path, dst: Path):
+    if fcntl is None:
+        raise OSError("File cloning is not supported on this platform")
+    with open(src, "rb") as fi, open(dst, "wb") as fo:
+        fcntl.ioctl(fo.fileno(), FICLONE, fi.fileno())
+
+
+def store_content_addressed(
+    file_path: str | Path, storage_path: str | Path, mode: str = "reflink"
+) -> str:
+    """Store the file in the storage under its sha256, and return the hash
+
+    The file is not stored again if a file with the same content already exists.
+    Otherwise it is, depending on `mode`:
+        - "reflink": cloned without copying the data if the filesystem supports
+            it, copied otherwise
+        - "hardlink": hard-linked if on the same filesystem, copied otherwise. The
+            file must not be modified in place afterwards
+        - "copy": copied
+
+    Args:
+        file_path: the file to store
+        storage_path: the directory of the file storage
+        mode: how to store the file
+
+    Returns:
+        the sha256 of the file, which is its name in the storage
+    """
+    file_path, storage_path = Path(file_path), Path(storage_path)
+    file_hash = hash_file(file_path)
+    target = storage_path / file_hash
+    if target.exists():
+        return file_hash
+
+    # write to a temporary file first, so that an interrupted copy is not taken
+    # for a stored file
+    fd, tmp_name = tempfile.mkstemp(dir=storage_path, prefix=f".{file_hash}.")
+    os.close(fd)
+    tmp_path = Path(tmp_name)
+    try:
+        stored = False
+        if mode == "hardlink":
+            tmp_path.unlink()
+            try:
+                os.link(file_path, tmp_path)
+                stored = True
+            except OSError:
+                pass
+        elif mode == "reflink":
+            try:
+                _clone_file(file_path, tmp_path)
+                stored = True
+            except OSError:
+                pass
+        if not stored:
+            shutil.copyfile(file_path, tmp_path)
+        os.replace(tmp_path, target)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+    return file_hash